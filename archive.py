@@ -0,0 +1,318 @@
+"""Append-only archive of settled games and their bets, one segment file per ISO week of kickoff.
+
+    python archive.py history <user_id>
+    python archive.py h2h Bears Packers
+    python archive.py team Bears
+    python archive.py compact                 # merge the blocks of finished weeks
+
+A segment is a sequence of blocks, each holding a batch of games and their
+bets as separately compressed columns:
+
+    b'BARC' | header length (4 bytes, big endian) | header JSON | column data
+
+The header gives each column's compressed length and lists the block's teams, so
+a query reads only the blocks and columns it needs and holds one block at a time.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from datetime import datetime, timezone
+
+ARCHIVE_DIR = 'archive'
+MAGIC = b'BARC'
+SEGMENT_EXT = '.barc'
+
+GAME_COLUMNS = ('game_id', 'guild_id', 'league', 'sport', 'home_team', 'away_team', 'home_odds', 'away_odds',
+                'home_score', 'away_score', 'winner', 'start_time', 'settled_at', 'bets', 'wagered')
+BET_COLUMNS = ('game_id', 'guild_id', 'user_id', 'side', 'team', 'opponent', 'league', 'amount', 'odds',
+               'payout', 'profit', 'won', 'items', 'start_time', 'settled_at')
+
+def week_of(epoch: int) -> str:
+    year, week, _ = datetime.fromtimestamp(epoch, timezone.utc).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def settlement_rows(game_id: str, game: dict, bets: list, payouts: list, settled_at: int):
+    """(game row, bet rows) for a settled game; payouts are settle_game's, one per bet in order"""
+    start = int(datetime.fromisoformat(game['start_time']).timestamp())
+    winner = game['result']
+    bet_rows = []
+    for bet, (_, payout, won, items) in zip(bets, payouts):
+        side = bet['team']
+        team, opponent = (game['home_team'], game['away_team']) if side == 'home' else (game['away_team'], game['home_team'])
+        # Stakes are taken when the bet is placed, so a lost bet's payout is 0 (or a refund / extra penalty)
+        bet_rows.append({
+            'game_id': game_id,
+            'guild_id': game.get('guild_id'),
+            'user_id': bet['user_id'],
+            'side': side,
+            'team': team,
+            'opponent': opponent,
+            'league': game.get('league'),
+            'amount': bet['amount'],
+            'odds': bet['odds'],
+            'payout': payout,
+            'profit': payout - bet['amount'],
+            'won': won,
+            'items': ','.join(bet.get('used_items', [])),
+            'start_time': start,
+            'settled_at': settled_at
+        })
+    game_row = {
+        'game_id': game_id,
+        'guild_id': game.get('guild_id'),
+        'league': game.get('league'),
+        'sport': game.get('sport'),
+        'home_team': game['home_team'],
+        'away_team': game['away_team'],
+        'home_odds': game['home_odds'],
+        'away_odds': game['away_odds'],
+        'home_score': game.get('home_score'),
+        'away_score': game.get('away_score'),
+        'winner': winner,
+        'start_time': start,
+        'settled_at': settled_at,
+        'bets': len(bets),
+        'wagered': sum(bet['amount'] for bet in bets)
+    }
+    return game_row, bet_rows
+
+def _encode(values: list) -> bytes:
+    return zlib.compress(json.dumps(values, separators=(',', ':')).encode(), 6)
+
+def _decode(blob: bytes) -> list:
+    return json.loads(zlib.decompress(blob))
+
+# Where each column sits in a block: game columns, then bet columns
+COLUMN_ORDER = [('games', name) for name in GAME_COLUMNS] + [('bets', name) for name in BET_COLUMNS]
+
+def _block(games: list, bets: list) -> bytes:
+    tables = {'games': games, 'bets': bets}
+    blobs = [_encode([row[name] for row in tables[table]]) for table, name in COLUMN_ORDER]
+    teams = sorted({g['home_team'] for g in games} | {g['away_team'] for g in games})
+    header = json.dumps({'games': len(games), 'bets': len(bets), 'teams': teams,
+                         'lengths': [len(blob) for blob in blobs]}, separators=(',', ':')).encode()
+    return MAGIC + struct.pack('>I', len(header)) + header + b''.join(blobs)
+
+class Block:
+    """One block of an open segment; columns are read and decompressed on demand"""
+    def __init__(self, f, header: dict, start: int):
+        self.f = f
+        self.header = header
+        self.start = start
+        self.size = sum(header['lengths'])
+        self.columns = {}  # (table, name) -> (offset, length)
+        offset = 0
+        for column, length in zip(COLUMN_ORDER, header['lengths']):
+            self.columns[column] = (offset, length)
+            offset += length
+
+    def rows(self, table: str) -> int:
+        return self.header[table]
+
+    def column(self, table: str, name: str) -> list:
+        offset, length = self.columns[table, name]
+        self.f.seek(self.start + offset)
+        return _decode(self.f.read(length))
+
+def _read_blocks(f):
+    """Yield the complete blocks of a segment; a torn block at the end (a crash mid-append) ends it"""
+    position = 0
+    while True:
+        f.seek(position)
+        prefix = f.read(8)
+        if len(prefix) < 8 or prefix[:4] != MAGIC:
+            return
+        header_len = struct.unpack('>I', prefix[4:])[0]
+        try:
+            header = json.loads(f.read(header_len))
+        except ValueError:
+            return
+        block = Block(f, header, position + 8 + header_len)
+        end = block.start + block.size
+        if f.seek(0, os.SEEK_END) < end:
+            return
+        yield block
+        position = end
+
+class Archive:
+    """Settled games and bets, appended by the writer thread and queried from any thread"""
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self._ends = {}  # segment path -> end of its last complete block, checked on first append
+        self._compacted = set()  # weeks known to be a single block, until something is appended to them
+
+    def _path(self, week: str) -> str:
+        return os.path.join(self.directory, week + SEGMENT_EXT)
+
+    def weeks(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(SEGMENT_EXT)] for name in names if name.endswith(SEGMENT_EXT))
+
+    def append(self, games: list, bets: list):
+        """Write games (and their bets) as one block per week of kickoff"""
+        os.makedirs(self.directory, exist_ok=True)
+        for week in sorted({week_of(g['start_time']) for g in games}):
+            week_games = [g for g in games if week_of(g['start_time']) == week]
+            ids = {g['game_id'] for g in week_games}
+            path = self._path(week)
+            with open(path, 'ab') as f:
+                end = self._ends.get(path)
+                if end is None:
+                    end = self._valid_end(path)
+                if f.tell() != end:
+                    f.truncate(end)  # drop a torn block, later blocks would be unreadable behind it
+                f.write(_block(week_games, [b for b in bets if b['game_id'] in ids]))
+                f.flush()
+                os.fsync(f.fileno())
+                self._ends[path] = f.tell()
+            self._compacted.discard(week)
+
+    def _valid_end(self, path: str) -> int:
+        try:
+            with open(path, 'rb') as f:
+                end = 0
+                for block in _read_blocks(f):
+                    end = block.start + block.size
+                return end
+        except FileNotFoundError:
+            return 0
+
+    def blocks(self, weeks=None):
+        """Every complete block, oldest week first"""
+        for week in self.weeks() if weeks is None else weeks:
+            try:
+                f = open(self._path(week), 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                yield from _read_blocks(f)
+
+    def scan(self, table: str, columns=None, where=None, weeks=None, teams=None):
+        """Rows of 'games' or 'bets' as dicts of the requested columns (default: all).
+
+        where maps column -> predicate; those columns are checked first, and a
+        block's other columns are only read if some row matched. teams skips
+        blocks that involve none of the given teams (compared case-insensitively).
+        """
+        names = columns or (GAME_COLUMNS if table == 'games' else BET_COLUMNS)
+        where = where or {}
+        wanted_teams = {team.lower() for team in teams} if teams else None
+        for block in self.blocks(weeks):
+            if not block.rows(table):
+                continue
+            if wanted_teams and not wanted_teams & {team.lower() for team in block.header['teams']}:
+                continue
+            matches = range(block.rows(table))
+            loaded = {}
+            for name, predicate in where.items():
+                values = loaded[name] = block.column(table, name)
+                matches = [i for i in matches if predicate(values[i])]
+                if not matches:
+                    break
+            if not matches:
+                continue
+            for name in names:
+                if name not in loaded:
+                    loaded[name] = block.column(table, name)
+            for i in matches:
+                yield {name: loaded[name][i] for name in names}
+
+    def user_history(self, user_id: str, limit=None) -> list:
+        """A user's settled bets, newest first"""
+        rows = sorted(self.scan('bets', where={'user_id': lambda uid: uid == user_id}),
+                      key=lambda row: row['settled_at'], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def head_to_head(self, team_a: str, team_b: str) -> dict:
+        """Every archived meeting of two teams and how many each won, keyed by the names as given"""
+        pair = {team_a.lower(), team_b.lower()}
+        if len(pair) < 2:
+            return {'games': [], 'wins': {team_a: 0, team_b: 0}}
+        games = list(self.scan(
+            'games',
+            columns=('home_team', 'away_team', 'home_score', 'away_score', 'winner', 'start_time', 'league'),
+            where={'home_team': lambda team: team.lower() in pair, 'away_team': lambda team: team.lower() in pair},
+            teams=pair
+        ))
+        games = [g for g in games if g['home_team'].lower() != g['away_team'].lower()]
+        wins = {team_a: 0, team_b: 0}
+        for game in games:
+            winner = game['home_team'] if game['winner'] == 'home' else game['away_team']
+            wins[team_a if winner.lower() == team_a.lower() else team_b] += 1
+        return {'games': sorted(games, key=lambda g: g['start_time']), 'wins': wins}
+
+    def team_stats(self, team: str) -> dict:
+        """A team's archived record, and how its backers did"""
+        name = team.lower()
+        stats = {'games': 0, 'wins': 0, 'losses': 0, 'bets': 0, 'wagered': 0, 'bettor_profit': 0}
+        for game in self.scan('games', columns=('home_team', 'away_team', 'winner'), teams=[team]):
+            sides = [side for side in ('home', 'away') if game[f'{side}_team'].lower() == name]
+            if not sides:
+                continue
+            stats['games'] += 1
+            stats['wins' if game['winner'] in sides else 'losses'] += 1
+        for bet in self.scan('bets', columns=('amount', 'profit'), where={'team': lambda t: t.lower() == name}, teams=[team]):
+            stats['bets'] += 1
+            stats['wagered'] += bet['amount']
+            stats['bettor_profit'] += bet['profit']
+        return stats
+
+    def compact(self, week: str) -> bool:
+        """Rewrite a week's blocks as one, which compresses far better; False if there was nothing to merge"""
+        if week in self._compacted:
+            return False
+        # Headers only, so a week that is already one block costs no decompression
+        if sum(1 for _ in self.blocks([week])) < 2:
+            self._compacted.add(week)
+            return False
+        games, bets = [], []
+        for block in self.blocks([week]):
+            for table, rows, names in (('games', games, GAME_COLUMNS), ('bets', bets, BET_COLUMNS)):
+                columns = [block.column(table, name) for name in names]
+                rows.extend(dict(zip(names, values)) for values in zip(*columns))
+        path = self._path(week)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_block(games, bets))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._ends.pop(path, None)
+        self._compacted.add(week)
+        return True
+
+    def compact_finished(self, now: int) -> list:
+        """Compact every week before the one containing `now`; returns the weeks rewritten"""
+        current = week_of(now)
+        return [week for week in self.weeks() if week < current and self.compact(week)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('history').add_argument('user_id')
+    h2h = commands.add_parser('h2h')
+    h2h.add_argument('team_a')
+    h2h.add_argument('team_b')
+    commands.add_parser('team').add_argument('team')
+    commands.add_parser('compact')
+    args = parser.parse_args()
+
+    archive = Archive(args.dir)
+    if args.command == 'history':
+        for row in archive.user_history(args.user_id):
+            print(json.dumps(row))
+    elif args.command == 'h2h':
+        print(json.dumps(archive.head_to_head(args.team_a, args.team_b), indent=2))
+    elif args.command == 'team':
+        print(json.dumps(archive.team_stats(args.team), indent=2))
+    else:
+        import time
+        print(f"Compacted: {', '.join(archive.compact_finished(int(time.time()))) or 'nothing'}")
+    sys.stdout.flush()
@@ -0,0 +1,385 @@
+"""Load test: thousands of simulated bettors driving the real command handlers.
+
+    python benchmarks/bench_load.py                                # 2000 users, 40 games
+    python benchmarks/bench_load.py --users 10000 --games 120 --concurrency 1000
+    python benchmarks/bench_load.py --storage sqlite --api-latency 30
+
+bot.py is imported but never connects: interactions, contexts, guilds and
+channels are stand-ins that just count what would have been sent (after
+--api-latency ms, to mimic Discord round trips). Data is written to a temporary
+directory. The same --seed gives the same users, games, bets and results, and
+the balance digest at the end changes only if settlement behaves differently,
+so runs can be compared across commits.
+
+Phases, each run as concurrently as --concurrency allows:
+    bet      BetModal.on_submit, /bet and !bet, every user betting on a few games
+    read     /mybets and /leaderboard
+    settle   finalize_game for every game
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+USER_BASE = 200000000000000000
+GUILD_BASE = 900000000000000000
+CHANNEL_BASE = 800000000000000000
+TEAMS = ['Bears', 'Packers', 'Lions', 'Vikings', 'Cowboys', 'Eagles', 'Giants', 'Commanders',
+         'Chiefs', 'Raiders', 'Broncos', 'Chargers', 'Bills', 'Dolphins', 'Jets', 'Patriots']
+ODDS = [-300.0, -180.0, -110.0, 110.0, 155.0, 250.0]
+# How bets arrive: game card buttons, slash command, prefix command
+ENTRY_WEIGHTS = {'modal': 5, 'slash': 3, 'prefix': 2}
+
+# ---- Discord stand-ins ----
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f"bettor{user_id - USER_BASE}"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild{guild_id - GUILD_BASE}"
+
+    def get_member(self, user_id):
+        return FakeUser(user_id)
+
+class Api:
+    """Counts calls that would have gone to Discord, each taking `latency` seconds"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+class FakeMessage:
+    def __init__(self, api, message_id, channel):
+        self.api = api
+        self.id = message_id
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await self.api.call()
+        return self
+
+class FakeChannel:
+    def __init__(self, api, channel_id, guild):
+        self.api = api
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await self.api.call()
+        self.sent += 1
+        return FakeMessage(self.api, self.id * 1000 + self.sent, self)
+
+    async def fetch_message(self, message_id):
+        await self.api.call()
+        return FakeMessage(self.api, message_id, self)
+
+class FakeResponse:
+    def __init__(self, api):
+        self.api = api
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self.api.call()
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self.api.call()
+
+class FakeFollowup:
+    def __init__(self, api):
+        self.api = api
+
+    async def send(self, content=None, **kwargs):
+        await self.api.call()
+
+class FakeInteraction:
+    def __init__(self, api, user, guild, channel):
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.message = None
+        self.response = FakeResponse(api)
+        self.followup = FakeFollowup(api)
+
+class FakeContext:
+    def __init__(self, api, user, guild, channel):
+        self.api = api
+        self.author = user
+        self.guild = guild
+        self.channel = channel
+
+    async def send(self, content=None, **kwargs):
+        await self.api.call()
+
+# ---- Synthetic population ----
+
+def population(users, games, guilds, bets_per_user, skew, seed):
+    """Games spread over guilds and bets per user, with popular games drawing more action (Zipf `skew`)"""
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) + timedelta(days=1)
+    game_specs = []
+    for i in range(games):
+        home, away = rng.sample(TEAMS, 2)
+        home_odds = rng.choice(ODDS)
+        game_specs.append({
+            'base_id': f"{home}_{away}_{i}",
+            'guild': i % guilds,
+            'home_team': home,
+            'away_team': away,
+            'home_odds': home_odds,
+            'away_odds': -home_odds,
+            'start_time': (start + timedelta(minutes=15 * i)).isoformat(),
+            'winner': rng.choice(['home', 'away'])
+        })
+    weights = [1 / (rank + 1) ** skew for rank in range(games)]
+    bets = []
+    for i in range(users):
+        user_id = USER_BASE + i
+        # Weighted sample without replacement
+        picks = sorted(range(games), key=lambda g: rng.random() ** (1 / weights[g]), reverse=True)
+        for g in picks[:min(bets_per_user, games)]:
+            amount = min(10 + int(rng.paretovariate(1.2) * 15), 1500)
+            entry = rng.choices(list(ENTRY_WEIGHTS), weights=list(ENTRY_WEIGHTS.values()))[0]
+            bets.append((entry, user_id, g, rng.choice(['home', 'away']), amount))
+    rng.shuffle(bets)
+    return game_specs, bets
+
+# ---- Measurement ----
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+class LoopLag:
+    """How late the event loop wakes a task that asked to sleep `interval`"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - before - self.interval)
+
+    def stop(self):
+        self._task.cancel()
+
+class Phase:
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = 0.0
+
+    async def call(self, handler, make):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                await make()
+            except Exception:
+                if not self.errors[handler]:
+                    traceback.print_exc()
+                self.errors[handler] += 1
+            self.timings[handler].append(time.perf_counter() - started)
+
+    async def run(self, calls):
+        started = time.perf_counter()
+        await asyncio.gather(*(self.call(handler, make) for handler, make in calls))
+        self.elapsed = time.perf_counter() - started
+
+    def report(self):
+        total = sum(len(t) for t in self.timings.values())
+        print(f"\n{self.name}: {total:,} calls in {self.elapsed:.2f}s ({total / self.elapsed:,.0f}/s)")
+        print(f"  {'handler':<26}{'calls':>8}{'/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+        for handler, timings in self.timings.items():
+            timings.sort()
+            row = [percentile(timings, q) * 1000 for q in (0.5, 0.95, 0.99)] + [timings[-1] * 1000]
+            print(f"  {handler:<26}{len(timings):>8,}{len(timings) / self.elapsed:>9,.0f}"
+                  + "".join(f"{ms:>9.2f}" for ms in row) + f"{self.errors[handler]:>8}")
+
+# ---- Run ----
+
+async def main(args):
+    import bot as app  # after chdir and environment setup, so it loads the empty temp store
+
+    api = Api(args.api_latency / 1000)
+    guilds = [FakeGuild(GUILD_BASE + i) for i in range(args.guilds)]
+    channels = {CHANNEL_BASE + i: FakeChannel(api, CHANNEL_BASE + i, guild) for i, guild in enumerate(guilds)}
+    app.bot.get_channel = channels.get
+    app.outbox.per = 0  # the stand-in channels have no rate limit to stay under
+
+    # Time every storage write (on the writer thread) and every flush (as awaited on the loop)
+    writes = []
+    write = app.betting._write
+
+    def timed_write(changes, snapshot):
+        started = time.perf_counter()
+        write(changes, snapshot)
+        writes.append(time.perf_counter() - started)
+
+    app.betting._write = timed_write
+    flushes = []
+    flush = app.betting.flush
+
+    async def timed_flush():
+        started = time.perf_counter()
+        await flush()
+        flushes.append(time.perf_counter() - started)
+
+    app.betting.flush = timed_flush
+
+    await app.betting.ready()
+    game_specs, bets = population(args.users, args.games, args.guilds, args.bets_per_user, args.skew, args.seed)
+    game_ids = []
+    with app.betting.transaction():
+        for i in range(args.users):
+            app.betting.get_balance(str(USER_BASE + i))
+        for spec in game_specs:
+            guild = guilds[spec['guild']]
+            game_id = app.scoped_game_id(guild.id, spec['base_id'])
+            app.betting.games[game_id] = {
+                'home_team': spec['home_team'],
+                'away_team': spec['away_team'],
+                'home_odds': spec['home_odds'],
+                'away_odds': spec['away_odds'],
+                'start_time': spec['start_time'],
+                'locked': False,
+                'result': None,
+                'channel_id': CHANNEL_BASE + spec['guild'],
+                'sport': 'NFL',
+                'guild_id': str(guild.id),
+                'message_id': CHANNEL_BASE + spec['guild'] + len(game_ids)
+            }
+            app.betting.bets[game_id] = []
+            app.betting.mark_game(game_id)
+            game_ids.append(game_id)
+    await app.betting.flush()
+    print(f"{args.users:,} users, {args.games} games over {args.guilds} guild(s), {len(bets):,} bets, "
+          f"storage={args.storage}, concurrency={args.concurrency}, seed={args.seed}")
+
+    def context(user_id, g):
+        guild = guilds[game_specs[g]['guild']]
+        return FakeUser(user_id), guild, channels[CHANNEL_BASE + game_specs[g]['guild']]
+
+    def place(entry, user_id, g, team, amount):
+        user, guild, channel = context(user_id, g)
+        game_id = game_ids[g]
+        shown_id = app.display_game_id(game_id)
+        if entry == 'modal':
+            async def make():
+                modal = app.BetModal(game_id, team, app.betting.games[game_id])
+                modal.amount._value = str(amount)
+                await modal.on_submit(FakeInteraction(api, user, guild, channel))
+            return 'BetModal.on_submit', make
+        if entry == 'slash':
+            return 'slash_bet', lambda: app.slash_bet.callback(FakeInteraction(api, user, guild, channel), shown_id, team, amount)
+        return 'bet (prefix)', lambda: app.bet.callback(FakeContext(api, user, guild, channel), shown_id, team, amount)
+
+    lag = LoopLag()
+    lag.start()
+    phases = []
+
+    phase = Phase('bet', args.concurrency)
+    await phase.run([place(*b) for b in bets])
+    phases.append(phase)
+    placed = sum(len(app.betting.bets[game_id]) for game_id in game_ids)
+
+    rng = random.Random(args.seed + 1)
+    reads = []
+    for _ in range(args.reads):
+        user, guild, channel = context(USER_BASE + rng.randrange(args.users), rng.randrange(args.games))
+        if rng.random() < 0.5:
+            reads.append(('slash_mybets', lambda i=FakeInteraction(api, user, guild, channel): app.slash_mybets.callback(i)))
+        else:
+            page = 1 if rng.random() < 0.7 else rng.randint(2, max(2, args.users // 10))
+            reads.append(('slash_leaderboard', lambda i=FakeInteraction(api, user, guild, channel), p=page: app.slash_leaderboard.callback(i, p)))
+    phase = Phase('read', args.concurrency)
+    await phase.run(reads)
+    phases.append(phase)
+
+    phase = Phase('settle', args.concurrency)
+    await phase.run([('finalize_game', lambda gid=gid, spec=spec: app.finalize_game(gid, spec['winner']))
+                     for gid, spec in zip(game_ids, game_specs)])
+    phases.append(phase)
+
+    await app.outbox.drain(timeout=60)
+    lag.stop()
+    await app.betting.flush()
+    app.betting.storage.close()
+
+    for phase in phases:
+        phase.report()
+
+    samples = sorted(lag.samples)
+    print(f"\nevent loop lag: p50 {percentile(samples, 0.5) * 1000:.2f} ms, p95 {percentile(samples, 0.95) * 1000:.2f} ms, "
+          f"p99 {percentile(samples, 0.99) * 1000:.2f} ms, max {samples[-1] * 1000 if samples else 0:.2f} ms")
+    writes.sort()
+    flushes.sort()
+    print(f"persistence: {len(writes)} writes, {sum(writes) * 1000:.1f} ms total, p50 {percentile(writes, 0.5) * 1000:.2f} ms, "
+          f"max {writes[-1] * 1000 if writes else 0:.2f} ms; {len(flushes)} awaited flushes, "
+          f"p95 {percentile(flushes, 0.95) * 1000:.2f} ms, max {flushes[-1] * 1000 if flushes else 0:.2f} ms")
+    outbox = app.outbox.stats()
+    print(f"discord calls: {api.calls:,} (outbox sent {outbox['sent']}, failed {outbox['failed']}, peak queued {outbox['peak_queued']})")
+    balances = sorted((uid, u['balance']) for uid, u in app.betting.users.items())
+    digest = hashlib.sha256(repr(balances).encode()).hexdigest()[:16]
+    print(f"bets placed: {placed:,} of {len(bets):,}; games left: {len(app.betting.games)}; balance digest: {digest}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=40)
+    parser.add_argument('--guilds', type=int, default=4)
+    parser.add_argument('--bets-per-user', type=int, default=3)
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of game popularity (0 = uniform)')
+    parser.add_argument('--reads', type=int, default=4000, help='/mybets and /leaderboard calls')
+    parser.add_argument('--concurrency', type=int, default=500, help='handlers in flight at once')
+    parser.add_argument('--api-latency', type=float, default=0, help='ms per stand-in Discord call')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--numpy', action='store_true', help='use the NumPy settlement path')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    args.guilds = max(1, min(args.guilds, args.games))
+
+    # Settings must be in place before bot.py reads them at import
+    os.environ.setdefault('DISCORD_TOKEN', 'load-test')
+    os.environ['BETTING_STORAGE'] = args.storage
+    os.environ['SETTLEMENT_NUMPY'] = '1' if args.numpy else '0'
+    os.environ['INGEST_ADDR'] = ''
+    with tempfile.TemporaryDirectory(prefix='bench-load-') as workdir:
+        os.chdir(workdir)
+        asyncio.run(main(args))
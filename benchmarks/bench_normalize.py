@@ -0,0 +1,100 @@
+"""Parse cost per event of espn.parse_scoreboard over recorded scoreboard payloads.
+
+    python benchmarks/bench_normalize.py --record   # save the current NFL/CFB scoreboards
+    python benchmarks/bench_normalize.py            # benchmark everything in benchmarks/payloads/
+
+Payload files are named <league>-week<n>[-<label>].json. The committed
+*-fixture.json boards follow ESPN's full scoreboard layout (team, venue,
+broadcast and odds blocks, some lines with only a spread) but are stand-ins,
+not recordings; add real ones with --record. Without any payloads a minimal
+synthetic slate is generated so the script still runs.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import espn
+
+PAYLOAD_DIR = Path(__file__).resolve().parent / 'payloads'
+
+async def record():
+    client = espn.ESPNClient()
+    try:
+        boards = await client.scoreboards(['nfl', 'college-football'])
+    finally:
+        await client.close()
+    PAYLOAD_DIR.mkdir(exist_ok=True)
+    for league, data in boards.items():
+        if data is None:
+            print(f"{league}: fetch failed")
+            continue
+        label = data.get('week', {}).get('number', 'current')
+        path = PAYLOAD_DIR / f"{league}-week{label}.json"
+        path.write_text(json.dumps(data))
+        print(f"{league}: {len(data.get('events', []))} events -> {path.name}")
+
+def synthetic_payload(events=300, seed=7):
+    rng = random.Random(seed)
+    kickoffs = [f"2026-10-{d:02d}T{h:02d}:00Z" for d in (17, 18) for h in (16, 17, 19, 20, 23)]
+    payload = {'events': []}
+    for i in range(events):
+        odds = {'spread': rng.choice([-10.5, -3.5, -1, 2.5, 7.5])}
+        if rng.random() < 0.7:
+            ml = rng.randint(110, 400)
+            odds['homeTeamOdds'] = {'moneyLine': -ml}
+            odds['awayTeamOdds'] = {'moneyLine': ml - 20}
+        payload['events'].append({
+            'id': str(401000000 + i),
+            'date': rng.choice(kickoffs),
+            'status': {'type': {'state': rng.choice(['pre', 'in', 'post']), 'completed': False}},
+            'competitions': [{
+                'competitors': [
+                    {'homeAway': 'home', 'score': str(rng.randint(0, 45)), 'team': {'abbreviation': f"H{i}"}},
+                    {'homeAway': 'away', 'score': str(rng.randint(0, 45)), 'team': {'abbreviation': f"A{i}"}},
+                ],
+                'odds': [odds]
+            }]
+        })
+    return payload
+
+def load_payloads():
+    payloads = []
+    for path in sorted(PAYLOAD_DIR.glob('*.json')):
+        league = path.stem.split('-week')[0]
+        payloads.append((path.name, league, json.loads(path.read_text())))
+    if not payloads:
+        print("No recorded payloads in benchmarks/payloads/, using a synthetic 300-event slate\n")
+        payloads.append(('synthetic', 'college-football', synthetic_payload()))
+    return payloads
+
+def bench(payloads, repeat):
+    print(f"{'payload':<40}{'events':>8}{'cold us/event':>16}{'warm us/event':>16}")
+    for name, league, data in payloads:
+        events = len(data.get('events', [])) or 1
+
+        def cold():
+            espn._parse_time.cache_clear()
+            espn.parse_scoreboard(data, league)
+
+        def warm():
+            espn.parse_scoreboard(data, league)
+
+        cold_best = min(timeit.repeat(cold, number=1, repeat=repeat))
+        warm_best = min(timeit.repeat(warm, number=1, repeat=repeat))
+        print(f"{name:<40}{events:>8}{cold_best / events * 1e6:>16.2f}{warm_best / events * 1e6:>16.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', action='store_true', help='fetch and save the current scoreboards')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    if args.record:
+        asyncio.run(record())
+    else:
+        bench(load_payloads(), args.repeat)
@@ -0,0 +1,69 @@
+"""Scalar vs NumPy settlement for one large game.
+
+    python benchmarks/bench_settlement.py                  # 1k, 10k and 100k bets
+    python benchmarks/bench_settlement.py --sizes 5000 50000
+
+Each size is checked for an exact match between the two paths before it is timed.
+"""
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import settlement
+
+ITEM_CHOICES = [[], [], [], ['2x_multiplier'], ['insurance']]
+
+def synthetic_game(bets, seed=7):
+    """One bet per user, a mix of sides, odds and items, some users nearly broke"""
+    rng = random.Random(seed)
+    game_bets = []
+    balances = {}
+    for i in range(bets):
+        user_id = str(100000000000000000 + i)
+        amount = rng.randint(10, 500)
+        odds = rng.choice([-300.0, -180.0, -110.0, 110.0, 155.0, 250.0])
+        if odds > 0:
+            potential_win = amount + amount * (odds / 100)
+        else:
+            potential_win = amount + amount * (100 / abs(odds))
+        game_bets.append({
+            'user_id': user_id,
+            'team': rng.choice(['home', 'away']),
+            'amount': amount,
+            'odds': odds,
+            'potential_win': potential_win,
+            'used_items': list(rng.choice(ITEM_CHOICES))
+        })
+        balances[user_id] = rng.choice([0, rng.randint(0, 100), rng.randint(0, 5000)])
+    return game_bets, balances
+
+def same(a, b):
+    return a.payouts == b.payouts and a.deltas == b.deltas and a.winners == b.winners and a.losers == b.losers
+
+def bench(sizes, repeat):
+    print(f"{'bets':>8}{'scalar ms':>12}{'numpy ms':>12}{'speedup':>10}")
+    for size in sizes:
+        bets, balances = synthetic_game(size)
+        scalar = settlement.settle_bets(bets, 'home', balances)
+        vectorized = settlement.settle_bets_vectorized(bets, 'home', balances)
+        if not same(scalar, vectorized):
+            sys.exit(f"{size} bets: vectorized settlement does not match the scalar path")
+
+        scalar_best = min(timeit.repeat(lambda: settlement.settle_bets(bets, 'home', balances),
+                                        number=1, repeat=repeat))
+        numpy_best = min(timeit.repeat(lambda: settlement.settle_bets_vectorized(bets, 'home', balances),
+                                       number=1, repeat=repeat))
+        print(f"{size:>8}{scalar_best * 1e3:>12.2f}{numpy_best * 1e3:>12.2f}{scalar_best / numpy_best:>9.2f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if settlement.np is None:
+        sys.exit("NumPy is not installed")
+    bench(args.sizes, args.repeat)
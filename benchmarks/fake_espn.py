@@ -0,0 +1,86 @@
+"""Local stand-in for the ESPN scoreboard API, for running ingest.py (or the bot) offline.
+
+    python benchmarks/fake_espn.py --port 8081
+    python ingest.py --espn-url http://127.0.0.1:8081/{league}
+
+Serves recorded payloads from benchmarks/payloads/ (or the synthetic slate from
+bench_normalize.py) with ETags. Every --tick seconds a few games score, so the
+worker sees changed boards and 304s just like against the real thing.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_normalize import PAYLOAD_DIR, synthetic_payload
+
+def load_boards():
+    boards = {}
+    for path in sorted(PAYLOAD_DIR.glob('*.json')):
+        boards.setdefault(path.stem.split('-week')[0], json.loads(path.read_text()))
+    boards.setdefault('nfl', synthetic_payload(events=16, seed=1))
+    boards.setdefault('college-football', synthetic_payload(events=60, seed=2))
+    return boards
+
+class FakeESPN:
+    def __init__(self, boards, tick):
+        self.boards = boards
+        self.tick = tick
+        self.rng = random.Random(3)
+        self.bodies = {}
+        self.requests = 0
+        for league in boards:
+            self._encode(league)
+
+    def _encode(self, league):
+        body = json.dumps(self.boards[league]).encode()
+        self.bodies[league] = (body, '"' + hashlib.md5(body).hexdigest() + '"')
+
+    async def scoreboard(self, request):
+        self.requests += 1
+        league = request.match_info['league']
+        if league not in self.bodies:
+            return web.Response(status=404)
+        body, etag = self.bodies[league]
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    async def score_some(self, app):
+        while True:
+            await asyncio.sleep(self.tick)
+            for league, board in self.boards.items():
+                for event in self.rng.sample(board['events'], min(3, len(board['events']))):
+                    competitor = self.rng.choice(event['competitions'][0]['competitors'])
+                    competitor['score'] = str(int(competitor.get('score') or 0) + self.rng.choice([3, 7]))
+                    event['status']['type']['state'] = 'in'
+                self._encode(league)
+
+async def start_scoring(app):
+    app['scoring'] = asyncio.ensure_future(app['fake'].score_some(app))
+
+async def stop_scoring(app):
+    app['scoring'].cancel()
+
+def make_app(tick=15):
+    fake = FakeESPN(load_boards(), tick)
+    app = web.Application()
+    app['fake'] = fake
+    app.router.add_get('/{league}', fake.scoreboard)
+    app.on_startup.append(start_scoring)
+    app.on_cleanup.append(stop_scoring)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--tick', type=float, default=15, help='seconds between score changes')
+    args = parser.parse_args()
+    web.run_app(make_app(args.tick), host='127.0.0.1', port=args.port)
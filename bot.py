@@ -1,46 +1,523 @@
 import discord
 from discord.ext import commands, tasks
 import json
-import aiohttp
 from datetime import datetime, timezone, timedelta
 import asyncio
-from typing import Optional
+import heapq
+from typing import Optional, Literal
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+import hashlib
+from collections import OrderedDict
 from dotenv import load_dotenv
+from sortedcontainers import SortedList
+from storage import open_storage, DEFAULT_CONFIG, scoped_game_id, display_game_id
+from settlement import settle, potential_payout
+from stats import record_result, rates, breakdown
+from espn import ESPNClient
+from ingest import IngestFeed
+from embeds import GameCards
+from dispatcher import Dispatcher, SETTLEMENT, POST
+from metrics import Metrics, SIZE_BUCKETS
+from archive import Archive, settlement_rows
+from ledger import Ledger, HOUSE_ACCOUNTS, CENTS, user_account
 
 load_dotenv()
 
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+# AUTO_SHARD=1 runs one process over as many gateway shards as Discord recommends
+BotBase = commands.AutoShardedBot if os.getenv('AUTO_SHARD') == '1' else commands.Bot
+
+# Latency and persistence histograms, shown by /perf and served for Prometheus when METRICS_PORT is set
+metrics = Metrics()
+metrics.register('betting_handler_seconds', 'Time spent in commands, UI callbacks and background task runs')
+metrics.register('betting_save_seconds', 'Time to write a changeset (op=commit) or a snapshot (op=checkpoint)')
+metrics.register('betting_save_bytes', 'Bytes written per save', SIZE_BUCKETS)
+metrics.register('betting_espn_request_seconds', 'ESPN request latency')
+metrics.register('betting_discord_request_seconds', 'Discord REST calls, interaction responses included')
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+def time_requests(client):
+    """Wrap client.request(route, ...) so every Discord REST call is timed per route"""
+    request = client.request
+    
+    async def timed_request(route, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await request(route, *args, **kwargs)
+            outcome = 'ok'
+            return response
+        finally:
+            metrics.observe('betting_discord_request_seconds', time.perf_counter() - started,
+                            method=route.method, route=route.path, outcome=outcome)
+    
+    client.request = timed_request
+
+def record_slash_command(interaction: discord.Interaction, outcome: str):
+    started = interaction.extras.get('started')
+    if started is not None and interaction.command is not None:
+        metrics.observe('betting_handler_seconds', time.perf_counter() - started,
+                        kind='slash', handler=interaction.command.qualified_name, outcome=outcome)
+
+# Commands that never read user records, so they don't wait for users to load
+NO_USERS = {'needs_users': False}
+
+class BettingCommandTree(discord.app_commands.CommandTree):
+    """Holds each slash command until its users are loaded, and times it.
+
+    Commands marked extras={'needs_users': False} never touch user records and
+    run straight away. Successes are recorded by on_app_command_completion.
+    """
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras['started'] = time.perf_counter()
+        if interaction.command is None or interaction.command.extras.get('needs_users', True):
+            mentioned = interaction.data.get('resolved', {}).get('users', {}) if interaction.data else {}
+            await betting.ready(str(interaction.user.id), *mentioned)
+        return True
+    
+    async def on_error(self, interaction: discord.Interaction, error):
+        record_slash_command(interaction, 'error')
+        await super().on_error(interaction, error)
+
+class BettingBot(BotBase):
+    metrics_runner = None
+    
+    async def setup_hook(self):
+        # The bot's own calls, and interaction responses, which discord.py sends through its webhook adapter
+        time_requests(self.http)
+        time_requests(discord.webhook.async_.async_context.get())
+        if METRICS_PORT:
+            self.metrics_runner = await metrics.serve(os.getenv('METRICS_HOST', '127.0.0.1'), int(METRICS_PORT))
+        asyncio.ensure_future(self.finish_loading())
+        # Once per process rather than on every reconnect, and only when a command changed
+        await sync_command_tree()
+        await espn.start()
+        if scores is not espn:
+            scores.start()
+    
+    async def finish_loading(self):
+        try:
+            await betting.ready()
+        except Exception as e:
+            print(f"Failed to load betting data: {e!r}")
+            await self.close()
+    
+    async def close(self):
+        # Let queued messages go out and get every pending save onto disk before the loop goes away
+        await outbox.drain()
+        await betting.flush()
+        if scores is not espn:
+            await scores.close()
+        await espn.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+
+bot = BettingBot(command_prefix='!', intents=intents, help_command=None, tree_cls=BettingCommandTree)
+
+# Hash of the slash commands as last synced; SYNC_COMMANDS=1 syncs regardless
+COMMAND_TREE_HASH_FILE = 'command_tree.hash'
+
+def command_tree_hash() -> str:
+    commands_json = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()), key=lambda c: c['name'])
+    payload = json.dumps({'application_id': bot.application_id, 'commands': commands_json}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def sync_command_tree():
+    digest = command_tree_hash()
+    if os.getenv('SYNC_COMMANDS') != '1':
+        try:
+            with open(COMMAND_TREE_HASH_FILE, 'r') as f:
+                if f.read().strip() == digest:
+                    print("Slash commands unchanged, skipping sync")
+                    return
+        except FileNotFoundError:
+            pass
+    try:
+        synced = await bot.tree.sync()
+    except Exception as e:
+        print(f'Failed to sync commands: {e}')
+        return
+    with open(COMMAND_TREE_HASH_FILE, 'w') as f:
+        f.write(digest)
+    print(f'Synced {len(synced)} slash commands')
+
+@bot.before_invoke
+async def before_command(ctx):
+    ctx.started = time.perf_counter()
+    if not ctx.command.extras.get('needs_users', True):
+        return
+    mentioned = [arg for arg in (*ctx.args, *ctx.kwargs.values()) if isinstance(arg, discord.abc.User)]
+    await betting.ready(str(ctx.author.id), *(str(user.id) for user in mentioned))
+
+@bot.after_invoke
+async def record_command(ctx):
+    metrics.observe('betting_handler_seconds', time.perf_counter() - ctx.started, kind='command',
+                    handler=ctx.command.qualified_name, outcome='error' if ctx.command_failed else 'ok')
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_slash_command(interaction, 'ok')
+
+# Coalesce saves into at most one write per this many seconds
+PERSIST_INTERVAL = 1.0
+
+# Balance locks are striped over this many asyncio locks instead of one per user
+LOCK_SHARDS = 256
+
+# Opt-in NumPy settlement for games with thousands of bets (see benchmarks/bench_settlement.py)
+VECTORIZED_SETTLEMENT = os.getenv('SETTLEMENT_NUMPY') == '1'
+
+def _profit(user: dict) -> int:
+    return user['stats']['profit'] if 'stats' in user else 0
+
+def _copy_record(record: dict) -> dict:
+    """Two-level copy of a user/game/bet dict (their nested values are flat dicts and lists)"""
+    return {k: v.copy() if isinstance(v, (dict, list)) else v for k, v in record.items()}
 
 class BettingSystem:
-    def __init__(self):
+    def __init__(self, storage=None):
         self.users = {}
         self.games = {}
         self.bets = {}
-        self.config = {'betting_channel_id': None, 'auto_fetch_enabled': False, 'bettor_role_id': None}
+        # Settings from before per-guild config; adopt_legacy_config() hands them to their guild
+        self.config = dict(DEFAULT_CONFIG)
+        self.guild_configs = {}  # guild_id (str) -> config
+        # Bet indexes: user_id -> set of unsettled game_ids, game_id -> {user_id: bet}
+        self.user_games = {}
+        self.game_bettors = {}
+        # Leaderboard index of (-balance, user_id), so position 0 is the richest user
+        self.ranking = SortedList()
+        # Same for (-net profit, user_id), from the stats updated at settlement
+        self.profit_ranking = SortedList()
+        # game_id -> change counter, bumped by mark_game (in memory only, for render caches)
+        self.game_versions = {}
+        self.storage = storage or open_storage(os.getenv('BETTING_STORAGE', 'json'))
+        # Settled games and bets, kept after remove_game() drops them from the live data
+        self.archive = Archive()
+        # Every balance change as a double-entry record in cents, written ahead of the user records
+        self.ledger = Ledger()
+        # Records touched since the last save, handed to the storage as one changeset
+        self._dirty_users = set()
+        self._dirty_games = set()
+        self._new_bets = []
+        self._config_dirty = False
+        self._dirty_guild_configs = set()
+        self._new_archive = []  # (game row, bet rows) of settled games, archived once their commit is on disk
+        # Nesting depth of transaction() blocks; saves are deferred while > 0
+        self._txn_depth = 0
+        # Pending timed flush, and the single thread that does all storage writes in order
+        self._flush_handle = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='betting-io')
+        self._locks = [asyncio.Lock() for _ in range(LOCK_SHARDS)]
+        # Users and pre-guild data, loading on the writer thread while the bot logs in
+        self._global_load = None
+        self._loaded = False
         self.load_data()
     
     def load_data(self):
+        """Load guild configs, open games and bets now and start loading users in the background.
+        
+        ready() waits for the rest; until it has run, user records may be missing.
+        """
+        self.ledger.load()
+        state = self.storage.load_guilds()
+        self.games = state['games']
+        self.bets = state['bets']
+        self.guild_configs = state['guild_configs']
+        self._rebuild_bet_index()
+        self._loaded = False
+        # First job on the writer thread, so every write lands after it
+        self._global_load = self._executor.submit(self.storage.load_global)
+    
+    async def ready(self, *user_ids):
+        """Wait until all users are loaded; returns at once if every given user already is.
+        
+        With no user_ids it waits for everyone. Storage that can read one user
+        (SQLite) fetches the given users instead of waiting for the rest.
+        """
+        if self._loaded or (user_ids and all(user_id in self.users for user_id in user_ids)):
+            return
+        if user_ids and self.storage.point_reads:
+            for user_id in user_ids:
+                if user_id not in self.users:
+                    self._add_stored_user(user_id, self.storage.get_user(user_id))
+            return
+        state = await asyncio.wrap_future(self._global_load)
+        if not self._loaded:
+            self._merge_global(state)
+    
+    def _add_stored_user(self, user_id: str, user: Optional[dict]):
+        # None: not stored, so a new user; get_balance() creates them when they need a record
+        if user is None:
+            return
+        self.users[user_id] = user
+        self.ranking.add((-user['balance'], user_id))
+        self.profit_ranking.add((-_profit(user), user_id))
+        self._reconcile_ledger({user_id: user})
+    
+    def _merge_global(self, state):
+        # Records created in memory before this ran have been saved since, so they are the newer copy
+        for user_id, user in state['users'].items():
+            self.users.setdefault(user_id, user)
+        for game_id, game in state['games'].items():
+            if game_id not in self.games:
+                self.games[game_id] = game
+                self.bets[game_id] = state['bets'].get(game_id, [])
+        if not self._config_dirty:
+            self.config = state['config']
+        self._rebuild_bet_index()
+        self.ranking = SortedList((-u['balance'], uid) for uid, u in self.users.items())
+        self.profit_ranking = SortedList((-_profit(u), uid) for uid, u in self.users.items())
+        self._loaded = True
+        print(f"Loaded {len(state['users']):,} users")
+        self._reconcile_ledger()
+    
+    def _reconcile_ledger(self, users=None):
+        """Bring the ledger in line with the stored balances (of users, default everyone): opening
+        entries for users it has never seen (data from before the ledger), adjustments for any that disagree"""
+        users = self.users if users is None else users
+        expected = {user_account(uid): u['balance'] * CENTS for uid, u in users.items()}
+        mismatched = self.ledger.audit(expected)
+        adjusted = 0
+        for account, (cents, ledger_cents) in mismatched.items():
+            kind = 'adjustment' if account in self.ledger.balances else 'opening'
+            adjusted += kind == 'adjustment'
+            self.ledger.post(kind, [(account, cents - ledger_cents), (HOUSE_ACCOUNTS[kind], ledger_cents - cents)])
+        if adjusted:
+            print(f"Ledger disagreed with {adjusted:,} stored balances; recorded adjustments")
+        if mismatched:
+            self.save_data()
+    
+    def _rebuild_bet_index(self):
+        self.user_games = {}
+        self.game_bettors = {}
+        for game_id, bets in self.bets.items():
+            game = self.games.get(game_id)
+            if game is None:
+                continue
+            bettors = self.game_bettors.setdefault(game_id, {})
+            for bet in bets:
+                bettors[bet['user_id']] = bet
+                if not game.get('result'):
+                    self.user_games.setdefault(bet['user_id'], set()).add(game_id)
+    
+    def mark_user(self, user_id: str):
+        self._dirty_users.add(user_id)
+    
+    def mark_game(self, game_id: str):
+        """Mark a game as changed; a game missing from self.games is saved as deleted"""
+        self._dirty_games.add(game_id)
+        self.game_versions[game_id] = self.game_versions.get(game_id, 0) + 1
+    
+    def game_version(self, game_id: str) -> int:
+        return self.game_versions.get(game_id, 0)
+    
+    def mark_config(self):
+        self._config_dirty = True
+    
+    def guild_config(self, guild_id) -> dict:
+        """A guild's settings (betting channel, bettor role, auto-fetch), created on first use"""
+        guild_id = str(guild_id)
+        if guild_id not in self.guild_configs:
+            self.guild_configs[guild_id] = dict(DEFAULT_CONFIG)
+        return self.guild_configs[guild_id]
+    
+    def mark_guild_config(self, guild_id):
+        self._dirty_guild_configs.add(str(guild_id))
+    
+    def adopt_legacy_config(self, guild_id):
+        """Move the pre-guild settings to the guild that owns their betting channel"""
+        with self.transaction():
+            self.guild_config(guild_id).update(self.config)
+            self.mark_guild_config(guild_id)
+            self.config = dict(DEFAULT_CONFIG)
+            self.mark_config()
+    
+    def find_game_id(self, guild_id, game_id: str) -> str:
+        """The stored id for a game id as shown on a card or typed into a command.
+        
+        Only this guild's games (and unscoped ones from before guilds) resolve; any
+        other id comes back as one that isn't in self.games, so callers report it not found.
+        """
+        guild_id = str(guild_id) if guild_id else None
+        if guild_id and scoped_game_id(guild_id, game_id) in self.games:
+            return scoped_game_id(guild_id, game_id)
+        game = self.games.get(game_id)
+        if game is not None and game.get('guild_id') in (guild_id, None):
+            return game_id
+        return f"{game_id}@{guild_id}"
+    
+    def guild_games(self, guild_id) -> list:
+        """(game_id, game) for a guild's games, plus games from before guild scoping"""
+        guild_id = str(guild_id) if guild_id else None
+        return [(gid, g) for gid, g in self.games.items() if g.get('guild_id') in (guild_id, None)]
+    
+    def add_bet(self, game_id: str, bet: dict):
+        self.bets[game_id].append(bet)
+        self.game_bettors.setdefault(game_id, {})[bet['user_id']] = bet
+        self.user_games.setdefault(bet['user_id'], set()).add(game_id)
+        self._new_bets.append((game_id, bet))
+    
+    def get_user_bet(self, game_id: str, user_id: str) -> Optional[dict]:
+        return self.game_bettors.get(game_id, {}).get(user_id)
+    
+    def unindex_game(self, game_id: str):
+        """Take a settled game out of its bettors' open bets"""
+        for user_id in self.game_bettors.get(game_id, {}):
+            open_games = self.user_games.get(user_id)
+            if open_games is not None:
+                open_games.discard(game_id)
+                if not open_games:
+                    del self.user_games[user_id]
+    
+    def remove_game(self, game_id: str):
+        """Delete a game with its bets and index entries"""
+        self.unindex_game(game_id)
+        self.game_bettors.pop(game_id, None)
+        self.games.pop(game_id, None)
+        self.bets.pop(game_id, None)
+        self.mark_game(game_id)
+        self.game_versions.pop(game_id, None)
+    
+    @contextmanager
+    def transaction(self):
+        """Group several mutations into one save"""
+        self._txn_depth += 1
         try:
-            with open('betting_data.json', 'r') as f:
-                data = json.load(f)
-                self.users = data.get('users', {})
-                self.games = data.get('games', {})
-                self.bets = data.get('bets', {})
-                self.config = data.get('config', {'betting_channel_id': None, 'auto_fetch_enabled': False, 'bettor_role_id': None})
-        except FileNotFoundError:
-            pass
+            yield
+        finally:
+            self._txn_depth -= 1
+            if self._txn_depth == 0:
+                self.save_data()
     
     def save_data(self):
-        with open('betting_data.json', 'w') as f:
-            json.dump({
-                'users': self.users, 
-                'games': self.games, 
-                'bets': self.bets,
-                'config': self.config
-            }, f, indent=2)
+        """Schedule pending changes to be written; saves within PERSIST_INTERVAL are coalesced"""
+        if self._txn_depth > 0 or not self._has_changes():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop yet (startup, scripts): write now, still on the writer thread
+            changes = self._take_changes()
+            snapshot = self._frozen_snapshot() if self._checkpoint_due(changes) else None
+            self._executor.submit(self._write, changes, snapshot).result()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(PERSIST_INTERVAL, self._start_flush)
+    
+    def _start_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+    
+    async def flush(self):
+        """Write pending changes now and wait until everything queued so far is on disk"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        changes = self._take_changes()
+        # Copy the full state here, on the loop, so the writer thread never sees it mid-mutation
+        snapshot = self._frozen_snapshot() if self._checkpoint_due(changes) else None
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, changes, snapshot)
+        except Exception as e:
+            print(f"Error saving data: {e}")
+            # Keep the changes dirty so the next flush retries them
+            self._dirty_users.update(changes['users'])
+            self._dirty_games.update(changes['games'])
+            self._new_bets.extend(changes['bets'])
+            self.ledger.requeue(changes['ledger'])
+            self._config_dirty = self._config_dirty or changes['config'] is not None
+            self._dirty_guild_configs.update(changes['guild_configs'])
+            self._new_archive[:0] = changes['archive']
+    
+    def _checkpoint_due(self, changes) -> bool:
+        # A snapshot taken before all users are loaded would drop the ones still missing
+        return self._loaded and self.storage.needs_checkpoint(changes)
+    
+    def _write(self, changes, snapshot):
+        if self._is_empty(changes):
+            return
+        # Ledger first: if the commit then fails, startup finds the difference and records it
+        if changes['ledger']:
+            with metrics.timer('betting_save_seconds', op='ledger'):
+                self.ledger.write(changes['ledger'])
+        with metrics.timer('betting_save_seconds', op='commit'):
+            written = self.storage.commit(changes)
+        metrics.observe('betting_save_bytes', written, op='commit')
+        if snapshot is not None:
+            with metrics.timer('betting_save_seconds', op='checkpoint'):
+                written = self.storage.checkpoint(snapshot)
+            metrics.observe('betting_save_bytes', written, op='checkpoint')
+        # After the commit, or a crash in between would archive the game again when it is resettled
+        if changes['archive']:
+            self._archive([game for game, _ in changes['archive']], [bet for _, bets in changes['archive'] for bet in bets])
+    
+    def _has_changes(self):
+        return bool(self._dirty_users or self._dirty_games or self._new_bets or self._config_dirty
+                    or self._dirty_guild_configs or self.ledger.pending or self._new_archive)
+    
+    @staticmethod
+    def _is_empty(changes):
+        return (changes['config'] is None and not changes['guild_configs'] and not changes['users']
+                and not changes['games'] and not changes['bets'] and not changes['ledger'] and not changes['archive'])
+    
+    def _take_changes(self):
+        """Build a changeset from the dirty records, copied so later mutations don't leak into it"""
+        changes = {
+            'config': dict(self.config) if self._config_dirty else None,
+            'guild_configs': {gid: dict(self.guild_configs[gid]) for gid in self._dirty_guild_configs},
+            'users': {uid: _copy_record(self.users[uid]) for uid in self._dirty_users if uid in self.users},
+            'games': {gid: _copy_record(self.games[gid]) if gid in self.games else None for gid in self._dirty_games},
+            'bets': [(gid, _copy_record(bet)) for gid, bet in self._new_bets if gid in self.games],
+            'ledger': self.ledger.take_pending(),
+            'archive': list(self._new_archive)
+        }
+        self._clear_dirty()
+        return changes
+    
+    def _frozen_snapshot(self):
+        return {
+            'users': {uid: _copy_record(u) for uid, u in self.users.items()},
+            'games': {gid: _copy_record(g) for gid, g in self.games.items()},
+            'bets': {gid: [_copy_record(b) for b in bets] for gid, bets in self.bets.items()},
+            'config': dict(self.config),
+            'guild_configs': {gid: dict(c) for gid, c in self.guild_configs.items()}
+        }
+    
+    def _clear_dirty(self):
+        self._dirty_users.clear()
+        self._dirty_games.clear()
+        self._new_bets.clear()
+        self._new_archive.clear()
+        self._config_dirty = False
+        self._dirty_guild_configs.clear()
+    
+    def _leaderboard(self, by: str):
+        if by == 'profit':
+            return self.profit_ranking, _profit
+        return self.ranking, lambda user: user['balance']
+    
+    def top_users(self, limit: int, offset: int = 0, by: str = 'balance'):
+        """(user_id, balance) pairs, richest first; by='profit' ranks on net betting profit instead"""
+        ranking, _ = self._leaderboard(by)
+        return [(uid, -neg_value) for neg_value, uid in ranking.islice(offset, offset + limit)]
+    
+    def user_rank(self, user_id: str, by: str = 'balance') -> Optional[int]:
+        """1-based leaderboard position, or None for unknown users"""
+        if user_id not in self.users:
+            return None
+        ranking, value = self._leaderboard(by)
+        return ranking.index((-value(self.users[user_id]), user_id)) + 1
+    
+    def open_bets_for_user(self, user_id: str):
+        """(game_id, bet) pairs for a user's bets on unsettled games"""
+        return [(game_id, self.game_bettors[game_id][user_id]) for game_id in self.user_games.get(user_id, ())]
     
     def get_balance(self, user_id: str) -> int:
         if user_id not in self.users:
@@ -53,19 +530,239 @@ class BettingSystem:
                 'last_daily': None,
                 'loan_amount': 0
             }
+            self.ranking.add((-1000, user_id))
+            self.profit_ranking.add((0, user_id))
+            self.ledger.post('opening', [(user_account(user_id), 1000 * CENTS), (HOUSE_ACCOUNTS['opening'], -1000 * CENTS)])
+            self.mark_user(user_id)
             self.save_data()
         # Ensure all users have loan_amount field (for existing users)
         if 'loan_amount' not in self.users[user_id]:
             self.users[user_id]['loan_amount'] = 0
         return self.users[user_id]['balance']
     
-    def update_balance(self, user_id: str, amount: int):
-        self.get_balance(user_id)
-        self.users[user_id]['balance'] += amount
-        self.save_data()
+    @asynccontextmanager
+    async def locked(self, *user_ids):
+        """Hold the balance locks for these users across a check-then-change that may await.
+
+        Shards are always taken in ascending order, so two multi-user operations
+        (a send and a settlement, say) can never wait on each other in a cycle.
+        """
+        # Never change a user whose stored record hasn't loaded yet
+        await self.ready(*user_ids)
+        shards = sorted({hash(user_id) % LOCK_SHARDS for user_id in user_ids})
+        acquired = []
+        try:
+            for shard in shards:
+                await self._locks[shard].acquire()
+                acquired.append(shard)
+            yield
+        finally:
+            for shard in reversed(acquired):
+                self._locks[shard].release()
+    
+    def debit(self, user_id: str, amount: int, kind: str, ref=None) -> bool:
+        """Take amount from a user if they have it; the check and the change happen together.
+        
+        kind names the ledger entry ('stake', 'purchase', ...) and ref what it was for.
+        """
+        with self.transaction():
+            if self.get_balance(user_id) < amount:
+                return False
+            self._move(user_id, -amount, kind, ref)
+        return True
+    
+    def transfer(self, sender_id: str, receiver_id: str, amount: int) -> bool:
+        """Move amount between two users in one step, or not at all if the sender is short"""
+        with self.transaction():
+            self.get_balance(receiver_id)
+            if self.get_balance(sender_id) < amount:
+                return False
+            self.ledger.post('transfer', [(user_account(sender_id), -amount * CENTS),
+                                          (user_account(receiver_id), amount * CENTS)])
+            self._adjust_balance(sender_id, -amount)
+            self._adjust_balance(receiver_id, amount)
+        return True
+    
+    def update_balance(self, user_id: str, amount: int, kind: str, ref=None):
+        with self.transaction():
+            self.get_balance(user_id)
+            self._move(user_id, amount, kind, ref)
+    
+    def _move(self, user_id: str, amount: int, kind: str, ref=None):
+        """Change a balance against the house account for kind, recording it in the ledger"""
+        self.ledger.post(kind, [(user_account(user_id), amount * CENTS), (HOUSE_ACCOUNTS[kind], -amount * CENTS)], ref)
+        self._adjust_balance(user_id, amount)
+    
+    def _adjust_balance(self, user_id: str, amount: int):
+        user = self.users[user_id]
+        self.ranking.remove((-user['balance'], user_id))
+        user['balance'] += amount
+        self.ranking.add((-user['balance'], user_id))
+        self.mark_user(user_id)
+    
+    def settle_game(self, game_id: str, winner: str) -> Optional[list]:
+        """Pay out a finished game as one batch; returns (user_id, amount, won, items) per bet.
+
+        Returns None if the game has already been settled. Callers hold
+        locked(*game_bettors[game_id]) so no bettor's balance changes underneath.
+        """
+        game = self.games[game_id]
+        if game.get('result'):
+            return None
+        bets = self.bets.get(game_id, [])
+        with self.transaction():
+            for bet in bets:
+                self.get_balance(bet['user_id'])
+            # Work out everything first, so a bad bet can't leave the game half paid
+            plan = settle(bets, winner, {b['user_id']: self.users[b['user_id']]['balance'] for b in bets},
+                          vectorize=VECTORIZED_SETTLEMENT)
+            
+            game['result'] = winner
+            game['locked'] = True
+            self.mark_game(game_id)
+            self.unindex_game(game_id)
+            for user_id, amount, won, items in plan.payouts:
+                if amount:
+                    kind = 'payout' if won else 'refund' if 'insurance' in items else 'penalty'
+                    self.ledger.post(kind, [(user_account(user_id), amount * CENTS),
+                                            (HOUSE_ACCOUNTS[kind], -amount * CENTS)], game_id)
+            for user_id, delta in plan.deltas.items():
+                self._adjust_balance(user_id, delta)
+            for user_id in plan.winners:
+                self.users[user_id]['wins'] += 1
+                self.mark_user(user_id)
+            for user_id in plan.losers:
+                self.users[user_id]['losses'] += 1
+                self.mark_user(user_id)
+            for bet, (user_id, payout, won, _) in zip(bets, plan.payouts):
+                self._record_result(user_id, bet, payout, won, game)
+            game_row, bet_rows = settlement_rows(game_id, game, bets, plan.payouts, int(time.time()))
+            self._new_archive.append((game_row, bet_rows))
+        return plan.payouts
+    
+    def _record_result(self, user_id: str, bet: dict, payout: int, won: bool, game: dict):
+        user = self.users[user_id]
+        self.profit_ranking.remove((-_profit(user), user_id))
+        record_result(user, bet, payout, won, game.get('sport'), game.get('league'))
+        self.profit_ranking.add((-_profit(user), user_id))
+        self.mark_user(user_id)
+    
+    def _archive(self, games, bets):
+        try:
+            with metrics.timer('betting_save_seconds', op='archive'):
+                self.archive.append(games, bets)
+        except Exception as e:
+            print(f"Could not archive {', '.join(g['game_id'] for g in games)}: {e!r}")
+    
+    def compact_archive(self):
+        """Merge the archive blocks of finished weeks, on the writer thread so no append races it"""
+        def compact():
+            try:
+                weeks = self.archive.compact_finished(int(time.time()))
+            except Exception as e:
+                print(f"Archive compaction failed: {e!r}")
+                return
+            if weeks:
+                print(f"Compacted archive weeks: {', '.join(weeks)}")
+        self._executor.submit(compact)
 
 betting = BettingSystem()
 
+class NameResolver:
+    """Display names for user ids: guild member cache, then an LRU/TTL cache, then the API.
+
+    Only global names (never a guild nickname) go in the cache and the user record.
+    """
+    def __init__(self, max_size=5000, ttl=3600, concurrency=10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (name, expires_at)
+        self._inflight = {}  # user_id -> task, so a user is fetched once however many callers ask
+        self._semaphore = asyncio.Semaphore(concurrency)
+    
+    async def resolve(self, user_id: str, guild=None) -> str:
+        return (await self.resolve_many([user_id], guild))[user_id]
+    
+    async def resolve_many(self, user_ids, guild=None) -> dict:
+        names = {}
+        missing = []
+        for user_id in set(user_ids):
+            name = self._cached(user_id, guild)
+            if name is not None:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            names.update(zip(missing, fetched))
+        return names
+    
+    def _cached(self, user_id: str, guild):
+        if guild:
+            member = guild.get_member(int(user_id))
+            if member:
+                # A nickname belongs to this guild: shown here, but not cached or saved for the others
+                return member.display_name
+        entry = self._cache.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            return entry[0]
+        user = bot.get_user(int(user_id))
+        if user:
+            self._remember(user_id, user.display_name)
+            return user.display_name
+        # A name saved with the user record is good enough to show; refresh it in the background
+        stored = betting.users.get(user_id, {}).get('name')
+        if stored:
+            self._spawn_fetch(user_id)
+            return stored
+        return None
+    
+    def _spawn_fetch(self, user_id: str):
+        if user_id not in self._inflight:
+            self._inflight[user_id] = asyncio.ensure_future(self._fetch_uncached(user_id))
+            self._inflight[user_id].add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return self._inflight[user_id]
+    
+    async def _fetch(self, user_id: str) -> str:
+        return await asyncio.shield(self._spawn_fetch(user_id))
+    
+    async def _fetch_uncached(self, user_id: str) -> str:
+        async with self._semaphore:
+            try:
+                user = await bot.fetch_user(int(user_id))
+            except Exception:
+                return betting.users.get(user_id, {}).get('name') or user_id
+        self._remember(user_id, user.display_name)
+        return user.display_name
+    
+    def _remember(self, user_id: str, name: str):
+        self._cache[user_id] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        # Keep the last known name with the user so it survives restarts
+        user = betting.users.get(user_id)
+        if user is not None and user.get('name') != name:
+            user['name'] = name
+            betting.mark_user(user_id)
+            betting.save_data()
+
+names = NameResolver()
+cards = GameCards()
+outbox = Dispatcher()
+espn = ESPNClient(scoreboard_ttl=int(os.getenv('SCOREBOARD_TTL', 60)),
+                  on_request=lambda seconds: metrics.observe('betting_espn_request_seconds', seconds))
+
+# With INGEST_ADDR=host:port scoreboards come from a separate ingest.py process
+# (falling back to fetching here while it is down)
+INGEST_ADDR = os.getenv('INGEST_ADDR')
+if INGEST_ADDR:
+    ingest_host, ingest_port = INGEST_ADDR.rsplit(':', 1)
+    scores = IngestFeed(ingest_host, int(ingest_port), fallback=espn)
+else:
+    scores = espn
+
 async def finalize_game(game_id: str, winner: str):
     """Finalize game, pay out winners, and clean up data"""
     if game_id not in betting.games:
@@ -76,38 +773,11 @@ async def finalize_game(game_id: str, winner: str):
     if winner not in ['home', 'away']:
         return
 
-    game['result'] = winner
-    game['locked'] = True
-
-    payouts = []
-    for bet in betting.bets.get(game_id, []):
-        user_id = bet['user_id']
-        used_items = bet.get('used_items', [])
-        if bet['team'] == winner:
-            payout = int(bet.get('potential_win', 0))
-            if payout > 0:
-                betting.update_balance(user_id, payout)
-            betting.users[user_id]['wins'] += 1
-            payouts.append((user_id, payout, True, used_items))
-        else:
-            betting.users[user_id]['losses'] += 1
-            if 'insurance' in used_items:
-                refund = int(bet['amount'] * 0.5)
-                if refund > 0:
-                    betting.update_balance(user_id, refund)
-                payouts.append((user_id, refund, False, ['insurance']))
-            elif '2x_multiplier' in used_items:
-                current_balance = betting.users[user_id]['balance']
-                penalty = min(bet['amount'], current_balance)
-                if penalty > 0:
-                    betting.update_balance(user_id, -penalty)
-                    payouts.append((user_id, -penalty, False, ['2x_penalty']))
-                else:
-                    payouts.append((user_id, 0, False, ['2x_nofunds']))
-            else:
-                payouts.append((user_id, 0, False, []))
-
-    betting.save_data()
+    async with betting.locked(*betting.game_bettors.get(game_id, {})):
+        payouts = betting.settle_game(game_id, winner)
+    if payouts is None:
+        return
+    await betting.flush()
 
     channel = bot.get_channel(game['channel_id'])
     if not channel:
@@ -117,12 +787,9 @@ async def finalize_game(game_id: str, winner: str):
     
     winners_text = ""
     losers_text = ""
+    display_names = await names.resolve_many([p[0] for p in payouts], channel.guild)
     for user_id, payout, won, items in payouts:
-        try:
-            user = await bot.fetch_user(int(user_id))
-            name = user.name
-        except:
-            name = user_id
+        name = display_names[user_id]
         if won:
             bonus = " 💎" if '2x_multiplier' in items else ""
             winners_text += f"✅ {name}: +${payout:,.0f}{bonus}\n"
@@ -134,130 +801,118 @@ async def finalize_game(game_id: str, winner: str):
             else:
                 losers_text += f"❌ {name}\n"
     
-    # Try to edit original message
+    # Edit the original card ahead of any queued announcements
     message_id = game.get('message_id')
     if message_id:
-        try:
-            msg = await channel.fetch_message(int(message_id))
-            
-            sport = game.get('sport', 'NFL')
-            emoji = "🏈" if sport == "NFL" else "🏟️"
-            home_odds = game['home_odds']
-            away_odds = game['away_odds']
-            
-            embed = discord.Embed(
-                title=f"{emoji} {game['home_team']} vs {game['away_team']}",
-                description=f"**🏁 FINAL** • Winner: **{winner_team}**",
-                color=0x2ecc71
-            )
-            
-            embed.add_field(
-                name="━━━━━━━━━━━━━━━━━━━━━━━",
-                value="\u200b",
-                inline=False
-            )
-            
-            # Show winner in green, loser in red
-            if winner == 'home':
-                home_syntax = "diff\n+"
-                away_syntax = "diff\n-"
-            else:
-                home_syntax = "diff\n-"
-                away_syntax = "diff\n+"
-            
-            embed.add_field(
-                name=f"{game['home_team']}",
-                value=f"```{home_syntax}{home_odds:+.0f}```",
-                inline=True
-            )
-            embed.add_field(
-                name="\u200b",
-                value="**VS**",
-                inline=True
-            )
-            embed.add_field(
-                name=f"{game['away_team']}",
-                value=f"```{away_syntax}{away_odds:+.0f}```",
-                inline=True
-            )
-            
-            embed.add_field(
-                name="━━━━━━━━━━━━━━━━━━━━━━━",
-                value="\u200b",
-                inline=False
-            )
-            
-            if winners_text:
-                embed.add_field(name="🎉 Winners", value=winners_text, inline=False)
-            if losers_text:
-                embed.add_field(name="😢 Losers", value=losers_text, inline=False)
-            
-            embed.set_footer(text=f"Game ID: {game_id} • FINAL")
-            
-            await msg.edit(embed=embed, view=None)
-        except Exception as e:
-            print(f"Could not edit message: {e}")
-            # Fallback: post new message
-            embed = discord.Embed(title="🏁 Final", color=0x2ecc71)
-            embed.add_field(name="Game", value=f"{game['home_team']} vs {game['away_team']}", inline=False)
-            embed.add_field(name="Winner", value=winner_team, inline=False)
-            
-            if winners_text:
-                embed.add_field(name="Winners", value=winners_text, inline=True)
-            if losers_text:
-                embed.add_field(name="Losers", value=losers_text, inline=True)
-            
-            await channel.send(embed=embed)
+        embed = cards.render(game_id, game, betting.game_version(game_id), winners_text, losers_text)
+        
+        async def publish(ch):
+            try:
+                msg = await ch.fetch_message(int(message_id))
+                return await msg.edit(embed=embed, view=None)
+            except Exception as e:
+                print(f"Could not edit message: {e}")
+                # Fallback: post new message
+                fallback = discord.Embed(title="🏁 Final", color=0x2ecc71)
+                fallback.add_field(name="Game", value=f"{game['home_team']} vs {game['away_team']}", inline=False)
+                fallback.add_field(name="Winner", value=winner_team, inline=False)
+                
+                if winners_text:
+                    fallback.add_field(name="Winners", value=winners_text, inline=True)
+                if losers_text:
+                    fallback.add_field(name="Losers", value=losers_text, inline=True)
+                
+                return await ch.send(embed=fallback)
+        
+        outbox.submit(channel, publish, SETTLEMENT)
     
     # Clean up finished game from data
-    del betting.games[game_id]
-    del betting.bets[game_id]
-    betting.save_data()
+    betting.remove_game(game_id)
+    cards.forget(game_id)
+    await betting.flush()
     print(f"Cleaned up finished game: {game_id}")
 
-@tasks.loop(minutes=2)
+# Kickoff-to-final durations in seconds: (earliest, expected, latest)
+GAME_DURATIONS = {
+    'nfl': (165 * 60, 190 * 60, 240 * 60),
+    'college-football': (180 * 60, 210 * 60, 270 * 60)
+}
+RESULT_POLL_LEAD = 10 * 60  # start polling this long before the earliest likely final
+RESULT_POLL_FAST = 60  # within 20 minutes of the expected final
+RESULT_POLL_NORMAL = 120  # elsewhere in the window
+RESULT_POLL_OVERDUE = 300  # past the latest expected final (overtime, weather delays)
+RESULT_POLL_MAX_BACKOFF = 4  # unchanged scoreboards stretch the interval up to this factor
+
+def result_poll_interval(game: dict, now: float) -> Optional[float]:
+    """Seconds between result polls for a game right now, or None if it can't be final yet"""
+    earliest, expected, latest = GAME_DURATIONS.get(game['league'], GAME_DURATIONS['college-football'])
+    start = datetime.fromisoformat(game['start_time']).timestamp()
+    if now < start + earliest - RESULT_POLL_LEAD:
+        return None
+    if abs(now - (start + expected)) <= 20 * 60:
+        return RESULT_POLL_FAST
+    if now <= start + latest:
+        return RESULT_POLL_NORMAL
+    return RESULT_POLL_OVERDUE
+
+# league -> {'last': epoch of the last poll, 'interval': the interval it used, 'next': epoch of the next poll,
+#            'backoff': interval factor, 'version': scoreboard version seen}
+result_polls = {}
+
+def result_poll_due(league: str, interval: float, now: float) -> bool:
+    """Whether a league's results are due; a game needing faster polls than the last one used pulls the deadline in"""
+    poll = result_polls.get(league)
+    if poll is None:
+        return True
+    deadline = poll['next']
+    if interval < poll['interval']:
+        deadline = min(deadline, poll['last'] + interval)
+    return deadline <= now
+
+@tasks.loop(seconds=30)
+@metrics.timed('betting_handler_seconds', kind='task', handler='check_game_results')
 async def check_game_results():
-    """Check ESPN for finished games and auto-finalize them"""
+    """Check ESPN for finished games and auto-finalize them, polling each league only when it's due"""
     pending = [(gid, g) for gid, g in betting.games.items() if not g.get('result') and g.get('espn_id') and g.get('league')]
     if not pending:
         return
 
-    leagues = set(g['league'] for _, g in pending)
+    now = time.time()
+    intervals = {}
+    for game_id, game in pending:
+        try:
+            interval = result_poll_interval(game, now)
+        except (KeyError, ValueError):
+            print(f"Game {game_id} has no valid start time")
+            continue
+        if interval is not None:
+            league = game['league']
+            intervals[league] = min(interval, intervals.get(league, interval))
+    due = [league for league in intervals if result_poll_due(league, intervals[league], now)]
+    if not due:
+        return
+
+    # max_age=0: always revalidate, a 304 is cheap and tells us nothing changed
+    boards = await scores.games(due, max_age=0)
     results = {}
+    for league in due:
+        poll = result_polls.setdefault(league, {'last': 0, 'interval': intervals[league], 'next': 0, 'backoff': 1.0, 'version': None})
+        version = scores.scoreboard_version(league)
+        if intervals[league] < poll['interval']:
+            poll['backoff'] = 1.0  # a game has moved closer to its final; don't stretch its polls
+        elif boards[league] is not None and version == poll['version']:
+            poll['backoff'] = min(poll['backoff'] * 1.5, RESULT_POLL_MAX_BACKOFF)
+        else:
+            poll['backoff'] = 1.0
+        poll['version'] = version
+        poll['last'] = now
+        poll['interval'] = intervals[league]
+        poll['next'] = now + intervals[league] * poll['backoff']
 
-    async with aiohttp.ClientSession() as session:
-        for league in leagues:
-            url = f"https://site.api.espn.com/apis/site/v2/sports/football/{league}/scoreboard"
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    continue
-                data = await resp.json()
-                for event in data.get('events', []):
-                    eid = str(event.get('id'))
-                    status = event.get('status', {}).get('type', {})
-                    state = status.get('state')
-                    completed = status.get('completed', False)
-                    if not (completed or state == 'post'):
-                        continue
-
-                    comp = event.get('competitions', [{}])[0]
-                    competitors = comp.get('competitors', [])
-                    home = next((c for c in competitors if c.get('homeAway') == 'home'), None)
-                    away = next((c for c in competitors if c.get('homeAway') == 'away'), None)
-                    if not home or not away:
-                        continue
-
-                    try:
-                        home_score = int(home.get('score', '0'))
-                        away_score = int(away.get('score', '0'))
-                    except:
-                        continue
-
-                    if home_score == away_score:
-                        continue
-
-                    winner_side = 'home' if home_score > away_score else 'away'
-                    results[eid] = winner_side
+        for espn_game in boards[league] or ():
+            winner_side = espn_game.winner()
+            if winner_side:
+                results[espn_game.espn_id] = winner_side
 
     for game_id, game in pending:
         eid = str(game.get('espn_id'))
@@ -271,15 +926,16 @@ async def on_ready():
     # Register persistent views
     bot.add_view(BettingView(None, {}))
     
-    try:
-        synced = await bot.tree.sync()
-        print(f'Synced {len(synced)} slash commands')
-    except Exception as e:
-        print(f'Failed to sync commands: {e}')
+    # Settings saved before config was per guild belong to the guild of their betting channel
+    await betting.ready()
+    legacy_channel = bot.get_channel(betting.config.get('betting_channel_id') or 0)
+    if legacy_channel is not None and getattr(legacy_channel, 'guild', None):
+        betting.adopt_legacy_config(legacy_channel.guild.id)
+        print(f"Moved saved settings to guild {legacy_channel.guild.id}")
     
     # Start tasks only if not already running
-    if not check_game_locks.is_running():
-        check_game_locks.start()
+    if not lock_scheduler.is_running():
+        lock_scheduler.start()
     if not auto_fetch_games.is_running():
         auto_fetch_games.start()
     if not check_game_results.is_running():
@@ -288,6 +944,7 @@ async def on_ready():
         cleanup_old_games.start()
 
 @tasks.loop(hours=24)
+@metrics.timed('betting_handler_seconds', kind='task', handler='cleanup_old_games')
 async def cleanup_old_games():
     """Delete games older than 7 days from betting_data.json"""
     now = datetime.now(timezone.utc)
@@ -303,53 +960,148 @@ async def cleanup_old_games():
             continue
     
     for game_id in games_to_delete:
-        del betting.games[game_id]
-        if game_id in betting.bets:
-            del betting.bets[game_id]
+        betting.remove_game(game_id)
+        cards.forget(game_id)
     
     if games_to_delete:
         betting.save_data()
         print(f"Cleaned up {len(games_to_delete)} old games")
+    betting.compact_archive()
 
-@tasks.loop(minutes=1)
-async def check_game_locks():
-    now = datetime.now(timezone.utc)
-    for game_id, game in list(betting.games.items()):
-        if not game['locked']:
-            # Check lock_time first, fall back to start_time
-            lock_time_str = game.get('lock_time') or game['start_time']
-            lock_time = datetime.fromisoformat(lock_time_str)
+def lock_epoch(game: dict) -> float:
+    # Check lock_time first, fall back to start_time
+    return datetime.fromisoformat(game.get('lock_time') or game['start_time']).timestamp()
+
+class LockScheduler:
+    """Locks games at their lock time, sleeping until the next one is due"""
+    # Re-check at least this often, in case the wall clock jumps
+    MAX_SLEEP = 300
+    
+    def __init__(self):
+        self._heap = []  # (lock epoch, game_id); stale entries are skipped when popped
+        self._wakeup = asyncio.Event()
+        self._task = None
+    
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self):
+        self._heap = []
+        for game_id, game in betting.games.items():
+            self._push(game_id, game)
+        self._task = asyncio.ensure_future(self._run())
+    
+    def schedule(self, game_id: str):
+        """Arm (or re-arm) the lock for a newly added or edited game"""
+        game = betting.games.get(game_id)
+        if game and self._push(game_id, game):
+            self._wakeup.set()
+    
+    def _push(self, game_id: str, game: dict) -> bool:
+        if game.get('locked'):
+            return False
+        try:
+            heapq.heappush(self._heap, (lock_epoch(game), game_id))
+        except (KeyError, ValueError):
+            print(f"Game {game_id} has no valid lock time")
+            return False
+        return True
+    
+    async def _run(self):
+        while True:
+            try:
+                due = self._pop_due(time.time())
+                if due:
+                    await lock_games(due)
+            except Exception as e:
+                print(f"Error locking games: {e}")
             
-            if lock_time <= now:
-                game['locked'] = True
-                betting.save_data()
-                channel = bot.get_channel(game['channel_id'])
-                if channel:
-                    await channel.send(f"🔒 **Betting closed** for {game['home_team']} vs {game['away_team']}!")
+            self._wakeup.clear()
+            timeout = self.MAX_SLEEP
+            if self._heap:
+                timeout = min(max(self._heap[0][0] - time.time(), 0), self.MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, game_id = heapq.heappop(self._heap)
+            game = betting.games.get(game_id)
+            if not game or game.get('locked') or game_id in due:
+                continue
+            if lock_epoch(game) != when:
+                # Lock time was changed after this entry was pushed
+                continue
+            due.append(game_id)
+        return due
+
+def lock_notice(matchups: list) -> str:
+    if len(matchups) == 1:
+        return f"🔒 **Betting closed** for {matchups[0]}!"
+    return "🔒 **Betting closed** for:\n" + "\n".join(f"• {matchup}" for matchup in matchups)
+
+@metrics.timed('betting_handler_seconds', kind='task', handler='lock_games')
+async def lock_games(game_ids: list):
+    """Lock every game in one save, then announce them (one message per channel)"""
+    with betting.transaction():
+        for game_id in game_ids:
+            betting.games[game_id]['locked'] = True
+            betting.mark_game(game_id)
+    
+    for game_id in game_ids:
+        game = betting.games[game_id]
+        channel = bot.get_channel(game['channel_id'])
+        if channel:
+            outbox.merge(channel, 'lock', f"{game['home_team']} vs {game['away_team']}", lock_notice)
+
+def post_game_card(channel, game_id: str):
+    """Queue a new game card; its message id is saved once it has been posted"""
+    game = betting.games[game_id]
+    embed = cards.render(game_id, game, betting.game_version(game_id))
+    view = BettingView(game_id, game)
+    role_id = betting.guild_config(channel.guild.id).get('bettor_role_id') if channel.guild else None
+    content = f"<@&{role_id}>" if role_id else None
+    
+    async def post(ch):
+        message = await ch.send(content=content, embed=embed, view=view)
+        # Store message ID for later editing
+        if game_id in betting.games:
+            betting.games[game_id]['message_id'] = message.id
+            betting.mark_game(game_id)
+            betting.save_data()
+        return message
+    
+    return outbox.submit(channel, post, POST)
+
+lock_scheduler = LockScheduler()
 
 @tasks.loop(minutes=15)
+@metrics.timed('betting_handler_seconds', kind='task', handler='auto_fetch_games')
 async def auto_fetch_games():
-    if not betting.config.get('auto_fetch_enabled') or not betting.config.get('betting_channel_id'):
-        return
-    
+    guild_ids = [gid for gid, config in betting.guild_configs.items()
+                 if config.get('auto_fetch_enabled') and config.get('betting_channel_id')]
+    if guild_ids:
+        await fetch_games(guild_ids)
+
+async def fetch_games(guild_ids: list):
+    """Post upcoming games to each guild's betting channel; the scoreboards are fetched once for all of them"""
     try:
-        async with aiohttp.ClientSession() as session:
-            # ESPN API for NFL games
-            async with session.get('https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard') as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    await process_games(data.get('events', []), 'NFL')
-            
-            # ESPN API for College Football games
-            async with session.get('https://site.api.espn.com/apis/site/v2/sports/football/college-football/scoreboard') as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    await process_games(data.get('events', []), 'CFB')
+        # ESPN API for NFL and College Football games, fetched together
+        boards = await scores.games(['nfl', 'college-football'])
+        for guild_id in guild_ids:
+            if boards['nfl']:
+                await process_games(boards['nfl'], 'NFL', guild_id)
+            if boards['college-football']:
+                await process_games(boards['college-football'], 'CFB', guild_id)
     except Exception as e:
         print(f"Error fetching games: {e}")
 
-async def process_games(events, sport):
-    channel_id = betting.config.get('betting_channel_id')
+async def process_games(espn_games, sport, guild_id):
+    config = betting.guild_config(guild_id)
+    channel_id = config.get('betting_channel_id')
     if not channel_id:
         return
     
@@ -357,64 +1109,30 @@ async def process_games(events, sport):
     if not channel:
         return
     
-    for event in events:
+    now = datetime.now(timezone.utc).timestamp()
+    for espn_game in espn_games:
         try:
-            if event['status']['type']['state'] != 'pre':
+            if espn_game.state != 'pre':
                 continue
             
-            game_time = datetime.fromisoformat(event['date'].replace('Z', '+00:00'))
-            time_until_game = (game_time - datetime.now(timezone.utc)).total_seconds()
+            time_until_game = espn_game.start - now
             
             # Only post games starting within 48 hours, but at least 5 minutes out
             if time_until_game < 300 or time_until_game > 172800:
                 continue
             
-            home_team = event['competitions'][0]['competitors'][0]['team']['abbreviation']
-            away_team = event['competitions'][0]['competitors'][1]['team']['abbreviation']
-            game_id = f"{home_team}_{away_team}_{int(game_time.timestamp())}"
+            home_team = espn_game.home_team
+            away_team = espn_game.away_team
+            game_time = datetime.fromtimestamp(espn_game.start, timezone.utc)
+            short_id = f"{home_team}_{away_team}_{espn_game.start}"
             
-            if game_id in betting.games:
+            # find_game_id also finds the same game stored unscoped, from before guilds
+            if betting.find_game_id(guild_id, short_id) in betting.games:
                 continue
+            game_id = scoped_game_id(guild_id, short_id)
             
-            # Try to get odds from ESPN
-            home_odds = -110.0
-            away_odds = -110.0
-            
-            try:
-                comp = event['competitions'][0]
-                odds_data = comp.get('odds', [])
-                
-                if odds_data and len(odds_data) > 0:
-                    first_odds = odds_data[0]
-                    
-                    # Method 1: Try homeTeamOdds/awayTeamOdds structure
-                    home_ml = first_odds.get('homeTeamOdds', {}).get('moneyLine')
-                    away_ml = first_odds.get('awayTeamOdds', {}).get('moneyLine')
-                    
-                    if home_ml:
-                        home_odds = float(home_ml)
-                    if away_ml:
-                        away_odds = float(away_ml)
-                    
-                    # Method 2: Try direct moneyline fields
-                    if not home_ml and 'homeMoneyLine' in first_odds:
-                        home_odds = float(first_odds['homeMoneyLine'])
-                    if not away_ml and 'awayMoneyLine' in first_odds:
-                        away_odds = float(first_odds['awayMoneyLine'])
-                    
-                    # Method 3: Try spread as fallback indicator
-                    if home_odds == -110.0 and away_odds == -110.0:
-                        spread = first_odds.get('spread')
-                        if spread and spread != 0:
-                            # Team with negative spread is favored
-                            if spread < 0:
-                                home_odds = -150.0
-                                away_odds = 130.0
-                            else:
-                                home_odds = 130.0
-                                away_odds = -150.0
-            except Exception as e:
-                print(f"Error parsing odds: {e}")
+            home_odds = espn_game.home_odds
+            away_odds = espn_game.away_odds
             
             betting.games[game_id] = {
                 'home_team': home_team,
@@ -426,64 +1144,16 @@ async def process_games(events, sport):
                 'result': None,
                 'channel_id': channel_id,
                 'sport': sport,
-                'espn_id': str(event.get('id')),
-                'league': 'nfl' if sport == 'NFL' else 'college-football'
+                'espn_id': espn_game.espn_id,
+                'league': espn_game.league,
+                'guild_id': str(guild_id)
             }
             betting.bets[game_id] = []
+            betting.mark_game(game_id)
             betting.save_data()
+            lock_scheduler.schedule(game_id)
             
-            emoji = "🏈" if sport == "NFL" else "🏟️"
-            embed = discord.Embed(
-                title=f"{emoji} {home_team} vs {away_team}",
-                description=f"**{sport}** • <t:{int(game_time.timestamp())}:R>",
-                color=0x00ff88
-            )
-            
-            # Odds section with better formatting
-            embed.add_field(
-                name="━━━━━━━━━━━━━━━━━━━━━━━",
-                value="\u200b",
-                inline=False
-            )
-            
-            # Color-code favorite (green) vs underdog (red)
-            home_syntax = "diff\n+" if home_odds < 0 else "diff\n-"
-            away_syntax = "diff\n+" if away_odds < 0 else "diff\n-"
-            
-            embed.add_field(
-                name=f"{home_team}",
-                value=f"```{home_syntax}{home_odds:+.0f}```",
-                inline=True
-            )
-            embed.add_field(
-                name="\u200b",
-                value="**VS**",
-                inline=True
-            )
-            embed.add_field(
-                name=f"{away_team}",
-                value=f"```{away_syntax}{away_odds:+.0f}```",
-                inline=True
-            )
-            
-            embed.add_field(
-                name="━━━━━━━━━━━━━━━━━━━━━━━",
-                value="\u200b",
-                inline=False
-            )
-            
-            embed.add_field(name="🕐 Kickoff", value=f"<t:{int(game_time.timestamp())}:F>", inline=False)
-            embed.set_footer(text=f"Game ID: {game_id}")
-            embed.timestamp = game_time
-            
-            view = BettingView(game_id, betting.games[game_id])
-            role_id = betting.config.get('bettor_role_id')
-            content = f"<@&{role_id}>" if role_id else None
-            message = await channel.send(content=content, embed=embed, view=view)
-            
-            # Store message ID for later editing
-            betting.games[game_id]['message_id'] = message.id
-            betting.save_data()
+            post_game_card(channel, game_id)
         except Exception as e:
             print(f"Error processing game: {e}")
 
@@ -502,10 +1172,11 @@ async def balance(ctx):
 @commands.has_permissions(administrator=True)
 async def setup(ctx, action: str = None):
     """Configure betting channel and auto-fetch (Admin only)"""
+    config = betting.guild_config(ctx.guild.id)
     if not action:
-        current_channel = betting.config.get('betting_channel_id')
-        auto_enabled = betting.config.get('auto_fetch_enabled', False)
-        bettor_role = betting.config.get('bettor_role_id')
+        current_channel = config.get('betting_channel_id')
+        auto_enabled = config.get('auto_fetch_enabled', False)
+        bettor_role = config.get('bettor_role_id')
         
         embed = discord.Embed(title="⚙️ Bot Configuration", color=0x95a5a6)
         embed.add_field(
@@ -533,7 +1204,8 @@ async def setup(ctx, action: str = None):
     action = action.lower()
     
     if action == 'setchannel':
-        betting.config['betting_channel_id'] = ctx.channel.id
+        config['betting_channel_id'] = ctx.channel.id
+        betting.mark_guild_config(ctx.guild.id)
         betting.save_data()
         await ctx.send(f"✅ Betting channel set to {ctx.channel.mention}!")
     
@@ -541,11 +1213,11 @@ async def setup(ctx, action: str = None):
         await ctx.send("❌ Usage: `!setup autofetch on` or `!setup autofetch off`")
     
     elif action == 'fetch':
-        if not betting.config.get('betting_channel_id'):
+        if not config.get('betting_channel_id'):
             await ctx.send("❌ Set a betting channel first with `!setup setchannel`")
             return
         await ctx.send("🔄 Fetching upcoming games...")
-        await auto_fetch_games()
+        await fetch_games([ctx.guild.id])
         await ctx.send("✅ Games fetched!")
     
     else:
@@ -560,7 +1232,8 @@ async def autofetch_toggle(ctx, status: str):
         await ctx.send("❌ Use: `!setup autofetch on` or `!setup autofetch off`")
         return
     
-    betting.config['auto_fetch_enabled'] = (status == 'on')
+    betting.guild_config(ctx.guild.id)['auto_fetch_enabled'] = (status == 'on')
+    betting.mark_guild_config(ctx.guild.id)
     betting.save_data()
     
     if status == 'on':
@@ -591,21 +1264,26 @@ class SetupView(discord.ui.View):
         role_select.callback = self.role_callback
         self.add_item(role_select)
     
+    @metrics.timed('betting_handler_seconds', kind='view', handler='SetupView.channel')
     async def channel_callback(self, interaction: discord.Interaction):
         channel = interaction.data['values'][0]
-        betting.config['betting_channel_id'] = int(channel)
+        betting.guild_config(interaction.guild_id)['betting_channel_id'] = int(channel)
+        betting.mark_guild_config(interaction.guild_id)
         betting.save_data()
         await interaction.response.send_message(f"✅ Betting channel set to <#{channel}>!", ephemeral=True)
     
+    @metrics.timed('betting_handler_seconds', kind='view', handler='SetupView.role')
     async def role_callback(self, interaction: discord.Interaction):
         values = interaction.data.get('values', [])
         if values:
             role = values[0]
-            betting.config['bettor_role_id'] = int(role)
+            betting.guild_config(interaction.guild_id)['bettor_role_id'] = int(role)
+            betting.mark_guild_config(interaction.guild_id)
             betting.save_data()
             await interaction.response.send_message(f"✅ Bettor role set to <@&{role}>!", ephemeral=True)
         else:
-            betting.config['bettor_role_id'] = None
+            betting.guild_config(interaction.guild_id)['bettor_role_id'] = None
+            betting.mark_guild_config(interaction.guild_id)
             betting.save_data()
             await interaction.response.send_message("✅ Bettor role removed!", ephemeral=True)
     
@@ -617,25 +1295,28 @@ class SetupView(discord.ui.View):
             discord.SelectOption(label="Fetch Games Now", value="fetch", emoji="🔄", description="Manually fetch games right now"),
         ]
     )
+    @metrics.timed('betting_handler_seconds', kind='view', handler='SetupView.settings')
     async def settings_select(self, interaction: discord.Interaction, select: discord.ui.Select):
         action = select.values[0]
         
         if action == "autofetch_on":
-            betting.config['auto_fetch_enabled'] = True
+            betting.guild_config(interaction.guild_id)['auto_fetch_enabled'] = True
+            betting.mark_guild_config(interaction.guild_id)
             betting.save_data()
             await interaction.response.send_message("✅ Auto-fetch enabled! Games will be fetched every 15 minutes.", ephemeral=True)
         
         elif action == "autofetch_off":
-            betting.config['auto_fetch_enabled'] = False
+            betting.guild_config(interaction.guild_id)['auto_fetch_enabled'] = False
+            betting.mark_guild_config(interaction.guild_id)
             betting.save_data()
             await interaction.response.send_message("❌ Auto-fetch disabled.", ephemeral=True)
         
         elif action == "fetch":
-            if not betting.config.get('betting_channel_id'):
+            if not betting.guild_config(interaction.guild_id).get('betting_channel_id'):
                 await interaction.response.send_message("❌ Set a betting channel first!", ephemeral=True)
                 return
             await interaction.response.send_message("🔄 Fetching upcoming games...", ephemeral=True)
-            await auto_fetch_games()
+            await fetch_games([interaction.guild_id])
 
 # Betting View with Buttons
 class BetModal(discord.ui.Modal, title="Place Your Bet"):
@@ -652,6 +1333,7 @@ class BetModal(discord.ui.Modal, title="Place Your Bet"):
         max_length=10
     )
     
+    @metrics.timed('betting_handler_seconds', kind='modal', handler='BetModal')
     async def on_submit(self, interaction: discord.Interaction):
         user_id = str(interaction.user.id)
         
@@ -674,52 +1356,51 @@ class BetModal(discord.ui.Modal, title="Place Your Bet"):
             await interaction.response.send_message("🔒 Betting is closed for this game!", ephemeral=True)
             return
         
-        balance = betting.get_balance(user_id)
-        if bet_amount > balance:
-            await interaction.response.send_message(f"❌ You only have ${balance:,}!", ephemeral=True)
-            return
-        
-        existing_bet = next((b for b in betting.bets[self.game_id] if b['user_id'] == user_id), None)
-        if existing_bet:
-            await interaction.response.send_message("❌ You already have a bet on this game!", ephemeral=True)
-            return
-        
-        betting.update_balance(user_id, -bet_amount)
-        betting.users[user_id]['total_wagered'] += bet_amount
-        
-        odds = game['home_odds'] if self.team == 'home' else game['away_odds']
-        potential_win = bet_amount * (1 + abs(odds) / 100) if odds > 0 else bet_amount * (1 + 100 / abs(odds))
-        
-        # Check for power-ups
-        has_2x = betting.users[user_id].get('inventory', {}).get('2x_multiplier', 0) > 0
-        has_insurance = betting.users[user_id].get('inventory', {}).get('insurance', 0) > 0
-        
-        used_items = []
-        if has_2x:
-            potential_win *= 2
-            betting.users[user_id]['inventory']['2x_multiplier'] -= 1
-            used_items.append('2x_multiplier')
-        
-        if has_insurance:
-            betting.users[user_id]['inventory']['insurance'] -= 1
-            used_items.append('insurance')
-        
-        betting.bets[self.game_id].append({
-            'user_id': user_id,
-            'team': self.team,
-            'amount': bet_amount,
-            'odds': odds,
-            'potential_win': potential_win,
-            'used_items': used_items
-        })
-        betting.save_data()
+        async with betting.locked(user_id):
+            existing_bet = betting.get_user_bet(self.game_id, user_id)
+            if existing_bet:
+                await interaction.response.send_message("❌ You already have a bet on this game!", ephemeral=True)
+                return
+            
+            if not betting.debit(user_id, bet_amount, 'stake', self.game_id):
+                await interaction.response.send_message(f"❌ You only have ${betting.get_balance(user_id):,}!", ephemeral=True)
+                return
+            
+            with betting.transaction():
+                betting.users[user_id]['total_wagered'] += bet_amount
+            
+                odds = game['home_odds'] if self.team == 'home' else game['away_odds']
+            
+                # Check for power-ups
+                has_2x = betting.users[user_id].get('inventory', {}).get('2x_multiplier', 0) > 0
+                has_insurance = betting.users[user_id].get('inventory', {}).get('insurance', 0) > 0
+                potential_win = potential_payout(bet_amount, odds, doubled=has_2x)
+            
+                used_items = []
+                if has_2x:
+                    betting.users[user_id]['inventory']['2x_multiplier'] -= 1
+                    used_items.append('2x_multiplier')
+            
+                if has_insurance:
+                    betting.users[user_id]['inventory']['insurance'] -= 1
+                    used_items.append('insurance')
+            
+                betting.add_bet(self.game_id, {
+                    'user_id': user_id,
+                    'team': self.team,
+                    'amount': bet_amount,
+                    'odds': odds,
+                    'potential_win': potential_win,
+                    'used_items': used_items
+                })
+                betting.mark_user(user_id)
         
         team_name = game['home_team'] if self.team == 'home' else game['away_team']
         
         embed = discord.Embed(title="✅ Bet Confirmed!", color=0x2ecc71)
         embed.add_field(name="🎯 Your Pick", value=f"**{team_name}**", inline=False)
         embed.add_field(name="💵 Wagered", value=f"${bet_amount:,}", inline=True)
-        embed.add_field(name="💰 Potential Win", value=f"${potential_win:,.2f}", inline=True)
+        embed.add_field(name="💰 Potential Win", value=f"${potential_win:,}", inline=True)
         embed.add_field(name="📊 Odds", value=f"{odds:+.0f}", inline=True)
         
         if used_items:
@@ -772,13 +1453,20 @@ class BettingView(discord.ui.View):
         view_button.callback = self.view_bets_callback
         self.add_item(view_button)
         
+    @staticmethod
+    def card_game_id(interaction: discord.Interaction) -> str:
+        shown = interaction.message.embeds[0].footer.text.replace("Game ID: ", "").split(" •")[0]
+        return betting.find_game_id(interaction.guild_id, shown)
+    
+    @metrics.timed('betting_handler_seconds', kind='view', handler='BettingView.bet_home')
     async def bet_home_callback(self, interaction: discord.Interaction):
-        game_id = interaction.message.embeds[0].footer.text.replace("Game ID: ", "")
+        game_id = self.card_game_id(interaction)
         modal = BetModal(game_id, 'home', betting.games.get(game_id, {}))
         await interaction.response.send_modal(modal)
     
+    @metrics.timed('betting_handler_seconds', kind='view', handler='BettingView.bet_away')
     async def bet_away_callback(self, interaction: discord.Interaction):
-        game_id = interaction.message.embeds[0].footer.text.replace("Game ID: ", "")
+        game_id = self.card_game_id(interaction)
         modal = BetModal(game_id, 'away', betting.games.get(game_id, {}))
         await interaction.response.send_modal(modal)
     
@@ -786,8 +1474,9 @@ class BettingView(discord.ui.View):
         modal = BetModal(game_id, 'home', betting.games.get(game_id, {}))
         await interaction.response.send_modal(modal)
     
+    @metrics.timed('betting_handler_seconds', kind='view', handler='BettingView.view_bets')
     async def view_bets_callback(self, interaction: discord.Interaction):
-        game_id = interaction.message.embeds[0].footer.text.replace("Game ID: ", "").split(" •")[0]
+        game_id = self.card_game_id(interaction)
         game = betting.games.get(game_id)
         if not game:
             await interaction.response.send_message("❌ Game not found!", ephemeral=True)
@@ -798,24 +1487,20 @@ class BettingView(discord.ui.View):
             await interaction.response.send_message("📭 No bets placed yet!", ephemeral=True)
             return
         
-        async def get_user_display(uid: str):
-            try:
-                if interaction.guild:
-                    m = interaction.guild.get_member(int(uid))
-                    if m:
-                        return m.mention
-                u = await bot.fetch_user(int(uid))
-                return u.mention
-            except:
-                return f"User {uid}"
+        display_names = await names.resolve_many([b['user_id'] for b in bets_list], interaction.guild)
+        
+        def get_user_display(uid: str):
+            if interaction.guild and interaction.guild.get_member(int(uid)):
+                return f"<@{uid}>"
+            return display_names[uid]
         
         home_bets = [b for b in bets_list if b['team'] == 'home']
         away_bets = [b for b in bets_list if b['team'] == 'away']
         
-        async def build_lines(bets):
+        def build_lines(bets):
             lines = []
             for b in sorted(bets, key=lambda x: x.get('amount', 0), reverse=True):
-                who = await get_user_display(b['user_id'])
+                who = get_user_display(b['user_id'])
                 lines.append(f"{who} — ${b['amount']:,} @ {b['odds']:+.0f}")
             return lines
         
@@ -834,8 +1519,8 @@ class BettingView(discord.ui.View):
                 chunks.append(cur.rstrip())
             return chunks
         
-        home_lines = await build_lines(home_bets)
-        away_lines = await build_lines(away_bets)
+        home_lines = build_lines(home_bets)
+        away_lines = build_lines(away_bets)
         
         embed = discord.Embed(title="📊 Current Bets", color=0x9b59b6)
         embed.add_field(name="💰 Total Action", value=f"${sum(b['amount'] for b in bets_list):,}", inline=False)
@@ -853,19 +1538,75 @@ class BettingView(discord.ui.View):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-@bot.command(name='leaderboard')
-async def leaderboard(ctx):
-    """Show the richest bettors"""
-    sorted_users = sorted(betting.users.items(), key=lambda x: x[1]['balance'], reverse=True)[:10]
-    embed = discord.Embed(title="🏆 Leaderboard", color=0xf1c40f)
+LEADERBOARD_PAGE_SIZE = 10
+
+async def build_leaderboard_embed(page: int, viewer_id: str, guild=None, by: str = 'balance'):
+    """One page of the leaderboard (by balance or net profit) plus the viewer's own rank"""
+    await betting.ready()
+    total = len(betting.ranking)
+    pages = max(1, -(-total // LEADERBOARD_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+    
+    title = "🏆 Leaderboard" if by == 'balance' else "📈 Profit Leaderboard"
+    embed = discord.Embed(title=title, color=0xf1c40f)
     desc = ""
-    for i, (user_id, data) in enumerate(sorted_users, 1):
-        user = await bot.fetch_user(int(user_id))
-        desc += f"{i}. **{user.name}** - ${data['balance']:,}\n"
+    top_users = betting.top_users(LEADERBOARD_PAGE_SIZE, offset, by)
+    display_names = await names.resolve_many([user_id for user_id, _ in top_users], guild)
+    for i, (user_id, value) in enumerate(top_users, offset + 1):
+        amount = f"${value:,}" if by == 'balance' else f"{'+' if value >= 0 else '-'}${abs(value):,}"
+        desc += f"{i}. **{display_names[user_id]}** - {amount}\n"
     embed.description = desc or "No users yet!"
+    
+    rank = betting.user_rank(viewer_id, by)
+    rank_text = f"Your rank: #{rank:,} of {total:,} • " if rank else ""
+    embed.set_footer(text=f"{rank_text}Page {page}/{pages}")
+    return embed
+
+@bot.command(name='leaderboard')
+async def leaderboard(ctx, page: int = 1, by: str = 'balance'):
+    """Show the richest bettors (or the most profitable: !leaderboard 1 profit)"""
+    by = 'profit' if by.lower() == 'profit' else 'balance'
+    embed = await build_leaderboard_embed(page, str(ctx.author.id), ctx.guild, by)
     await ctx.send(embed=embed)
 
-@bot.command(name='shop')
+def build_stats_embed(user_id: str, name: str):
+    """A user's settled-bet stats, read from the totals kept at settlement"""
+    # Looking must not open an account (and a ledger entry) for someone who never played
+    user = betting.users.get(user_id, {})
+    embed = discord.Embed(title=f"📊 Stats for {name}", color=0x3498db)
+    stats = user.get('stats')
+    if not stats or not stats['bets']:
+        embed.description = "No settled bets yet!"
+        return embed
+
+    derived = rates(stats)
+    streak = stats['streak']
+    streak_text = f"{abs(streak)} {'W' if streak > 0 else 'L'}"
+    embed.add_field(name="Net Profit", value=f"{'+' if stats['profit'] >= 0 else '-'}${abs(stats['profit']):,}", inline=True)
+    embed.add_field(name="ROI", value=f"{derived['roi']:+.1%}", inline=True)
+    embed.add_field(name="Record", value=f"{stats['wins']}W - {stats['losses']}L ({derived['win_rate']:.0%})", inline=True)
+    embed.add_field(name="Staked", value=f"${stats['staked']:,}", inline=True)
+    average_odds = derived['average_odds']
+    embed.add_field(name="Average Odds", value=f"{average_odds:+.0f}" if average_odds is not None else "None", inline=True)
+    embed.add_field(name="Streak", value=f"{streak_text} (best {stats['best_streak']} W, worst {stats['worst_streak']} L)", inline=True)
+    rank = betting.user_rank(user_id, 'profit')
+    if rank:
+        embed.set_footer(text=f"Profit rank: #{rank:,} of {len(betting.profit_ranking):,}")
+
+    lines = [f"**{league}**: {wins}/{bets} won, {'+' if profit >= 0 else '-'}${abs(profit):,}"
+             for league, bets, wins, _, profit in breakdown(user, 'league')]
+    if lines:
+        embed.add_field(name="By League", value="\n".join(lines[:10]), inline=False)
+    return embed
+
+@bot.command(name='stats')
+async def stats_cmd(ctx, member: discord.Member = None):
+    """Profit, ROI and streaks from your settled bets"""
+    member = member or ctx.author
+    await ctx.send(embed=build_stats_embed(str(member.id), member.display_name))
+
+@bot.command(name='shop', extras=NO_USERS)
 async def shop(ctx):
     """View the shop"""
     embed = discord.Embed(title="🏪 Shop", color=0xf1c40f)
@@ -891,7 +1632,6 @@ async def shop(ctx):
 async def buy(ctx, *, item: str):
     """Buy an item from the shop"""
     user_id = str(ctx.author.id)
-    balance = betting.get_balance(user_id)
     item = item.lower()
     
     shop_items = {
@@ -908,18 +1648,18 @@ async def buy(ctx, *, item: str):
     item_data = shop_items[item]
     price = item_data['price']
     
-    if balance < price:
-        await ctx.send(f"❌ You need ${price:,} but only have ${balance:,}!")
-        return
-    
-    betting.update_balance(user_id, -price)
-    
-    # Add to inventory
-    if 'inventory' not in betting.users[user_id]:
-        betting.users[user_id]['inventory'] = {}
-    
-    inv_name = item_data['name']
-    betting.users[user_id]['inventory'][inv_name] = betting.users[user_id]['inventory'].get(inv_name, 0) + 1
+    async with betting.locked(user_id):
+        if not betting.debit(user_id, price, 'purchase', item_data['name']):
+            await ctx.send(f"❌ You need ${price:,} but only have ${betting.get_balance(user_id):,}!")
+            return
+        
+        # Add to inventory
+        if 'inventory' not in betting.users[user_id]:
+            betting.users[user_id]['inventory'] = {}
+        
+        inv_name = item_data['name']
+        betting.users[user_id]['inventory'][inv_name] = betting.users[user_id]['inventory'].get(inv_name, 0) + 1
+        betting.mark_user(user_id)
     betting.save_data()
     
     await ctx.send(f"✅ Purchased {item_data['display']} for ${price:,}!")
@@ -955,21 +1695,23 @@ async def daily(ctx):
     user_id = str(ctx.author.id)
     betting.get_balance(user_id)
     
-    last_daily = betting.users[user_id].get('last_daily')
-    now = datetime.now(timezone.utc)
-    
-    if last_daily:
-        last_claim = datetime.fromisoformat(last_daily)
-        time_diff = (now - last_claim).total_seconds()
+    async with betting.locked(user_id):
+        last_daily = betting.users[user_id].get('last_daily')
+        now = datetime.now(timezone.utc)
         
-        if time_diff < 86400:  # 24 hours
-            hours_left = (86400 - time_diff) / 3600
-            await ctx.send(f"⏰ Daily already claimed! Come back in {hours_left:.1f} hours.")
-            return
-    
-    daily_amount = 250
-    betting.update_balance(user_id, daily_amount)
-    betting.users[user_id]['last_daily'] = now.isoformat()
+        if last_daily:
+            last_claim = datetime.fromisoformat(last_daily)
+            time_diff = (now - last_claim).total_seconds()
+            
+            if time_diff < 86400:  # 24 hours
+                hours_left = (86400 - time_diff) / 3600
+                await ctx.send(f"⏰ Daily already claimed! Come back in {hours_left:.1f} hours.")
+                return
+        
+        daily_amount = 250
+        betting.update_balance(user_id, daily_amount, 'daily')
+        betting.users[user_id]['last_daily'] = now.isoformat()
+        betting.mark_user(user_id)
     betting.save_data()
     
     await ctx.send(f"💰 Claimed your daily bonus of ${daily_amount}! New balance: ${betting.users[user_id]['balance']:,}")
@@ -978,17 +1720,15 @@ async def daily(ctx):
 async def slots(ctx, amount: int):
     """Spin the slot machine"""
     user_id = str(ctx.author.id)
-    balance = betting.get_balance(user_id)
     
     if amount < 10:
         await ctx.send("❌ Minimum bet is $10!")
         return
     
-    if amount > balance:
-        await ctx.send(f"❌ You only have ${balance:,}!")
-        return
-    
-    betting.update_balance(user_id, -amount)
+    async with betting.locked(user_id):
+        if not betting.debit(user_id, amount, 'slots'):
+            await ctx.send(f"❌ You only have ${betting.get_balance(user_id):,}!")
+            return
     
     import random
     emojis = ['🍒', '🍋', '🍊', '🍇', '💎', '7️⃣']
@@ -1012,7 +1752,7 @@ async def slots(ctx, amount: int):
         winnings = 0
     
     if winnings > 0:
-        betting.update_balance(user_id, winnings)
+        betting.update_balance(user_id, winnings, 'slots')
         result = f"**WIN!** You won ${winnings:,}! 💰"
     else:
         result = "**LOST!** Better luck next time! 😢"
@@ -1038,18 +1778,14 @@ async def send(ctx, member: discord.Member, amount: int):
         await ctx.send("❌ Amount must be at least $1!")
         return
     
-    balance = betting.get_balance(sender_id)
-    if amount > balance:
-        await ctx.send(f"❌ You only have ${balance:,}!")
-        return
-    
-    betting.update_balance(sender_id, -amount)
-    betting.get_balance(receiver_id)
-    betting.update_balance(receiver_id, amount)
+    async with betting.locked(sender_id, receiver_id):
+        if not betting.transfer(sender_id, receiver_id, amount):
+            await ctx.send(f"❌ You only have ${betting.get_balance(sender_id):,}!")
+            return
     
     await ctx.send(f"✅ Sent ${amount:,} to {member.mention}!")
 
-@bot.command(name='creategame')
+@bot.command(name='creategame', extras=NO_USERS)
 @commands.has_permissions(manage_messages=True)
 async def creategame(ctx):
     """Create a game from live/upcoming matchups"""
@@ -1059,6 +1795,7 @@ async def creategame(ctx):
 async def bet(ctx, game_id: str, team_choice: str, amount: int):
     """Place a bet on a game"""
     user_id = str(ctx.author.id)
+    game_id = betting.find_game_id(ctx.guild.id if ctx.guild else None, game_id)
     
     if game_id not in betting.games:
         await ctx.send("❌ Game not found!")
@@ -1083,29 +1820,28 @@ async def bet(ctx, game_id: str, team_choice: str, amount: int):
         await ctx.send("❌ Minimum bet is $10!")
         return
     
-    balance = betting.get_balance(user_id)
-    if amount > balance:
-        await ctx.send(f"❌ You only have ${balance:,}!")
-        return
-    
-    existing_bet = next((b for b in betting.bets[game_id] if b['user_id'] == user_id), None)
-    if existing_bet:
-        await ctx.send("❌ You already have a bet on this game!")
-        return
-    
-    betting.update_balance(user_id, -amount)
-    betting.users[user_id]['total_wagered'] += amount
-    
-    odds = game['home_odds'] if team_choice == 'home' else game['away_odds']
-    potential_win = amount * (1 + abs(odds) / 100) if odds > 0 else amount * (1 + 100 / abs(odds))
-    
-    betting.bets[game_id].append({
-        'user_id': user_id,
-        'team': team_choice,
-        'amount': amount,
-        'odds': odds,
-        'potential_win': potential_win
-    })
+    async with betting.locked(user_id):
+        existing_bet = betting.get_user_bet(game_id, user_id)
+        if existing_bet:
+            await ctx.send("❌ You already have a bet on this game!")
+            return
+        
+        if not betting.debit(user_id, amount, 'stake', game_id):
+            await ctx.send(f"❌ You only have ${betting.get_balance(user_id):,}!")
+            return
+        betting.users[user_id]['total_wagered'] += amount
+        
+        odds = game['home_odds'] if team_choice == 'home' else game['away_odds']
+        potential_win = potential_payout(amount, odds)
+        
+        betting.add_bet(game_id, {
+            'user_id': user_id,
+            'team': team_choice,
+            'amount': amount,
+            'odds': odds,
+            'potential_win': potential_win
+        })
+        betting.mark_user(user_id)
     betting.save_data()
     
     team_name = game['home_team'] if team_choice == 'home' else game['away_team']
@@ -1122,7 +1858,7 @@ async def bet(ctx, game_id: str, team_choice: str, amount: int):
     bet_embed = discord.Embed(title="✅ Bet Placed!", color=0x2ecc71)
     bet_embed.add_field(name="Your Pick", value=team_name, inline=True)
     bet_embed.add_field(name="Wagered", value=f"${amount:,}", inline=True)
-    bet_embed.add_field(name="Potential Win", value=f"${potential_win:,.2f}", inline=True)
+    bet_embed.add_field(name="Potential Win", value=f"${potential_win:,}", inline=True)
     
     await ctx.send(embeds=[game_embed, bet_embed])
 
@@ -1132,16 +1868,11 @@ async def mybets(ctx):
     user_id = str(ctx.author.id)
     active_bets = []
     
-    for game_id, bets in betting.bets.items():
-        # Skip if game was deleted
-        if game_id not in betting.games:
-            continue
-            
-        user_bet = next((b for b in bets if b['user_id'] == user_id), None)
-        if user_bet and not betting.games[game_id].get('result'):
-            game = betting.games[game_id]
+    for game_id, user_bet in betting.open_bets_for_user(user_id):
+        game = betting.games.get(game_id)
+        if game:
             team_name = game['home_team'] if user_bet['team'] == 'home' else game['away_team']
-            active_bets.append(f"**{game['home_team']} vs {game['away_team']}**\n└ {team_name} - ${user_bet['amount']:,} → ${user_bet['potential_win']:,.2f}")
+            active_bets.append(f"**{game['home_team']} vs {game['away_team']}**\n└ {team_name} - ${user_bet['amount']:,} → ${int(user_bet['potential_win']):,}")
     
     embed = discord.Embed(title="🎲 Your Active Bets", color=0x9b59b6)
     embed.description = "\n\n".join(active_bets) if active_bets else "No active bets!"
@@ -1150,7 +1881,7 @@ async def mybets(ctx):
 @bot.command(name='games')
 async def games(ctx):
     """List all active games"""
-    active_games = [(gid, g) for gid, g in betting.games.items() if not g.get('result')]
+    active_games = [(gid, g) for gid, g in betting.guild_games(ctx.guild.id if ctx.guild else None) if not g.get('result')]
     
     if not active_games:
         await ctx.send("No active games right now!")
@@ -1161,7 +1892,7 @@ async def games(ctx):
         status = "🔒 Locked" if game['locked'] else "✅ Open"
         embed.add_field(
             name=f"{game['home_team']} vs {game['away_team']}",
-            value=f"{status} | {game['home_odds']:+.1f} / {game['away_odds']:+.1f}\nID: `{game_id}`",
+            value=f"{status} | {game['home_odds']:+.1f} / {game['away_odds']:+.1f}\nID: `{display_game_id(game_id)}`",
             inline=False
         )
     await ctx.send(embed=embed)
@@ -1170,6 +1901,7 @@ async def games(ctx):
 @commands.has_permissions(manage_messages=True)
 async def result(ctx, game_id: str, winner: str):
     """Set game result (home/away)"""
+    game_id = betting.find_game_id(ctx.guild.id if ctx.guild else None, game_id)
     if game_id not in betting.games:
         await ctx.send("❌ Game not found!")
         return
@@ -1181,22 +1913,12 @@ async def result(ctx, game_id: str, winner: str):
         await ctx.send("❌ Winner must be 'home' or 'away'!")
         return
     
-    game['result'] = winner
-    game['locked'] = True
-    
-    payouts = []
-    for bet in betting.bets[game_id]:
-        user_id = bet['user_id']
-        if bet['team'] == winner:
-            payout = bet['potential_win']
-            betting.update_balance(user_id, int(payout))
-            betting.users[user_id]['wins'] += 1
-            payouts.append((user_id, payout, True))
-        else:
-            betting.users[user_id]['losses'] += 1
-            payouts.append((user_id, 0, False))
-    
-    betting.save_data()
+    async with betting.locked(*betting.game_bettors.get(game_id, {})):
+        payouts = betting.settle_game(game_id, winner)
+    if payouts is None:
+        await ctx.send("❌ This game is already settled!")
+        return
+    await betting.flush()
     
     winner_team = game['home_team'] if winner == 'home' else game['away_team']
     embed = discord.Embed(title="🎉 Game Result", color=0x2ecc71)
@@ -1205,12 +1927,19 @@ async def result(ctx, game_id: str, winner: str):
     
     winners_text = ""
     losers_text = ""
-    for user_id, payout, won in payouts:
-        user = await bot.fetch_user(int(user_id))
+    display_names = await names.resolve_many([p[0] for p in payouts], ctx.guild)
+    for user_id, payout, won, items in payouts:
+        name = display_names[user_id]
         if won:
-            winners_text += f"✅ {user.name}: +${payout:,.2f}\n"
+            bonus_text = " (2x!)" if '2x_multiplier' in items else ""
+            winners_text += f"✅ {name}: +${payout:,}{bonus_text}\n"
         else:
-            losers_text += f"❌ {user.name}\n"
+            if '2x_penalty' in items:
+                losers_text += f"❌ {name}: -${abs(payout):,} (2x penalty!)\n"
+            elif 'insurance' in items:
+                losers_text += f"❌ {name}: +${payout:,} (insurance)\n"
+            else:
+                losers_text += f"❌ {name}\n"
     
     if winners_text:
         embed.add_field(name="Winners", value=winners_text, inline=True)
@@ -1219,7 +1948,7 @@ async def result(ctx, game_id: str, winner: str):
     
     await ctx.send(embed=embed)
 
-@bot.command(name='help')
+@bot.command(name='help', extras=NO_USERS)
 async def help_cmd(ctx):
     """Show all commands"""
     embed = discord.Embed(title="🎰 Sports Betting Bot Commands", color=0x3498db)
@@ -1229,7 +1958,10 @@ async def help_cmd(ctx):
     `/balance` or `!balance` - Check your balance and stats
     `/mybets` or `!mybets` - View your active bets
     `/games` or `!games` - List all active games
-    `/leaderboard` or `!leaderboard` - Top 10 richest bettors
+    `/leaderboard` or `!leaderboard` - Top 10 richest bettors (or by profit)
+    `/stats` or `!stats` - Profit, ROI and streaks
+    `/history` - Your settled bets
+    `/record <team> [opponent]` - A team's record, or head-to-head
     
     **Placing Bets**
     Click the buttons on game embeds to place bets!
@@ -1243,6 +1975,8 @@ async def help_cmd(ctx):
     `!setup setchannel` - Set betting channel
     `!setup autofetch on/off` - Toggle auto-fetch
     `!setup fetch` - Manually fetch games
+    `/perf` - Command latency, saves and task health
+    `/ledger @user` - Audit a balance against the ledger
     
     **Game Management (Manage Messages)**
     `!creategame <home> <away> <home_odds> <away_odds> <time>`
@@ -1262,9 +1996,10 @@ async def help_cmd(ctx):
 @bot.tree.command(name="setup", description="Configure bot settings (Admin only)")
 @discord.app_commands.checks.has_permissions(administrator=True)
 async def slash_setup(interaction: discord.Interaction):
-    current_channel = betting.config.get('betting_channel_id')
-    auto_enabled = betting.config.get('auto_fetch_enabled', False)
-    bettor_role = betting.config.get('bettor_role_id')
+    config = betting.guild_config(interaction.guild_id)
+    current_channel = config.get('betting_channel_id')
+    auto_enabled = config.get('auto_fetch_enabled', False)
+    bettor_role = config.get('bettor_role_id')
     
     embed = discord.Embed(title="⚙️ Bot Configuration", color=0x95a5a6)
     embed.add_field(
@@ -1298,19 +2033,60 @@ async def slash_balance(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="leaderboard", description="Show the richest bettors")
-async def slash_leaderboard(interaction: discord.Interaction):
-    sorted_users = sorted(betting.users.items(), key=lambda x: x[1]['balance'], reverse=True)[:10]
-    embed = discord.Embed(title="🏆 Leaderboard", color=0xf1c40f)
-    desc = ""
-    for i, (user_id, data) in enumerate(sorted_users, 1):
-        user = await bot.fetch_user(int(user_id))
-        desc += f"{i}. **{user.name}** - ${data['balance']:,}\n"
-    embed.description = desc or "No users yet!"
+async def slash_leaderboard(interaction: discord.Interaction, page: int = 1,
+                            by: Literal['balance', 'profit'] = 'balance'):
+    embed = await build_leaderboard_embed(page, str(interaction.user.id), interaction.guild, by)
     await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="stats", description="Profit, ROI and streaks from settled bets")
+async def slash_stats(interaction: discord.Interaction, member: Optional[discord.Member] = None):
+    member = member or interaction.user
+    await interaction.response.send_message(embed=build_stats_embed(str(member.id), member.display_name))
+
+@bot.tree.command(name="history", description="Your settled bets", extras=NO_USERS)
+async def slash_history(interaction: discord.Interaction):
+    await interaction.response.defer()
+    # Archive scans read from disk, so keep them off the event loop
+    rows = await asyncio.get_running_loop().run_in_executor(
+        None, betting.archive.user_history, str(interaction.user.id), 10)
+
+    lines = []
+    for row in rows:
+        result = "✅" if row['won'] else "❌"
+        day = datetime.fromtimestamp(row['start_time'], timezone.utc).strftime('%b %d')
+        lines.append(f"{result} **{row['team']}** vs {row['opponent']} ({day}) - ${row['amount']:,} → {row['profit']:+,.2f}")
+
+    embed = discord.Embed(title="📜 Your Bet History", color=0x9b59b6)
+    embed.description = "\n".join(lines) if lines else "No settled bets yet!"
+    await interaction.followup.send(embed=embed)
+
+@bot.tree.command(name="record", description="A team's record, or head-to-head against an opponent", extras=NO_USERS)
+async def slash_record(interaction: discord.Interaction, team: str, opponent: Optional[str] = None):
+    await interaction.response.defer()
+    loop = asyncio.get_running_loop()
+
+    if opponent:
+        h2h = await loop.run_in_executor(None, betting.archive.head_to_head, team, opponent)
+        embed = discord.Embed(title=f"⚔️ {team} vs {opponent}", color=0xe67e22)
+        wins = h2h['wins']
+        embed.description = f"**{wins.get(team, 0)} - {wins.get(opponent, 0)}** in {len(h2h['games'])} games"
+        for game in h2h['games'][-5:]:
+            winner = game['home_team'] if game['winner'] == 'home' else game['away_team']
+            day = datetime.fromtimestamp(game['start_time'], timezone.utc).strftime('%b %d, %Y')
+            score = f" {game['home_score']}-{game['away_score']}" if game['home_score'] is not None else ""
+            embed.add_field(name=f"{game['home_team']} vs {game['away_team']}", value=f"{day}: {winner}{score}", inline=False)
+    else:
+        stats = await loop.run_in_executor(None, betting.archive.team_stats, team)
+        embed = discord.Embed(title=f"📊 {team}", color=0xe67e22)
+        embed.add_field(name="Record", value=f"{stats['wins']} - {stats['losses']}", inline=True)
+        embed.add_field(name="Bets", value=f"{stats['bets']:,} (${stats['wagered']:,})", inline=True)
+        embed.add_field(name="Bettor Profit", value=f"{stats['bettor_profit']:+,.2f}", inline=True)
+    await interaction.followup.send(embed=embed)
+
 @bot.tree.command(name="bet", description="Place a bet on a game")
 async def slash_bet(interaction: discord.Interaction, game_id: str, team: str, amount: int):
     user_id = str(interaction.user.id)
+    game_id = betting.find_game_id(interaction.guild_id, game_id)
     
     if game_id not in betting.games:
         await interaction.response.send_message("❌ Game not found!", ephemeral=True)
@@ -1335,29 +2111,28 @@ async def slash_bet(interaction: discord.Interaction, game_id: str, team: str, a
         await interaction.response.send_message("❌ Minimum bet is $10!", ephemeral=True)
         return
     
-    balance = betting.get_balance(user_id)
-    if amount > balance:
-        await interaction.response.send_message(f"❌ You only have ${balance:,}!", ephemeral=True)
-        return
-    
-    existing_bet = next((b for b in betting.bets[game_id] if b['user_id'] == user_id), None)
-    if existing_bet:
-        await interaction.response.send_message("❌ You already have a bet on this game!", ephemeral=True)
-        return
-    
-    betting.update_balance(user_id, -amount)
-    betting.users[user_id]['total_wagered'] += amount
-    
-    odds = game['home_odds'] if team_choice == 'home' else game['away_odds']
-    potential_win = amount * (1 + abs(odds) / 100) if odds > 0 else amount * (1 + 100 / abs(odds))
-    
-    betting.bets[game_id].append({
-        'user_id': user_id,
-        'team': team_choice,
-        'amount': amount,
-        'odds': odds,
-        'potential_win': potential_win
-    })
+    async with betting.locked(user_id):
+        existing_bet = betting.get_user_bet(game_id, user_id)
+        if existing_bet:
+            await interaction.response.send_message("❌ You already have a bet on this game!", ephemeral=True)
+            return
+        
+        if not betting.debit(user_id, amount, 'stake', game_id):
+            await interaction.response.send_message(f"❌ You only have ${betting.get_balance(user_id):,}!", ephemeral=True)
+            return
+        betting.users[user_id]['total_wagered'] += amount
+        
+        odds = game['home_odds'] if team_choice == 'home' else game['away_odds']
+        potential_win = potential_payout(amount, odds)
+        
+        betting.add_bet(game_id, {
+            'user_id': user_id,
+            'team': team_choice,
+            'amount': amount,
+            'odds': odds,
+            'potential_win': potential_win
+        })
+        betting.mark_user(user_id)
     betting.save_data()
     
     team_name = game['home_team'] if team_choice == 'home' else game['away_team']
@@ -1374,7 +2149,7 @@ async def slash_bet(interaction: discord.Interaction, game_id: str, team: str, a
     bet_embed = discord.Embed(title="✅ Bet Placed!", color=0x2ecc71)
     bet_embed.add_field(name="Your Pick", value=team_name, inline=True)
     bet_embed.add_field(name="Wagered", value=f"${amount:,}", inline=True)
-    bet_embed.add_field(name="Potential Win", value=f"${potential_win:,.2f}", inline=True)
+    bet_embed.add_field(name="Potential Win", value=f"${potential_win:,}", inline=True)
     
     await interaction.response.send_message(embeds=[game_embed, bet_embed])
 
@@ -1383,16 +2158,11 @@ async def slash_mybets(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
     active_bets = []
     
-    for game_id, bets in betting.bets.items():
-        # Skip if game was deleted
-        if game_id not in betting.games:
-            continue
-            
-        user_bet = next((b for b in bets if b['user_id'] == user_id), None)
-        if user_bet and not betting.games[game_id].get('result'):
-            game = betting.games[game_id]
+    for game_id, user_bet in betting.open_bets_for_user(user_id):
+        game = betting.games.get(game_id)
+        if game:
             team_name = game['home_team'] if user_bet['team'] == 'home' else game['away_team']
-            active_bets.append(f"**{game['home_team']} vs {game['away_team']}**\n└ {team_name} - ${user_bet['amount']:,} → ${user_bet['potential_win']:,.2f}")
+            active_bets.append(f"**{game['home_team']} vs {game['away_team']}**\n└ {team_name} - ${user_bet['amount']:,} → ${int(user_bet['potential_win']):,}")
     
     embed = discord.Embed(title="🎲 Your Active Bets", color=0x9b59b6)
     embed.description = "\n\n".join(active_bets) if active_bets else "No active bets!"
@@ -1400,7 +2170,7 @@ async def slash_mybets(interaction: discord.Interaction):
 
 @bot.tree.command(name="games", description="List all active games")
 async def slash_games(interaction: discord.Interaction):
-    active_games = [(gid, g) for gid, g in betting.games.items() if not g.get('result')]
+    active_games = [(gid, g) for gid, g in betting.guild_games(interaction.guild_id) if not g.get('result')]
     
     if not active_games:
         await interaction.response.send_message("No active games right now!")
@@ -1411,7 +2181,7 @@ async def slash_games(interaction: discord.Interaction):
         status = "🔒 Locked" if game['locked'] else "✅ Open"
         embed.add_field(
             name=f"{game['home_team']} vs {game['away_team']}",
-            value=f"{status} | {game['home_odds']:+.1f} / {game['away_odds']:+.1f}\nID: `{game_id}`",
+            value=f"{status} | {game['home_odds']:+.1f} / {game['away_odds']:+.1f}\nID: `{display_game_id(game_id)}`",
             inline=False
         )
     await interaction.response.send_message(embed=embed)
@@ -1420,6 +2190,7 @@ async def slash_games(interaction: discord.Interaction):
 @discord.app_commands.checks.has_permissions(manage_messages=True)
 async def slash_refresh(interaction: discord.Interaction, game_id: str, message_id: str):
     """Refresh an existing game embed"""
+    game_id = betting.find_game_id(interaction.guild_id, game_id)
     if game_id not in betting.games:
         await interaction.response.send_message("❌ Game not found!", ephemeral=True)
         return
@@ -1438,67 +2209,14 @@ async def slash_refresh(interaction: discord.Interaction, game_id: str, message_
         await interaction.response.send_message("❌ Message not found!", ephemeral=True)
         return
     
-    # Rebuild embed with new styling
-    home_team = game['home_team']
-    away_team = game['away_team']
-    home_odds = game['home_odds']
-    away_odds = game['away_odds']
-    sport = game.get('sport', 'NFL')
-    game_time = datetime.fromisoformat(game['start_time'])
-    
-    emoji = "🏈" if sport == "NFL" else "🏟️"
-    embed = discord.Embed(
-        title=f"{emoji} {home_team} vs {away_team}",
-        description=f"**{sport}** • <t:{int(game_time.timestamp())}:R>",
-        color=0x00ff88
-    )
-    
-    embed.add_field(
-        name="━━━━━━━━━━━━━━━━━━━━━━━",
-        value="\u200b",
-        inline=False
-    )
-    
-    # Color-code favorite (green) vs underdog (red)
-    home_syntax = "diff\n+" if home_odds < 0 else "diff\n-"
-    away_syntax = "diff\n+" if away_odds < 0 else "diff\n-"
-    
-    embed.add_field(
-        name=f"{home_team}",
-        value=f"```{home_syntax}{home_odds:+.0f}```",
-        inline=True
-    )
-    embed.add_field(
-        name="\u200b",
-        value="**VS**",
-        inline=True
-    )
-    embed.add_field(
-        name=f"{away_team}",
-        value=f"```{away_syntax}{away_odds:+.0f}```",
-        inline=True
-    )
-    
-    embed.add_field(
-        name="━━━━━━━━━━━━━━━━━━━━━━━",
-        value="\u200b",
-        inline=False
-    )
-    
-    if game.get('lock_time'):
-        lock_timestamp = int(datetime.fromisoformat(game['lock_time']).timestamp())
-        embed.add_field(name="🔒 Betting Closes", value=f"<t:{lock_timestamp}:R>", inline=True)
-    
-    embed.add_field(name="🕐 Kickoff", value=f"<t:{int(game_time.timestamp())}:F>", inline=False)
-    embed.set_footer(text=f"Game ID: {game_id}")
-    embed.timestamp = game_time
+    embed = cards.render(game_id, game, betting.game_version(game_id))
     
     view = BettingView(game_id, game)
     await message.edit(embed=embed, view=view)
     await interaction.response.send_message("✅ Game embed refreshed!", ephemeral=True)
 
 
-@bot.tree.command(name="creategame", description="Add a game from live/upcoming matchups (Admin only)")
+@bot.tree.command(name="creategame", description="Add a game from live/upcoming matchups (Admin only)", extras=NO_USERS)
 @discord.app_commands.checks.has_permissions(manage_messages=True)
 async def slash_creategame(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
@@ -1507,173 +2225,26 @@ async def slash_creategame(interaction: discord.Interaction):
     available_games = []
     
     try:
-        async with aiohttp.ClientSession() as session:
-            # Get NFL games
-            async with session.get('https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard') as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    for event in data.get('events', []):
-                        try:
-                            status = event['status']['type']['state']
-                            if status in ['pre', 'in']:  # Include pre-game and in-progress
-                                game_time = datetime.fromisoformat(event['date'].replace('Z', '+00:00'))
-                                home_team = event['competitions'][0]['competitors'][0]['team']['abbreviation']
-                                away_team = event['competitions'][0]['competitors'][1]['team']['abbreviation']
-                                
-                                # Get scores if live
-                                home_score = None
-                                away_score = None
-                                if status == 'in':
-                                    try:
-                                        home_score = event['competitions'][0]['competitors'][0].get('score', '0')
-                                        away_score = event['competitions'][0]['competitors'][1].get('score', '0')
-                                    except:
-                                        pass
-                                
-                                # Get odds
-                                home_odds = -110.0
-                                away_odds = -110.0
-                                try:
-                                    odds_data = event['competitions'][0].get('odds', [])
-                                    if odds_data:
-                                        first_odds = odds_data[0]
-                                        
-                                        # Try multiple fields for moneyline
-                                        home_ml = first_odds.get('homeTeamOdds', {}).get('moneyLine')
-                                        away_ml = first_odds.get('awayTeamOdds', {}).get('moneyLine')
-                                        
-                                        if not home_ml:
-                                            home_ml = first_odds.get('homeMoneyLine')
-                                        if not away_ml:
-                                            away_ml = first_odds.get('awayMoneyLine')
-                                        
-                                        if home_ml:
-                                            home_odds = float(home_ml)
-                                        if away_ml:
-                                            away_odds = float(away_ml)
-                                        
-                                        # If still no moneyline, use spread to estimate
-                                        if home_odds == -110.0 and away_odds == -110.0:
-                                            spread = first_odds.get('spread')
-                                            if spread is not None:
-                                                spread = float(spread)
-                                                if spread < -7:
-                                                    home_odds = -300.0
-                                                    away_odds = 250.0
-                                                elif spread < -3:
-                                                    home_odds = -180.0
-                                                    away_odds = 155.0
-                                                elif spread < -0.5:
-                                                    home_odds = -130.0
-                                                    away_odds = 110.0
-                                                elif spread > 7:
-                                                    home_odds = 250.0
-                                                    away_odds = -300.0
-                                                elif spread > 3:
-                                                    home_odds = 155.0
-                                                    away_odds = -180.0
-                                                elif spread > 0.5:
-                                                    home_odds = 110.0
-                                                    away_odds = -130.0
-                                except:
-                                    pass
-                                
-                                available_games.append({
-                                    'home': home_team,
-                                    'away': away_team,
-                                    'time': game_time,
-                                    'home_odds': home_odds,
-                                    'away_odds': away_odds,
-                                    'sport': 'NFL',
-                                    'status': status,
-                                    'home_score': home_score,
-                                    'away_score': away_score
-                                })
-                        except:
-                            continue
-            
-            # Get CFB games
-            async with session.get('https://site.api.espn.com/apis/site/v2/sports/football/college-football/scoreboard') as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    for event in data.get('events', []):
-                        try:
-                            status = event['status']['type']['state']
-                            if status in ['pre', 'in']:
-                                game_time = datetime.fromisoformat(event['date'].replace('Z', '+00:00'))
-                                home_team = event['competitions'][0]['competitors'][0]['team']['abbreviation']
-                                away_team = event['competitions'][0]['competitors'][1]['team']['abbreviation']
-                                
-                                # Get scores if live
-                                home_score = None
-                                away_score = None
-                                if status == 'in':
-                                    try:
-                                        home_score = event['competitions'][0]['competitors'][0].get('score', '0')
-                                        away_score = event['competitions'][0]['competitors'][1].get('score', '0')
-                                    except:
-                                        pass
-                                
-                                home_odds = -110.0
-                                away_odds = -110.0
-                                try:
-                                    odds_data = event['competitions'][0].get('odds', [])
-                                    if odds_data:
-                                        first_odds = odds_data[0]
-                                        
-                                        # Try multiple fields for moneyline
-                                        home_ml = first_odds.get('homeTeamOdds', {}).get('moneyLine')
-                                        away_ml = first_odds.get('awayTeamOdds', {}).get('moneyLine')
-                                        
-                                        if not home_ml:
-                                            home_ml = first_odds.get('homeMoneyLine')
-                                        if not away_ml:
-                                            away_ml = first_odds.get('awayMoneyLine')
-                                        
-                                        if home_ml:
-                                            home_odds = float(home_ml)
-                                        if away_ml:
-                                            away_odds = float(away_ml)
-                                        
-                                        # If still no moneyline, use spread to estimate
-                                        if home_odds == -110.0 and away_odds == -110.0:
-                                            spread = first_odds.get('spread')
-                                            if spread is not None:
-                                                spread = float(spread)
-                                                if spread < -7:
-                                                    home_odds = -300.0
-                                                    away_odds = 250.0
-                                                elif spread < -3:
-                                                    home_odds = -180.0
-                                                    away_odds = 155.0
-                                                elif spread < -0.5:
-                                                    home_odds = -130.0
-                                                    away_odds = 110.0
-                                                elif spread > 7:
-                                                    home_odds = 250.0
-                                                    away_odds = -300.0
-                                                elif spread > 3:
-                                                    home_odds = 155.0
-                                                    away_odds = -180.0
-                                                elif spread > 0.5:
-                                                    home_odds = 110.0
-                                                    away_odds = -130.0
-                                except:
-                                    pass
-                                
-                                available_games.append({
-                                    'home': home_team,
-                                    'away': away_team,
-                                    'time': game_time,
-                                    'home_odds': home_odds,
-                                    'away_odds': away_odds,
-                                    'sport': 'CFB',
-                                    'status': status,
-                                    'home_score': home_score,
-                                    'away_score': away_score
-                                })
-                        except:
-                            continue
+        # A few minutes old is fine for picking a game, and answers instantly when warm
+        boards = await scores.games(['nfl', 'college-football'], max_age=300)
+        
+        for league in ('nfl', 'college-football'):
+            for espn_game in boards[league] or ():
+                if espn_game.state not in ['pre', 'in']:  # Include pre-game and in-progress
+                    continue
+                live = espn_game.state == 'in'
+                available_games.append({
+                    'home': espn_game.home_team,
+                    'away': espn_game.away_team,
+                    'time': datetime.fromtimestamp(espn_game.start, timezone.utc),
+                    'home_odds': espn_game.home_odds,
+                    'away_odds': espn_game.away_odds,
+                    'sport': espn_game.sport,
+                    'status': espn_game.state,
+                    # Scores only shown for games in progress
+                    'home_score': espn_game.home_score if live else None,
+                    'away_score': espn_game.away_score if live else None
+                })
     except Exception as e:
         await interaction.followup.send(f"❌ Error fetching games: {e}", ephemeral=True)
         return
@@ -1706,6 +2277,7 @@ async def slash_creategame(interaction: discord.Interaction):
             self.add_item(select)
             self.games_list = games_list
         
+        @metrics.timed('betting_handler_seconds', kind='view', handler='GameSelectView.select')
         async def select_callback(self, interaction: discord.Interaction):
             selected_game = self.games_list[int(interaction.data['values'][0])]
             
@@ -1722,6 +2294,7 @@ async def slash_creategame(interaction: discord.Interaction):
                     super().__init__()
                     self.game_data = game_data
                 
+                @metrics.timed('betting_handler_seconds', kind='modal', handler='BettingDurationModal')
                 async def on_submit(self, modal_interaction: discord.Interaction):
                     game_time = self.game_data['time']
                     home_team = self.game_data['home']
@@ -1730,10 +2303,12 @@ async def slash_creategame(interaction: discord.Interaction):
                     away_odds = self.game_data['away_odds']
                     sport = self.game_data['sport']
                     
-                    game_id = f"{home_team}_{away_team}_{int(game_time.timestamp())}"
+                    short_id = f"{home_team}_{away_team}_{int(game_time.timestamp())}"
+                    game_id = scoped_game_id(modal_interaction.guild_id, short_id)
+                    config = betting.guild_config(modal_interaction.guild_id)
                     
-                    # Check if already exists
-                    if game_id in betting.games:
+                    # Check if already exists, here or unscoped from before guilds
+                    if betting.find_game_id(modal_interaction.guild_id, short_id) in betting.games:
                         await modal_interaction.response.send_message("❌ This game is already in the betting channel!", ephemeral=True)
                         return
                     
@@ -1755,77 +2330,24 @@ async def slash_creategame(interaction: discord.Interaction):
                         'lock_time': lock_time,
                         'locked': False,
                         'result': None,
-                        'channel_id': betting.config.get('betting_channel_id', modal_interaction.channel_id),
-                        'sport': sport
+                        'channel_id': config.get('betting_channel_id') or modal_interaction.channel_id,
+                        'sport': sport,
+                        'guild_id': str(modal_interaction.guild_id)
                     }
+                    if self.game_data.get('home_score') is not None and self.game_data.get('away_score') is not None:
+                        betting.games[game_id]['home_score'] = self.game_data['home_score']
+                        betting.games[game_id]['away_score'] = self.game_data['away_score']
                     betting.bets[game_id] = []
+                    betting.mark_game(game_id)
                     betting.save_data()
+                    lock_scheduler.schedule(game_id)
                     
                     # Post to betting channel
-                    channel_id = betting.config.get('betting_channel_id', modal_interaction.channel_id)
+                    channel_id = config.get('betting_channel_id') or modal_interaction.channel_id
                     channel = bot.get_channel(channel_id)
                     
-                    emoji = "🏈" if sport == "NFL" else "🏟️"
-                    
-                    # Build description with live score if available
-                    description_parts = [f"**{sport}**"]
-                    if self.game_data.get('home_score') is not None and self.game_data.get('away_score') is not None:
-                        description_parts.append(f"🔴 **LIVE** • {self.game_data['home_score']}-{self.game_data['away_score']}")
-                    else:
-                        description_parts.append(f"<t:{int(game_time.timestamp())}:R>")
-                    
-                    embed = discord.Embed(
-                        title=f"{emoji} {home_team} vs {away_team}",
-                        description=" • ".join(description_parts),
-                        color=0xff4444 if self.game_data.get('home_score') is not None else 0x00ff88
-                    )
-                    
-                    embed.add_field(
-                        name="━━━━━━━━━━━━━━━━━━━━━━━",
-                        value="\u200b",
-                        inline=False
-                    )
-                    
-                    # Determine favorite (negative odds) vs underdog (positive odds)
-                    home_syntax = "diff\n+" if home_odds < 0 else "diff\n-"
-                    away_syntax = "diff\n+" if away_odds < 0 else "diff\n-"
-                    
-                    embed.add_field(
-                        name=f"{home_team}",
-                        value=f"```{home_syntax}{home_odds:+.0f}```",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="\u200b",
-                        value="**VS**",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name=f"{away_team}",
-                        value=f"```{away_syntax}{away_odds:+.0f}```",
-                        inline=True
-                    )
-                    
-                    embed.add_field(
-                        name="━━━━━━━━━━━━━━━━━━━━━━━",
-                        value="\u200b",
-                        inline=False
-                    )
-                    
-                    if lock_time:
-                        lock_timestamp = int(datetime.fromisoformat(lock_time).timestamp())
-                        embed.add_field(name="🔒 Betting Closes", value=f"<t:{lock_timestamp}:R>", inline=True)
-                    
-                    embed.add_field(name="🕐 Kickoff", value=f"<t:{int(game_time.timestamp())}:F>", inline=False)
-                    embed.set_footer(text=f"Game ID: {game_id}")
-                    embed.timestamp = game_time
-                    
-                    view = BettingView(game_id, betting.games[game_id])
                     if channel:
-                        # Ping role if configured
-                        role_id = betting.config.get('bettor_role_id')
-                        content = f"<@&{role_id}>" if role_id else None
-                        await channel.send(content=content, embed=embed, view=view)
+                        post_game_card(channel, game_id)
                     
                     duration_text = f" (closes in {self.duration.value} min)" if self.duration.value.strip() else ""
                     await modal_interaction.response.send_message(f"✅ Game added: {home_team} vs {away_team}{duration_text}", ephemeral=True)
@@ -1839,6 +2361,7 @@ async def slash_creategame(interaction: discord.Interaction):
 @bot.tree.command(name="result", description="Set game result and pay winners (Admin only)")
 @discord.app_commands.checks.has_permissions(manage_messages=True)
 async def slash_result(interaction: discord.Interaction, game_id: str, winner: str):
+    game_id = betting.find_game_id(interaction.guild_id, game_id)
     if game_id not in betting.games:
         await interaction.response.send_message("❌ Game not found!", ephemeral=True)
         return
@@ -1850,38 +2373,12 @@ async def slash_result(interaction: discord.Interaction, game_id: str, winner: s
         await interaction.response.send_message("❌ Winner must be 'home' or 'away'!", ephemeral=True)
         return
     
-    game['result'] = winner
-    game['locked'] = True
-    
-    payouts = []
-    for bet in betting.bets[game_id]:
-        user_id = bet['user_id']
-        if bet['team'] == winner:
-            payout = bet['potential_win']
-            betting.update_balance(user_id, int(payout))
-            betting.users[user_id]['wins'] += 1
-            payouts.append((user_id, payout, True, []))
-        else:
-            betting.users[user_id]['losses'] += 1
-            # Check for insurance
-            used_items = bet.get('used_items', [])
-            if 'insurance' in used_items:
-                refund = int(bet['amount'] * 0.5)
-                betting.update_balance(user_id, refund)
-                payouts.append((user_id, refund, False, ['insurance']))
-            elif '2x_multiplier' in used_items:
-                # Double loss penalty - lose additional bet amount (if they can afford it)
-                current_balance = betting.users[user_id]['balance']
-                penalty = min(bet['amount'], current_balance)  # Can't go negative
-                if penalty > 0:
-                    betting.update_balance(user_id, -penalty)
-                    payouts.append((user_id, -penalty, False, ['2x_penalty']))
-                else:
-                    payouts.append((user_id, 0, False, ['2x_nofunds']))
-            else:
-                payouts.append((user_id, 0, False, []))
-    
-    betting.save_data()
+    async with betting.locked(*betting.game_bettors.get(game_id, {})):
+        payouts = betting.settle_game(game_id, winner)
+    if payouts is None:
+        await interaction.response.send_message("❌ This game is already settled!", ephemeral=True)
+        return
+    await betting.flush()
     
     winner_team = game['home_team'] if winner == 'home' else game['away_team']
     embed = discord.Embed(title="🎉 Game Result", color=0x2ecc71)
@@ -1890,18 +2387,19 @@ async def slash_result(interaction: discord.Interaction, game_id: str, winner: s
     
     winners_text = ""
     losers_text = ""
+    display_names = await names.resolve_many([p[0] for p in payouts], interaction.guild)
     for user_id, payout, won, items in payouts:
-        user = await bot.fetch_user(int(user_id))
+        name = display_names[user_id]
         if won:
             bonus_text = " (2x!)" if '2x_multiplier' in items else ""
-            winners_text += f"✅ {user.name}: +${payout:,.2f}{bonus_text}\n"
+            winners_text += f"✅ {name}: +${payout:,}{bonus_text}\n"
         else:
             if '2x_penalty' in items:
-                losers_text += f"❌ {user.name}: -${abs(payout):,.0f} (2x penalty!)\n"
+                losers_text += f"❌ {name}: -${abs(payout):,} (2x penalty!)\n"
             elif 'insurance' in items:
-                losers_text += f"❌ {user.name}: +${payout:,.0f} (insurance)\n"
+                losers_text += f"❌ {name}: +${payout:,} (insurance)\n"
             else:
-                losers_text += f"❌ {user.name}\n"
+                losers_text += f"❌ {name}\n"
     
     if winners_text:
         embed.add_field(name="Winners", value=winners_text, inline=True)
@@ -1911,7 +2409,7 @@ async def slash_result(interaction: discord.Interaction, game_id: str, winner: s
     await interaction.response.send_message(embed=embed)
 
 # Shop & Economy Commands
-@bot.tree.command(name="shop", description="Buy power-ups and items")
+@bot.tree.command(name="shop", description="Buy power-ups and items", extras=NO_USERS)
 async def slash_shop(interaction: discord.Interaction):
     embed = discord.Embed(title="🛒 Shop", description="Buy items with your winnings!", color=0xf1c40f)
     
@@ -1931,7 +2429,6 @@ async def slash_shop(interaction: discord.Interaction):
 @bot.tree.command(name="buy", description="Purchase an item from the shop")
 async def slash_buy(interaction: discord.Interaction, item: str):
     user_id = str(interaction.user.id)
-    balance = betting.get_balance(user_id)
     
     items_for_sale = {
         '2x': {'name': '2x Multiplier', 'price': 500, 'key': '2x_multiplier'},
@@ -1946,19 +2443,19 @@ async def slash_buy(interaction: discord.Interaction, item: str):
     item_data = items_for_sale[item]
     price = item_data['price']
     
-    if balance < price:
-        await interaction.response.send_message(f"❌ You need ${price:,} but only have ${balance:,}!", ephemeral=True)
-        return
-    
-    betting.update_balance(user_id, -price)
-    
-    if 'inventory' not in betting.users[user_id]:
-        betting.users[user_id]['inventory'] = {}
-    
-    if item_data['key'] not in betting.users[user_id]['inventory']:
-        betting.users[user_id]['inventory'][item_data['key']] = 0
-    
-    betting.users[user_id]['inventory'][item_data['key']] += 1
+    async with betting.locked(user_id):
+        if not betting.debit(user_id, price, 'purchase', item_data['name']):
+            await interaction.response.send_message(f"❌ You need ${price:,} but only have ${betting.get_balance(user_id):,}!", ephemeral=True)
+            return
+        
+        if 'inventory' not in betting.users[user_id]:
+            betting.users[user_id]['inventory'] = {}
+        
+        if item_data['key'] not in betting.users[user_id]['inventory']:
+            betting.users[user_id]['inventory'][item_data['key']] = 0
+        
+        betting.users[user_id]['inventory'][item_data['key']] += 1
+        betting.mark_user(user_id)
     betting.save_data()
     
     await interaction.response.send_message(f"✅ Purchased **{item_data['name']}** for ${price:,}!\nNew balance: ${betting.users[user_id]['balance']:,}", ephemeral=True)
@@ -1988,21 +2485,23 @@ async def slash_daily(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
     betting.get_balance(user_id)
     
-    last_daily = betting.users[user_id].get('last_daily')
-    now = datetime.now(timezone.utc)
-    
-    if last_daily:
-        last_daily_dt = datetime.fromisoformat(last_daily)
-        time_diff = (now - last_daily_dt).total_seconds()
+    async with betting.locked(user_id):
+        last_daily = betting.users[user_id].get('last_daily')
+        now = datetime.now(timezone.utc)
         
-        if time_diff < 86400:  # 24 hours
-            hours_left = (86400 - time_diff) / 3600
-            await interaction.response.send_message(f"⏰ Daily already claimed! Come back in {hours_left:.1f} hours.", ephemeral=True)
-            return
-    
-    bonus = 200
-    betting.update_balance(user_id, bonus)
-    betting.users[user_id]['last_daily'] = now.isoformat()
+        if last_daily:
+            last_daily_dt = datetime.fromisoformat(last_daily)
+            time_diff = (now - last_daily_dt).total_seconds()
+            
+            if time_diff < 86400:  # 24 hours
+                hours_left = (86400 - time_diff) / 3600
+                await interaction.response.send_message(f"⏰ Daily already claimed! Come back in {hours_left:.1f} hours.", ephemeral=True)
+                return
+        
+        bonus = 200
+        betting.update_balance(user_id, bonus, 'daily')
+        betting.users[user_id]['last_daily'] = now.isoformat()
+        betting.mark_user(user_id)
     betting.save_data()
     
     await interaction.response.send_message(f"💰 Claimed ${bonus} daily bonus!\nNew balance: ${betting.users[user_id]['balance']:,}")
@@ -2012,12 +2511,6 @@ async def slash_loan(interaction: discord.Interaction, amount: int):
     user_id = str(interaction.user.id)
     betting.get_balance(user_id)
     
-    current_loan = betting.users[user_id].get('loan_amount', 0)
-    
-    if current_loan > 0:
-        await interaction.response.send_message(f"❌ You already have a loan of ${current_loan}! Pay it back with `/repay` first.", ephemeral=True)
-        return
-    
     if amount > 100:
         await interaction.response.send_message("❌ Maximum loan is $100!", ephemeral=True)
         return
@@ -2028,8 +2521,16 @@ async def slash_loan(interaction: discord.Interaction, amount: int):
     
     interest = int(amount * 1.2)  # 20% interest
     
-    betting.update_balance(user_id, amount)
-    betting.users[user_id]['loan_amount'] = interest
+    async with betting.locked(user_id):
+        current_loan = betting.users[user_id].get('loan_amount', 0)
+        
+        if current_loan > 0:
+            await interaction.response.send_message(f"❌ You already have a loan of ${current_loan}! Pay it back with `/repay` first.", ephemeral=True)
+            return
+        
+        betting.update_balance(user_id, amount, 'loan')
+        betting.users[user_id]['loan_amount'] = interest
+        betting.mark_user(user_id)
     betting.save_data()
     
     await interaction.response.send_message(f"💸 Borrowed ${amount}! You owe ${interest} (20% interest)\nUse `/repay` to pay it back.\nNew balance: ${betting.users[user_id]['balance']:,}")
@@ -2037,19 +2538,20 @@ async def slash_loan(interaction: discord.Interaction, amount: int):
 @bot.tree.command(name="repay", description="Pay back your loan")
 async def slash_repay(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    balance = betting.get_balance(user_id)
-    loan = betting.users[user_id].get('loan_amount', 0)
-    
-    if loan == 0:
-        await interaction.response.send_message("✅ You don't have any loans!", ephemeral=True)
-        return
-    
-    if balance < loan:
-        await interaction.response.send_message(f"❌ You need ${loan} but only have ${balance:,}!", ephemeral=True)
-        return
+    betting.get_balance(user_id)
     
-    betting.update_balance(user_id, -loan)
-    betting.users[user_id]['loan_amount'] = 0
+    async with betting.locked(user_id):
+        loan = betting.users[user_id].get('loan_amount', 0)
+        
+        if loan == 0:
+            await interaction.response.send_message("✅ You don't have any loans!", ephemeral=True)
+            return
+        
+        if not betting.debit(user_id, loan, 'repay'):
+            await interaction.response.send_message(f"❌ You need ${loan} but only have ${betting.get_balance(user_id):,}!", ephemeral=True)
+            return
+        betting.users[user_id]['loan_amount'] = 0
+        betting.mark_user(user_id)
     betting.save_data()
     
     await interaction.response.send_message(f"✅ Loan paid off! Paid ${loan}.\nNew balance: ${betting.users[user_id]['balance']:,}")
@@ -2063,19 +2565,14 @@ async def slash_send(interaction: discord.Interaction, user: discord.User, amoun
         await interaction.response.send_message("❌ You can't send money to yourself!", ephemeral=True)
         return
     
-    balance = betting.get_balance(sender_id)
-    
     if amount < 1:
         await interaction.response.send_message("❌ Amount must be at least $1!", ephemeral=True)
         return
     
-    if amount > balance:
-        await interaction.response.send_message(f"❌ You only have ${balance:,}!", ephemeral=True)
-        return
-    
-    betting.update_balance(sender_id, -amount)
-    betting.get_balance(receiver_id)  # Ensure receiver exists
-    betting.update_balance(receiver_id, amount)
+    async with betting.locked(sender_id, receiver_id):
+        if not betting.transfer(sender_id, receiver_id, amount):
+            await interaction.response.send_message(f"❌ You only have ${betting.get_balance(sender_id):,}!", ephemeral=True)
+            return
     betting.save_data()
     
     await interaction.response.send_message(f"✅ Sent ${amount:,} to {user.mention}!\nYour new balance: ${betting.users[sender_id]['balance']:,}")
@@ -2083,17 +2580,15 @@ async def slash_send(interaction: discord.Interaction, user: discord.User, amoun
 @bot.tree.command(name="slots", description="Play the slot machine")
 async def slash_slots(interaction: discord.Interaction, amount: int):
     user_id = str(interaction.user.id)
-    balance = betting.get_balance(user_id)
     
     if amount < 10:
         await interaction.response.send_message("❌ Minimum bet is $10!", ephemeral=True)
         return
     
-    if amount > balance:
-        await interaction.response.send_message(f"❌ You only have ${balance:,}!", ephemeral=True)
-        return
-    
-    betting.update_balance(user_id, -amount)
+    async with betting.locked(user_id):
+        if not betting.debit(user_id, amount, 'slots'):
+            await interaction.response.send_message(f"❌ You only have ${betting.get_balance(user_id):,}!", ephemeral=True)
+            return
     
     # Slot symbols - slightly favoring player
     symbols = ['🍒', '🍋', '🍊', '🍇', '💎', '7️⃣']
@@ -2117,7 +2612,7 @@ async def slash_slots(interaction: discord.Interaction, amount: int):
         winnings = int(amount * 1.8)  # Small profit on two matches
     
     if winnings > 0:
-        betting.update_balance(user_id, winnings)
+        betting.update_balance(user_id, winnings, 'slots')
         result_text = f"🎰 **[ {slot1} {slot2} {slot3} ]**\n\n🎉 YOU WIN ${winnings:,}!"
         color = 0x2ecc71
     else:
@@ -2131,8 +2626,126 @@ async def slash_slots(interaction: discord.Interaction, amount: int):
     
     await interaction.response.send_message(embed=embed)
 
-TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN:
-    raise ValueError("DISCORD_TOKEN not found in .env file")
+def background_tasks() -> dict:
+    """name -> whether that background task is running"""
+    return {
+        'auto_fetch_games': auto_fetch_games.is_running(),
+        'check_game_results': check_game_results.is_running(),
+        'cleanup_old_games': cleanup_old_games.is_running(),
+        'lock_games': lock_scheduler.is_running()
+    }
+
+def collect_gauges():
+    for name, running in background_tasks().items():
+        yield 'betting_task_running', {'task': name}, running
+    for key, value in espn.stats().items():
+        yield f'betting_espn_{key}', {}, value
+    for key, value in outbox.stats().items():
+        yield f'betting_outbox_{key}', {}, value
+    yield 'betting_users', {}, len(betting.users)
+    yield 'betting_open_games', {}, sum(1 for g in betting.games.values() if not g.get('result'))
+
+metrics.add_collector(collect_gauges)
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:,.1f} ms"
+
+@bot.tree.command(name="perf", description="Command latency, saves and background task health (Admin only)", extras=NO_USERS)
+@discord.app_commands.checks.has_permissions(administrator=True)
+async def slash_perf(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 Performance since startup", color=0x3498db)
+    handlers = metrics.series('betting_handler_seconds', 'kind', 'handler')
+    failures = metrics.series('betting_handler_seconds', 'kind', 'handler', 'outcome')
+    
+    def failed(kind, handler):
+        hist = failures.get((kind, handler, 'error'))
+        return f" • {hist.count:,} failed" if hist else ""
+    
+    slowest = sorted(((key, hist) for key, hist in handlers.items() if key[0] != 'task'),
+                     key=lambda item: item[1].quantile(0.95), reverse=True)[:8]
+    lines = [
+        f"`{handler}` ({kind}) {hist.count:,}× • p50 {format_ms(hist.quantile(0.5))} • p95 {format_ms(hist.quantile(0.95))}{failed(kind, handler)}"
+        for (kind, handler), hist in slowest
+    ]
+    embed.add_field(name="⏱️ Slowest Handlers (p95)", value="\n".join(lines) or "No calls yet", inline=False)
+    
+    lines = []
+    for name, running in background_tasks().items():
+        hist = handlers.get(('task', name))
+        runs = f"{hist.count:,} runs • p95 {format_ms(hist.quantile(0.95))}" if hist else "no runs yet"
+        lines.append(f"{'🟢' if running else '🔴'} `{name}` {runs}{failed('task', name)}")
+    embed.add_field(name="🔁 Background Tasks", value="\n".join(lines), inline=False)
+    
+    saves = metrics.series('betting_save_seconds', 'op')
+    sizes = metrics.series('betting_save_bytes', 'op')
+    lines = [
+        f"{op}: {saves[(op,)].count:,} • p95 {format_ms(saves[(op,)].quantile(0.95))} • {sizes[(op,)].sum / 1024:,.1f} KiB written"
+        for op in ('commit', 'checkpoint') if (op,) in saves and (op,) in sizes
+    ]
+    embed.add_field(name="💾 Saves", value="\n".join(lines) or "Nothing saved yet", inline=False)
+    
+    stats = espn.stats()
+    fetches = metrics.series('betting_espn_request_seconds').get(())
+    embed.add_field(
+        name="🌐 ESPN",
+        value=f"{stats['requests']:,} requests • {stats['errors']:,} errors • {stats['cache_hits']:,} cache hits\n"
+              f"p95 {format_ms(fetches.quantile(0.95) if fetches else 0.0)}",
+        inline=True
+    )
+    
+    stats = outbox.stats()
+    embed.add_field(
+        name="📤 Outbox",
+        value=f"{stats['sent']:,} sent • {stats['failed']:,} failed • {stats['merged']:,} merged\n"
+              f"{stats['queued']:,} queued (peak {stats['peak_queued']:,}) • p95 {format_ms(stats['latency_p95'])}",
+        inline=True
+    )
+    
+    calls = metrics.series('betting_discord_request_seconds', 'method', 'route')
+    errors = metrics.series('betting_discord_request_seconds', 'outcome').get(('error',))
+    busiest = sorted(calls.items(), key=lambda item: item[1].count, reverse=True)[:3]
+    lines = [f"{sum(hist.count for hist in calls.values()):,} calls • {errors.count if errors else 0:,} failed"]
+    lines += [f"`{method} {route}` {hist.count:,}× • p95 {format_ms(hist.quantile(0.95))}" for (method, route), hist in busiest]
+    embed.add_field(name="📡 Discord API", value="\n".join(lines), inline=False)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="ledger", description="Audit a user's balance against the ledger (Admin only)")
+@discord.app_commands.checks.has_permissions(administrator=True)
+async def slash_ledger(interaction: discord.Interaction, member: discord.Member):
+    await interaction.response.defer(ephemeral=True)
+    user_id = str(member.id)
+    account = user_account(user_id)
+    if user_id not in betting.users:
+        embed = discord.Embed(title=f"📒 Ledger for {member.display_name}", description="No account yet", color=0x95a5a6)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        return
+    await betting.flush()
+    # Replaying from the snapshot reads files, so do it off the loop
+    loop = asyncio.get_running_loop()
+    replayed = await loop.run_in_executor(None, betting.ledger.replay, account)
+    entries = await loop.run_in_executor(None, betting.ledger.history, account, 10)
+
+    recorded = betting.users[user_id]['balance'] * CENTS
+    ok = recorded == replayed == betting.ledger.balances.get(account, 0)
+    embed = discord.Embed(title=f"📒 Ledger for {member.display_name}", color=0x2ecc71 if ok else 0xe74c3c)
+    embed.add_field(name="Balance", value=f"${recorded / CENTS:,.2f}", inline=True)
+    embed.add_field(name="Replayed", value=f"${replayed / CENTS:,.2f}", inline=True)
+    embed.add_field(name="Status", value="✅ Matches" if ok else "❌ Mismatch", inline=True)
+
+    lines = []
+    for entry in entries:
+        cents = sum(amount for name, amount in entry['legs'] if name == account)
+        when = datetime.fromtimestamp(entry['ts'], timezone.utc).strftime('%b %d %H:%M')
+        ref = f" `{display_game_id(entry['ref'])}`" if entry['ref'] else ""
+        lines.append(f"#{entry['seq']} {when} **{entry['kind']}**{ref} {'+' if cents >= 0 else '-'}${abs(cents) / CENTS:,.2f}")
+    embed.add_field(name="Recent Entries", value="\n".join(lines) or "None", inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+# Importable without connecting, e.g. by benchmarks/bench_load.py
+if __name__ == '__main__':
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    if not TOKEN:
+        raise ValueError("DISCORD_TOKEN not found in .env file")
 
-bot.run(TOKEN)
\ No newline at end of file
+    bot.run(TOKEN)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+import discord
+
+# Lower runs first
+SETTLEMENT = 0  # final cards and results
+POST = 1  # new game cards
+ANNOUNCE = 2  # lock notices and other chatter
+
+class Dispatcher:
+    """Per-channel outbound queues, so background tasks never wait on Discord's rate limits.
+
+    Each channel gets one worker that sends in priority order and paces itself to
+    `rate` messages per `per` seconds, which keeps it clear of the per-channel limit
+    instead of queueing up behind 429 retries.
+    """
+    def __init__(self, rate=5, per=5.0, max_retries=3):
+        self.rate = rate
+        self.per = per
+        self.max_retries = max_retries
+        self._queues = {}  # channel_id -> heap of (priority, seq, enqueued_at, job, future)
+        self._workers = {}  # channel_id -> worker task
+        self._sent_at = {}  # channel_id -> deque of recent send times
+        self._merges = {}  # (channel_id, key) -> items waiting for one merged message
+        self._seq = itertools.count()
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.merged = 0
+        self.peak_depth = 0
+        self.latencies = deque(maxlen=200)  # seconds from enqueue to done
+
+    def submit(self, channel, job, priority=ANNOUNCE) -> asyncio.Future:
+        """Queue job(channel), a coroutine function; the future gets its result or exception.
+
+        Failures are logged here, so fire-and-forget callers can ignore the future.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_failure)
+        queue = self._queues.setdefault(channel.id, [])
+        heapq.heappush(queue, (priority, next(self._seq), time.monotonic(), lambda: job(channel), future))
+        self.peak_depth = max(self.peak_depth, self.depth())
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.ensure_future(self._run(channel.id))
+        return future
+
+    def send(self, channel, priority=ANNOUNCE, **kwargs) -> asyncio.Future:
+        return self.submit(channel, lambda ch: ch.send(**kwargs), priority)
+
+    def merge(self, channel, key: str, item, render, priority=ANNOUNCE):
+        """Add item to the pending message for (channel, key); render(items) builds its text.
+
+        Everything added before that message goes out is sent as one message.
+        """
+        pending = self._merges.get((channel.id, key))
+        if pending is not None:
+            pending.append(item)
+            self.merged += 1
+            return
+        pending = self._merges[(channel.id, key)] = [item]
+
+        async def send_merged(ch):
+            # Anything added from here on starts the next message
+            if self._merges.get((ch.id, key)) is pending:
+                del self._merges[(ch.id, key)]
+            return await ch.send(render(pending))
+
+        self.submit(channel, send_merged, priority)
+
+    async def _run(self, channel_id):
+        queue = self._queues[channel_id]
+        while queue:
+            _, _, enqueued_at, job, future = heapq.heappop(queue)
+            await self._pace(channel_id)
+            try:
+                result = await self._attempt(job)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.sent += 1
+                if not future.done():
+                    future.set_result(result)
+            self.latencies.append(time.monotonic() - enqueued_at)
+        del self._queues[channel_id]
+        self._workers.pop(channel_id, None)
+
+    async def _pace(self, channel_id):
+        sent_at = self._sent_at.setdefault(channel_id, deque(maxlen=self.rate))
+        if len(sent_at) == self.rate:
+            wait = sent_at[0] + self.per - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        sent_at.append(time.monotonic())
+
+    async def _attempt(self, job):
+        for attempt in range(self.max_retries):
+            try:
+                return await job()
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries - 1:
+                    raise
+                retry_after = getattr(e, 'retry_after', None) or 2 ** attempt
+                await asyncio.sleep(retry_after)
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self, timeout=10):
+        """Wait for queued messages to go out, e.g. before shutting down"""
+        workers = [worker for worker in self._workers.values() if not worker.done()]
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+    def stats(self) -> dict:
+        recent = sorted(self.latencies)
+        return {
+            'queued': self.depth(),
+            'peak_queued': self.peak_depth,
+            'channels': len(self._queues),
+            'sent': self.sent,
+            'failed': self.failed,
+            'merged': self.merged,
+            'latency_avg': sum(recent) / len(recent) if recent else 0.0,
+            'latency_p95': recent[int(len(recent) * 0.95) - 1] if recent else 0.0,
+            'latency_max': recent[-1] if recent else 0.0
+        }
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Dispatcher send failed: {future.exception()!r}")
@@ -0,0 +1,106 @@
+import discord
+from datetime import datetime
+from storage import display_game_id
+
+DIVIDER = "━━━━━━━━━━━━━━━━━━━━━━━"
+
+OPEN_COLOR = 0x00ff88
+LIVE_COLOR = 0xff4444
+LOCKED_COLOR = 0x95a5a6
+FINAL_COLOR = 0x2ecc71
+
+def card_state(game: dict) -> str:
+    """'final', 'locked', 'live' or 'open'"""
+    if game.get('result'):
+        return 'final'
+    if game.get('locked'):
+        return 'locked'
+    if game.get('home_score') is not None and game.get('away_score') is not None:
+        return 'live'
+    return 'open'
+
+def _odds_fields(embed, game, home_syntax, away_syntax):
+    embed.add_field(name=DIVIDER, value="\u200b", inline=False)
+    embed.add_field(
+        name=f"{game['home_team']}",
+        value=f"```{home_syntax}{game['home_odds']:+.0f}```",
+        inline=True
+    )
+    embed.add_field(name="\u200b", value="**VS**", inline=True)
+    embed.add_field(
+        name=f"{game['away_team']}",
+        value=f"```{away_syntax}{game['away_odds']:+.0f}```",
+        inline=True
+    )
+    embed.add_field(name=DIVIDER, value="\u200b", inline=False)
+
+def build_card(game_id: str, game: dict, winners_text: str = "", losers_text: str = "") -> discord.Embed:
+    """The game card for whatever state the game is in"""
+    state = card_state(game)
+    sport = game.get('sport', 'NFL')
+    emoji = "🏈" if sport == "NFL" else "🏟️"
+    title = f"{emoji} {game['home_team']} vs {game['away_team']}"
+
+    if state == 'final':
+        winner = game['result']
+        winner_team = game['home_team'] if winner == 'home' else game['away_team']
+        embed = discord.Embed(title=title, description=f"**🏁 FINAL** • Winner: **{winner_team}**", color=FINAL_COLOR)
+        # Show winner in green, loser in red
+        if winner == 'home':
+            _odds_fields(embed, game, "diff\n+", "diff\n-")
+        else:
+            _odds_fields(embed, game, "diff\n-", "diff\n+")
+        if winners_text:
+            embed.add_field(name="🎉 Winners", value=winners_text, inline=False)
+        if losers_text:
+            embed.add_field(name="😢 Losers", value=losers_text, inline=False)
+        embed.set_footer(text=f"Game ID: {display_game_id(game_id)} • FINAL")
+        return embed
+
+    game_time = datetime.fromisoformat(game['start_time'])
+    kickoff = int(game_time.timestamp())
+    if state == 'locked':
+        description, color = f"**{sport}** • 🔒 **BETTING CLOSED**", LOCKED_COLOR
+    elif state == 'live':
+        description, color = f"**{sport}** • 🔴 **LIVE** • {game['home_score']}-{game['away_score']}", LIVE_COLOR
+    else:
+        description, color = f"**{sport}** • <t:{kickoff}:R>", OPEN_COLOR
+    embed = discord.Embed(title=title, description=description, color=color)
+
+    # Color-code favorite (green) vs underdog (red)
+    home_syntax = "diff\n+" if game['home_odds'] < 0 else "diff\n-"
+    away_syntax = "diff\n+" if game['away_odds'] < 0 else "diff\n-"
+    _odds_fields(embed, game, home_syntax, away_syntax)
+
+    if state != 'locked' and game.get('lock_time'):
+        lock_timestamp = int(datetime.fromisoformat(game['lock_time']).timestamp())
+        embed.add_field(name="🔒 Betting Closes", value=f"<t:{lock_timestamp}:R>", inline=True)
+
+    embed.add_field(name="🕐 Kickoff", value=f"<t:{kickoff}:F>", inline=False)
+    footer = f"Game ID: {display_game_id(game_id)}"
+    embed.set_footer(text=f"{footer} • LOCKED" if state == 'locked' else footer)
+    embed.timestamp = game_time
+    return embed
+
+class GameCards:
+    """Rendered game cards, reused until the game's version changes.
+
+    The returned embeds are shared, so callers must not modify them.
+    """
+    def __init__(self):
+        self._cards = {}  # game_id -> (version, winners_text, losers_text, embed)
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, game_id: str, game: dict, version: int, winners_text: str = "", losers_text: str = "") -> discord.Embed:
+        cached = self._cards.get(game_id)
+        if cached is not None and cached[:3] == (version, winners_text, losers_text):
+            self.hits += 1
+            return cached[3]
+        self.misses += 1
+        embed = build_card(game_id, game, winners_text, losers_text)
+        self._cards[game_id] = (version, winners_text, losers_text, embed)
+        return embed
+
+    def forget(self, game_id: str):
+        self._cards.pop(game_id, None)
@@ -0,0 +1,324 @@
+import aiohttp
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+SCOREBOARD_URL = 'https://site.api.espn.com/apis/site/v2/sports/football/{league}/scoreboard'
+
+LEAGUE_SPORTS = {'nfl': 'NFL', 'college-football': 'CFB'}
+SPORT_LEAGUES = {sport: league for league, sport in LEAGUE_SPORTS.items()}
+
+DEFAULT_ODDS = -110.0
+
+class Game:
+    """One scoreboard event, flattened to the fields the bot uses"""
+    __slots__ = ('espn_id', 'league', 'home_team', 'away_team', 'start', 'state', 'completed',
+                 'home_score', 'away_score', 'home_odds', 'away_odds')
+
+    def __init__(self, espn_id, league, home_team, away_team, start, state, completed,
+                 home_score, away_score, home_odds, away_odds):
+        self.espn_id = espn_id
+        self.league = league
+        self.home_team = home_team
+        self.away_team = away_team
+        self.start = start  # kickoff, epoch seconds
+        self.state = state  # 'pre', 'in' or 'post'
+        self.completed = completed
+        self.home_score = home_score
+        self.away_score = away_score
+        self.home_odds = home_odds
+        self.away_odds = away_odds
+
+    @property
+    def sport(self):
+        return LEAGUE_SPORTS.get(self.league, self.league.upper())
+
+    @property
+    def final(self):
+        return self.completed or self.state == 'post'
+
+    def winner(self):
+        """'home', 'away', or None while unfinished or tied"""
+        if not self.final or self.home_score is None or self.away_score is None:
+            return None
+        if self.home_score == self.away_score:
+            return None
+        return 'home' if self.home_score > self.away_score else 'away'
+
+    def __repr__(self):
+        return f"Game({self.league} {self.home_team} vs {self.away_team} {self.state} {self.espn_id})"
+
+    def to_row(self) -> list:
+        """Field values in __slots__ order, the compact form sent by the ingest worker"""
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+# Spread (home perspective) -> (home, away) moneyline estimate, used when ESPN has no moneyline
+SPREAD_ODDS = (
+    (-7, (-300.0, 250.0)),
+    (-3, (-180.0, 155.0)),
+    (-0.5, (-130.0, 110.0)),
+)
+
+@lru_cache(maxsize=1024)
+def _parse_time(date: str) -> int:
+    # Most of a slate shares a handful of kickoff times, so this is nearly always a cache hit
+    return int(datetime.fromisoformat(date.replace('Z', '+00:00')).timestamp())
+
+def _score(competitor):
+    try:
+        return int(competitor.get('score'))
+    except (TypeError, ValueError):
+        return None
+
+def parse_odds(competition: dict):
+    """(home_odds, away_odds): moneyline if ESPN has one, else estimated from the spread"""
+    odds_data = competition.get('odds')
+    if not odds_data:
+        return DEFAULT_ODDS, DEFAULT_ODDS
+    first_odds = odds_data[0]
+
+    home_ml = (first_odds.get('homeTeamOdds') or {}).get('moneyLine') or first_odds.get('homeMoneyLine')
+    away_ml = (first_odds.get('awayTeamOdds') or {}).get('moneyLine') or first_odds.get('awayMoneyLine')
+    try:
+        home_odds = float(home_ml) if home_ml else DEFAULT_ODDS
+        away_odds = float(away_ml) if away_ml else DEFAULT_ODDS
+    except (TypeError, ValueError):
+        home_odds = away_odds = DEFAULT_ODDS
+    if home_odds != DEFAULT_ODDS or away_odds != DEFAULT_ODDS:
+        return home_odds, away_odds
+
+    # No moneyline: the team with the negative spread is favored
+    try:
+        spread = float(first_odds.get('spread'))
+    except (TypeError, ValueError):
+        return DEFAULT_ODDS, DEFAULT_ODDS
+    for threshold, (fav, dog) in SPREAD_ODDS:
+        if spread < threshold:
+            return fav, dog
+        if spread > -threshold:
+            return dog, fav
+    return DEFAULT_ODDS, DEFAULT_ODDS
+
+def parse_event(event: dict, league: str) -> Optional[Game]:
+    competition = event['competitions'][0]
+    competitors = competition['competitors']
+    home = away = None
+    for competitor in competitors:
+        side = competitor.get('homeAway')
+        if side == 'home':
+            home = competitor
+        elif side == 'away':
+            away = competitor
+    if home is None or away is None:
+        # Older payloads without homeAway list the home team first
+        if len(competitors) < 2:
+            return None
+        home, away = competitors[0], competitors[1]
+
+    status = event['status']['type']
+    home_odds, away_odds = parse_odds(competition)
+    return Game(
+        str(event.get('id')),
+        league,
+        home['team']['abbreviation'],
+        away['team']['abbreviation'],
+        _parse_time(event['date']),
+        status.get('state'),
+        bool(status.get('completed', False)),
+        _score(home),
+        _score(away),
+        home_odds,
+        away_odds
+    )
+
+def parse_scoreboard(data: dict, league: str) -> list:
+    """All well-formed events on a scoreboard payload as Game records"""
+    games = []
+    for event in data.get('events', ()):
+        try:
+            game = parse_event(event, league)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"Skipping malformed {league} event {event.get('id')}: {e!r}")
+            continue
+        if game is not None:
+            games.append(game)
+    return games
+
+class ESPNClient:
+    """One pooled, keep-alive HTTP session for all ESPN traffic, with request metrics"""
+    def __init__(self, timeout=10, pool_size=10, keepalive=60, scoreboard_ttl=60, scoreboard_url=SCOREBOARD_URL,
+                 on_request=None):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.scoreboard_ttl = scoreboard_ttl
+        self.scoreboard_url = scoreboard_url  # overridable to point at a local stand-in
+        self.session = None
+        # Scoreboard cache: league -> {'data', 'games', 'fetched_at', 'etag', 'last_modified', 'version'}
+        self._boards = {}
+        self._board_fetches = {}  # league -> in-flight task shared by concurrent callers
+        self.cache_hits = 0
+        self.cache_revalidated = 0
+        # Metrics
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latencies = deque(maxlen=200)  # seconds, most recent requests
+        self.on_request = on_request  # called with each request's duration in seconds
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=5)
+            )
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def get_json(self, url: str):
+        """GET a JSON document; returns None on a non-200 answer or a network error"""
+        status, _, data = await self._get(url)
+        return data if status == 200 else None
+
+    async def _get(self, url: str, headers=None):
+        """Returns (status, response headers, parsed body); status is None on a network error"""
+        await self.start()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            async with self.session.get(url, headers=headers) as resp:
+                if resp.status == 304:
+                    return 304, resp.headers, None
+                if resp.status != 200:
+                    self.errors += 1
+                    print(f"ESPN returned {resp.status} for {url}")
+                    return resp.status, resp.headers, None
+                return 200, resp.headers, await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            print(f"ESPN request failed for {url}: {e!r}")
+            return None, {}, None
+        finally:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - started
+            self.latencies.append(elapsed)
+            if self.on_request is not None:
+                self.on_request(elapsed)
+
+    async def scoreboard(self, league: str, max_age=None):
+        """Cached scoreboard for a league, revalidated with ESPN once it is older than max_age seconds"""
+        max_age = self.scoreboard_ttl if max_age is None else max_age
+        entry = self._boards.get(league)
+        if entry and time.monotonic() - entry['fetched_at'] < max_age:
+            self.cache_hits += 1
+            return entry['data']
+
+        # Everyone asking while a download is running waits on that same download
+        task = self._board_fetches.get(league)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh_scoreboard(league))
+            self._board_fetches[league] = task
+            task.add_done_callback(lambda _: self._board_fetches.pop(league, None))
+        return await asyncio.shield(task)
+
+    async def _refresh_scoreboard(self, league: str):
+        entry = self._boards.get(league)
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        status, resp_headers, data = await self._get(self.scoreboard_url.format(league=league), headers)
+        if status == 304 and entry:
+            self.cache_revalidated += 1
+            entry['fetched_at'] = time.monotonic()
+            return entry['data']
+        if status != 200:
+            # Serve the stale copy rather than nothing
+            return entry['data'] if entry else None
+
+        self._boards[league] = {
+            'data': data,
+            'games': None,  # parsed on first use
+            'fetched_at': time.monotonic(),
+            'etag': resp_headers.get('ETag'),
+            'last_modified': resp_headers.get('Last-Modified'),
+            'version': (entry['version'] + 1) if entry else 1
+        }
+        return data
+
+    async def scoreboards(self, leagues, concurrency=4, max_age=None) -> dict:
+        """Fetch several leagues at once; a league that fails maps to None without affecting the others"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(league):
+            async with semaphore:
+                return await self.scoreboard(league, max_age)
+
+        leagues = list(dict.fromkeys(leagues))
+        results = await asyncio.gather(*(fetch(league) for league in leagues), return_exceptions=True)
+        boards = {}
+        for league, result in zip(leagues, results):
+            if isinstance(result, BaseException):
+                print(f"Error fetching {league} scoreboard: {result!r}")
+                result = None
+            boards[league] = result
+        return boards
+
+    def scoreboard_version(self, league: str) -> int:
+        """Bumped whenever ESPN sends a changed scoreboard (0 before the first fetch)"""
+        entry = self._boards.get(league)
+        return entry['version'] if entry else 0
+
+    async def games(self, leagues, concurrency=4, max_age=None) -> dict:
+        """league -> list of Game records (None if the scoreboard couldn't be fetched)"""
+        boards = await self.scoreboards(leagues, concurrency, max_age)
+        parsed = {}
+        for league, data in boards.items():
+            if data is None:
+                parsed[league] = None
+                continue
+            entry = self._boards.get(league)
+            if entry is not None and entry['data'] is data:
+                # Parse each payload once, however many consumers read it
+                if entry['games'] is None:
+                    entry['games'] = parse_scoreboard(data, league)
+                parsed[league] = entry['games']
+            else:
+                parsed[league] = parse_scoreboard(data, league)
+        return parsed
+
+    def stats(self) -> dict:
+        recent = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'pool_size': self.pool_size,
+            'cache_hits': self.cache_hits,
+            'cache_revalidated': self.cache_revalidated,
+            'latency_avg': sum(recent) / len(recent) if recent else 0.0,
+            'latency_p95': recent[int(len(recent) * 0.95) - 1] if recent else 0.0,
+            'latency_max': recent[-1] if recent else 0.0
+        }
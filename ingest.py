@@ -0,0 +1,205 @@
+"""Scoreboard ingest worker, run apart from the bot so ESPN downloads and parsing stay off its event loop.
+
+    python ingest.py                                   # serve on 127.0.0.1:8765
+    python ingest.py --port 9000 --interval 20
+    python ingest.py --espn-url http://127.0.0.1:8081/{league}   # against a local stand-in
+
+The worker polls each league, turns the scoreboard into Game rows and sends
+newline-delimited JSON to every connected bot:
+
+    {"t": "board", "league": ..., "version": n, "games": [row, ...]}       on connect
+    {"t": "diff", "league": ..., "version": n, "upsert": [row, ...], "remove": [espn_id, ...]}
+
+Start the bot with INGEST_ADDR=127.0.0.1:8765 to use it. Either side can be
+restarted: the bot reconnects and gets a fresh board, and while the worker is
+down it fetches from ESPN itself.
+"""
+import argparse
+import asyncio
+import json
+
+from espn import ESPNClient, Game, SCOREBOARD_URL
+
+LEAGUES = ('nfl', 'college-football')
+STREAM_LIMIT = 4 * 1024 * 1024  # a whole college-football board arrives as one line
+
+def _encode(message: dict) -> bytes:
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+class IngestWorker:
+    def __init__(self, client: ESPNClient, leagues=LEAGUES, interval=30, send_timeout=10):
+        self.client = client
+        self.leagues = leagues
+        self.interval = interval
+        self.send_timeout = send_timeout  # a bot that can't take a message in this long is dropped
+        self.boards = {}  # league -> {espn_id: row}
+        self.versions = {}  # league -> version of the board last sent
+        self.clients = set()  # connected StreamWriters
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self._on_connect, host, port, limit=STREAM_LIMIT)
+        print(f"Ingest worker listening on {host}:{port}")
+        try:
+            async with server:
+                await self.poll_forever()
+        finally:
+            for writer in list(self.clients):
+                writer.close()
+
+    async def _on_connect(self, reader, writer):
+        # A new bot starts from the full boards, then follows the diffs
+        for league, rows in self.boards.items():
+            writer.write(_encode({'t': 'board', 'league': league, 'version': self.versions[league],
+                                  'games': list(rows.values())}))
+        self.clients.add(writer)
+        try:
+            await asyncio.wait_for(writer.drain(), self.send_timeout)
+            await reader.read()  # bots never send anything; returns when they disconnect
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def poll_forever(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"Ingest poll failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    async def poll(self):
+        boards = await self.client.games(self.leagues, max_age=0)
+        for league, games in boards.items():
+            version = self.client.scoreboard_version(league)
+            if games is None or version == self.versions.get(league):
+                continue  # fetch failed, or ESPN answered 304
+            await self._publish(league, version, {game.espn_id: game.to_row() for game in games})
+
+    async def _publish(self, league, version, rows):
+        old = self.boards.get(league, {})
+        upsert = [row for espn_id, row in rows.items() if old.get(espn_id) != row]
+        remove = [espn_id for espn_id in old if espn_id not in rows]
+        self.boards[league] = rows
+        self.versions[league] = version
+        if not upsert and not remove:
+            return
+        message = _encode({'t': 'diff', 'league': league, 'version': version, 'upsert': upsert, 'remove': remove})
+        await asyncio.gather(*(self._send(writer, message) for writer in list(self.clients)))
+
+    async def _send(self, writer, message: bytes):
+        # Without the drain a bot that stops reading would have every diff buffered here
+        if writer.is_closing():
+            self.clients.discard(writer)
+            return
+        try:
+            writer.write(message)
+            await asyncio.wait_for(writer.drain(), self.send_timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            print(f"Dropping slow ingest subscriber {writer.get_extra_info('peername')}")
+            self.clients.discard(writer)
+            writer.transport.abort()  # close() would wait to flush what it couldn't take
+
+class IngestFeed:
+    """Bot side of the worker connection, answering games()/scoreboard_version() like ESPNClient.
+
+    Leagues the worker hasn't sent yet, or everything while it is unreachable,
+    are served by the fallback client.
+    """
+    def __init__(self, host, port, fallback: ESPNClient, retry=5):
+        self.host = host
+        self.port = port
+        self.fallback = fallback
+        self.retry = retry
+        self.connected = False
+        self.boards = {}  # league -> {espn_id: Game}
+        self.lists = {}  # league -> cached list of the board's games
+        self.versions = {}
+        self.updates = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+            except OSError as e:
+                print(f"Ingest worker unreachable at {self.host}:{self.port}: {e}")
+                await asyncio.sleep(self.retry)
+                continue
+            print(f"Connected to ingest worker at {self.host}:{self.port}")
+            self.connected = True
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self.apply(json.loads(line))
+            except (ConnectionError, ValueError, KeyError, TypeError) as e:
+                # A message apply() can't take may have left a board half updated, so
+                # reconnect for fresh boards rather than skip it (or let the task die)
+                print(f"Ingest connection dropped: {e!r}")
+            finally:
+                self.connected = False
+                # The next connection sends full boards again
+                self.boards.clear()
+                self.lists.clear()
+                writer.close()
+            await asyncio.sleep(self.retry)
+
+    def apply(self, message: dict):
+        league = message['league']
+        if message['t'] == 'board':
+            board = self.boards[league] = {}
+            rows = message['games']
+        else:
+            board = self.boards.setdefault(league, {})
+            rows = message['upsert']
+            for espn_id in message['remove']:
+                board.pop(espn_id, None)
+        for row in rows:
+            game = Game.from_row(row)
+            board[game.espn_id] = game
+        self.lists.pop(league, None)
+        self.versions[league] = message['version']
+        self.updates += 1
+
+    async def games(self, leagues, concurrency=4, max_age=None) -> dict:
+        missing = [league for league in leagues if not self.connected or league not in self.boards]
+        parsed = await self.fallback.games(missing, concurrency, max_age) if missing else {}
+        for league in leagues:
+            if league in parsed:
+                continue
+            if league not in self.lists:
+                self.lists[league] = list(self.boards[league].values())
+            parsed[league] = self.lists[league]
+        return parsed
+
+    def scoreboard_version(self, league: str) -> int:
+        if self.connected and league in self.boards:
+            return self.versions[league]
+        return self.fallback.scoreboard_version(league)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=30, help='seconds between scoreboard polls')
+    parser.add_argument('--send-timeout', type=float, default=10, help='seconds a bot may take to accept a message before it is dropped')
+    parser.add_argument('--espn-url', default=SCOREBOARD_URL, help='scoreboard URL template with {league}')
+    args = parser.parse_args()
+    worker = IngestWorker(ESPNClient(scoreboard_url=args.espn_url), interval=args.interval,
+                          send_timeout=args.send_timeout)
+    try:
+        asyncio.run(worker.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
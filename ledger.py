@@ -0,0 +1,234 @@
+"""Double-entry ledger of every balance change, in integer cents.
+
+    python ledger.py balance <user_id>      # replayed from the latest snapshot
+    python ledger.py history <user_id>
+    python ledger.py verify                 # every entry balances, snapshots agree with the log
+
+Each entry moves money between accounts and its legs sum to zero: a bet stake
+is `user:<id>` -amount and `house:bets` +amount, a transfer is two user legs.
+Entries are JSON lines in segment files under ledger/, named after their first
+sequence number. Every SNAPSHOT_EVERY entries the balances of all accounts are
+written to a snapshot and a new segment starts, so rebuilding a balance reads
+one snapshot and replays only the segments after it.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+LEDGER_DIR = 'ledger'
+SNAPSHOT_EVERY = 50000
+CENTS = 100
+
+# Where the other side of each kind of entry goes
+HOUSE_ACCOUNTS = {
+    'opening': 'house:opening',  # starting balances, and balances from before the ledger
+    'adjustment': 'house:opening',  # stored balances that disagreed with the ledger at startup
+    'stake': 'house:bets',
+    'payout': 'house:bets',
+    'refund': 'house:bets',
+    'penalty': 'house:bets',
+    'daily': 'house:bonus',
+    'loan': 'house:loans',
+    'repay': 'house:loans',
+    'slots': 'house:slots',
+    'purchase': 'house:shop'
+}
+
+def user_account(user_id: str) -> str:
+    return f'user:{user_id}'
+
+def _name(seq: int, ext: str) -> str:
+    return f'{seq:012d}{ext}'
+
+class Ledger:
+    """Entries are posted on the event loop and written by the storage writer thread.
+
+    balances is the live state, with every posted entry applied; the writer
+    keeps its own copy of what is on disk, which is what snapshots are made of.
+    """
+    def __init__(self, directory=LEDGER_DIR, snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.balances = {}  # account -> cents
+        self.seq = 0  # last entry posted
+        self.pending = []  # posted, not yet handed to the writer
+        # Writer thread state
+        self.written_seq = 0  # last entry on disk
+        self._written = {}
+        self._segment = 1  # first seq of the segment being appended to
+        self._segment_entries = 0
+        self._segment_end = None  # end of its last complete line, to cut a torn one off
+
+    def _path(self, seq: int, ext: str) -> str:
+        return os.path.join(self.directory, _name(seq, ext))
+
+    def _files(self, ext: str) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(ext)]) for name in names if name.endswith(ext) and name[:-len(ext)].isdigit())
+
+    def _replay(self):
+        """(balances, last seq, seq of the last segment, its entries, its valid end) from the latest snapshot on"""
+        snapshots = self._files('.snap')
+        balances, start = {}, 1
+        if snapshots:
+            start = snapshots[-1]
+            with open(self._path(start, '.snap')) as f:
+                balances = json.load(f)
+        seq, segment, entries, end = start - 1, start, 0, 0
+        for segment in [s for s in self._files('.log') if s >= start] or [start]:
+            entries, end = 0, 0
+            for entry, end in self._read(segment):
+                for account, cents in entry['legs']:
+                    balances[account] = balances.get(account, 0) + cents
+                seq = entry['seq']
+                entries += 1
+        return balances, seq, segment, entries, end
+
+    def _read(self, segment: int):
+        """(entry, end offset) for each complete line of a segment; stops at a torn last line"""
+        try:
+            f = open(self._path(segment, '.log'), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            end = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                end += len(line)
+                yield json.loads(line), end
+
+    def load(self):
+        """Rebuild the balances from the latest snapshot and the entries after it"""
+        balances, self.seq, self._segment, self._segment_entries, self._segment_end = self._replay()
+        self.balances = balances
+        self._written = dict(balances)
+        self.written_seq = self.seq
+        self.pending = []
+
+    def post(self, kind: str, legs: list, ref=None) -> dict:
+        """Record one movement of money; legs are (account, cents) pairs that must sum to zero"""
+        if not legs or any(not isinstance(cents, int) for _, cents in legs):
+            raise ValueError(f"Ledger legs must be integer cents: {legs!r}")
+        if sum(cents for _, cents in legs) != 0:
+            raise ValueError(f"Unbalanced ledger entry: {legs!r}")
+        self.seq += 1
+        entry = {'seq': self.seq, 'ts': int(time.time()), 'kind': kind, 'ref': ref, 'legs': [list(leg) for leg in legs]}
+        for account, cents in legs:
+            self.balances[account] = self.balances.get(account, 0) + cents
+        self.pending.append(entry)
+        return entry
+
+    def take_pending(self) -> list:
+        entries, self.pending = self.pending, []
+        return entries
+
+    def requeue(self, entries: list):
+        """Put back entries whose write failed, ahead of anything posted since.
+
+        Entries that did reach disk (the failure came after them) are dropped,
+        or the retry would append them twice.
+        """
+        self.pending[:0] = [entry for entry in entries if entry['seq'] > self.written_seq]
+
+    def write(self, entries: list):
+        """Append entries to the current segment (writer thread); snapshots when the segment is full"""
+        if not entries:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(self._segment, '.log')
+        with open(path, 'ab') as f:
+            if self._segment_end is not None and f.tell() != self._segment_end:
+                f.truncate(self._segment_end)  # a torn line from a crash would corrupt the next one
+            f.write(b''.join(json.dumps(entry, separators=(',', ':')).encode() + b'\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+            self._segment_end = f.tell()
+        self.written_seq = entries[-1]['seq']
+        for entry in entries:
+            for account, cents in entry['legs']:
+                self._written[account] = self._written.get(account, 0) + cents
+        self._segment_entries += len(entries)
+        if self._segment_entries >= self.snapshot_every:
+            self._snapshot(entries[-1]['seq'] + 1)
+
+    def _snapshot(self, next_seq: int):
+        # Balances before next_seq; the segment starting there is all a replay has to read
+        path = self._path(next_seq, '.snap')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self._written, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._segment = next_seq
+        self._segment_entries = 0
+        self._segment_end = 0
+
+    def replay(self, account=None):
+        """Balances as written on disk (or one account's), independent of the live state"""
+        balances = self._replay()[0]
+        return balances if account is None else balances.get(account, 0)
+
+    def history(self, account: str, limit=20) -> list:
+        """The account's most recent entries, newest first, reading back one segment at a time"""
+        found = []
+        for segment in reversed(self._files('.log')):
+            matches = [entry for entry, _ in self._read(segment)
+                       if any(leg[0] == account for leg in entry['legs'])]
+            found.extend(reversed(matches))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def audit(self, expected: dict) -> dict:
+        """account -> (expected cents, ledger cents) for every account whose live balance disagrees"""
+        return {account: (cents, self.balances.get(account, 0)) for account, cents in expected.items()
+                if self.balances.get(account, 0) != cents}
+
+    def verify(self) -> list:
+        """Problems found re-reading every segment: unbalanced entries, gaps, snapshots that don't match"""
+        problems = []
+        snapshots = set(self._files('.snap'))
+        balances, seq = {}, 0
+        for segment in self._files('.log'):
+            if segment in snapshots:
+                with open(self._path(segment, '.snap')) as f:
+                    stored = json.load(f)
+                if {k: v for k, v in stored.items() if v} != {k: v for k, v in balances.items() if v}:
+                    problems.append(f"snapshot {segment} disagrees with the entries before it")
+            for entry, _ in self._read(segment):
+                if entry['seq'] != seq + 1:
+                    problems.append(f"entry {entry['seq']} follows {seq}")
+                if sum(cents for _, cents in entry['legs']) != 0:
+                    problems.append(f"entry {entry['seq']} does not balance")
+                for account, cents in entry['legs']:
+                    balances[account] = balances.get(account, 0) + cents
+                seq = entry['seq']
+        return problems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=LEDGER_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('balance').add_argument('user_id')
+    history = commands.add_parser('history')
+    history.add_argument('user_id')
+    history.add_argument('--limit', type=int, default=20)
+    commands.add_parser('verify')
+    args = parser.parse_args()
+
+    ledger = Ledger(args.dir)
+    if args.command == 'balance':
+        print(f"${ledger.replay(user_account(args.user_id)) / CENTS:,.2f}")
+    elif args.command == 'history':
+        for entry in ledger.history(user_account(args.user_id), args.limit):
+            print(json.dumps(entry))
+    else:
+        problems = ledger.verify()
+        print("\n".join(problems) if problems else "Ledger OK")
+        sys.exit(1 if problems else 0)
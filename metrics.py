@@ -0,0 +1,161 @@
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)  # bytes
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'Histogram'):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolating within the bucket the q-th observation falls in (capped at the max seen)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                return min(lower + (self.buckets[i] - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+class Metrics:
+    """Histograms keyed by name and labels, plus gauges read from collectors at scrape time.
+
+    Observations may come from the storage writer thread; series are only ever
+    added, so a scrape on the loop sees at worst a slightly stale count.
+    """
+    def __init__(self):
+        self._meta = {}  # name -> (help text, buckets)
+        self._series = {}  # (name, sorted label items) -> Histogram
+        self._collectors = []  # callables yielding (name, labels, value) gauges
+
+    def register(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self._meta[name] = (help_text, buckets)
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._series.get(key)
+        if histogram is None:
+            buckets = self._meta.get(name, ('', LATENCY_BUCKETS))[1]
+            histogram = self._series.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator recording each call of a coroutine function, with an ok/error outcome label"""
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = 'ok'
+                    return result
+                finally:
+                    self.observe(name, time.perf_counter() - started, outcome=outcome, **labels)
+            return wrapper
+        return decorate
+
+    def series(self, name: str, *by: str) -> dict:
+        """Histograms of `name` merged per value of the `by` labels, e.g. series('x', 'handler')"""
+        merged = {}
+        for (series_name, labels), histogram in list(self._series.items()):
+            if series_name != name:
+                continue
+            labels = dict(labels)
+            key = tuple(labels.get(label, '') for label in by)
+            if key not in merged:
+                merged[key] = Histogram(histogram.buckets)
+            merged[key].merge(histogram)
+        return merged
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        by_name = {}
+        for (name, labels), histogram in sorted(list(self._series.items()), key=lambda item: item[0]):
+            by_name.setdefault(name, []).append((labels, histogram))
+        for name, series in by_name.items():
+            help_text = self._meta.get(name, ('', None))[0]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, n in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        gauges = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                print(f"Metrics collector failed: {e!r}")
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {float(value)!r}")
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        """Serve render() at http://host:port/metrics; call cleanup() on the returned runner to stop"""
+        async def handle(request):
+            return web.Response(body=self.render().encode(),
+                                headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return runner
+
+def _labels(items) -> str:
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
@@ -0,0 +1,131 @@
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:  # optional, only used for very large games
+    np = None
+
+INSURANCE_REFUND = 0.5
+
+# The NumPy path is only tried from this many bets up. benchmarks/bench_settlement.py
+# measures it at about 0.5-0.6x the scalar loop at 1k-100k bets, since reading the
+# bet dicts into columns and building the per-bet results costs a Python pass either way
+VECTORIZE_MIN_BETS = 2000
+
+def potential_payout(amount: int, odds, doubled=False) -> int:
+    """Whole dollars a winning bet returns (stake included), rounded down once from the exact value.
+
+    Computed on fractions, so a bet the odds pay evenly (110 at -110 -> 210) isn't
+    shaved a dollar by float error the way amount * (1 + 100 / 110) is.
+    """
+    odds = Fraction(str(odds))
+    payout = amount * (1 + (odds / 100 if odds > 0 else 100 / abs(odds)))
+    return int(payout * 2 if doubled else payout)
+
+class Settlement:
+    """Everything a finished game does to its bettors, computed before anything is applied"""
+    def __init__(self):
+        self.payouts = []  # (user_id, amount, won, items) in bet order, for display
+        self.deltas = {}  # user_id -> balance change
+        self.winners = []  # user_ids credited with a win
+        self.losers = []  # user_ids charged a loss
+
+def settle_bets(bets: list, winner: str, balances: dict) -> Settlement:
+    """Payouts, insurance refunds and 2x penalties for every bet on a game.
+
+    balances maps user_id -> current balance; a 2x penalty never takes a user below zero.
+    """
+    result = Settlement()
+    for bet in bets:
+        user_id = bet['user_id']
+        used_items = bet.get('used_items', [])
+        if bet['team'] == winner:
+            payout = int(bet.get('potential_win', 0))  # whole dollars, but older bets stored a float
+            if payout > 0:
+                result.deltas[user_id] = result.deltas.get(user_id, 0) + payout
+            result.winners.append(user_id)
+            result.payouts.append((user_id, payout, True, used_items))
+            continue
+
+        result.losers.append(user_id)
+        if 'insurance' in used_items:
+            refund = int(bet['amount'] * INSURANCE_REFUND)
+            if refund > 0:
+                result.deltas[user_id] = result.deltas.get(user_id, 0) + refund
+            result.payouts.append((user_id, refund, False, ['insurance']))
+        elif '2x_multiplier' in used_items:
+            # Double loss penalty - lose additional bet amount (if they can afford it)
+            current_balance = balances[user_id] + result.deltas.get(user_id, 0)
+            penalty = min(bet['amount'], current_balance)
+            if penalty > 0:
+                result.deltas[user_id] = result.deltas.get(user_id, 0) - penalty
+                result.payouts.append((user_id, -penalty, False, ['2x_penalty']))
+            else:
+                result.payouts.append((user_id, 0, False, ['2x_nofunds']))
+        else:
+            result.payouts.append((user_id, 0, False, []))
+    return result
+
+def settle_bets_vectorized(bets: list, winner: str, balances: dict) -> Settlement:
+    """Same result as settle_bets, computed on NumPy columns instead of per-bet dicts"""
+    user_index = {}  # user_id -> column position, in order of first bet
+    user_ids = [bet['user_id'] for bet in bets]
+    user_idx = np.array([user_index.setdefault(user_id, len(user_index)) for user_id in user_ids], dtype=np.int64)
+    used_items = [bet.get('used_items', []) for bet in bets]
+    won = np.array([bet['team'] == winner for bet in bets], dtype=bool)
+    amount = np.array([bet['amount'] for bet in bets], dtype=np.float64)
+    potential_win = np.array([bet.get('potential_win', 0) for bet in bets], dtype=np.float64)
+    insured = np.array(['insurance' in items for items in used_items], dtype=bool)
+    doubled = np.array(['2x_multiplier' in items for items in used_items], dtype=bool)
+    users = list(user_index)
+    balance = np.array([balances[user_id] for user_id in users], dtype=np.float64)
+
+    refund_mask = ~won & insured
+    penalty_mask = ~won & ~insured & doubled
+    if penalty_mask.any():
+        # A 2x penalty is capped by what the user's earlier bets on this game left them,
+        # which is sequential; leave users with several bets to the scalar loop
+        bets_per_user = np.bincount(user_idx, minlength=len(users))
+        if (bets_per_user[user_idx[penalty_mask]] > 1).any():
+            return settle_bets(bets, winner, balances)
+
+    # int() truncates toward zero, and so does np.trunc
+    payout = np.where(won, np.trunc(potential_win), 0).astype(np.int64)
+    refund = np.where(refund_mask, np.trunc(amount * INSURANCE_REFUND), 0).astype(np.int64)
+    penalty = np.where(penalty_mask, np.minimum(amount, balance[user_idx]), 0).astype(np.int64)
+    delta = np.maximum(payout, 0) + np.maximum(refund, 0) - np.maximum(penalty, 0)
+
+    # Scatter every bet's change onto its user
+    user_delta = np.zeros(len(users), dtype=np.int64)
+    np.add.at(user_delta, user_idx, delta)
+    touched = np.zeros(len(users), dtype=bool)
+    touched[user_idx[delta != 0]] = True
+
+    result = Settlement()
+    for user_id, changed, change in zip(users, touched.tolist(), user_delta.tolist()):
+        if changed:
+            result.deltas[user_id] = change
+    for user_id, items, is_winner, is_refund, is_penalty, paid, refunded, charged in zip(
+            user_ids, used_items, won.tolist(), refund_mask.tolist(),
+            penalty_mask.tolist(), payout.tolist(), refund.tolist(), penalty.tolist()):
+        if is_winner:
+            result.winners.append(user_id)
+            result.payouts.append((user_id, paid, True, items))
+            continue
+        result.losers.append(user_id)
+        if is_refund:
+            result.payouts.append((user_id, refunded, False, ['insurance']))
+        elif is_penalty:
+            if charged > 0:
+                result.payouts.append((user_id, -charged, False, ['2x_penalty']))
+            else:
+                result.payouts.append((user_id, 0, False, ['2x_nofunds']))
+        else:
+            result.payouts.append((user_id, 0, False, []))
+    return result
+
+def settle(bets: list, winner: str, balances: dict, vectorize=False) -> Settlement:
+    """settle_bets, or the NumPy path for very large games when asked for and installed"""
+    if vectorize and np is not None and len(bets) >= VECTORIZE_MIN_BETS:
+        return settle_bets_vectorized(bets, winner, balances)
+    return settle_bets(bets, winner, balances)
@@ -0,0 +1,74 @@
+"""Per-user betting stats, updated as each bet settles so reading them never scans history.
+
+A user record carries two of these:
+
+    'stats':    flat totals, see new_stats()
+    'stats_by': 'sport:NFL' / 'league:nfl' -> [bets, wins, staked, profit]
+
+Entries of stats_by are replaced, never changed in place, so the two-level
+copies handed to the storage thread stay independent of later settlements.
+"""
+
+def new_stats() -> dict:
+    return {
+        'bets': 0,
+        'wins': 0,
+        'losses': 0,
+        'staked': 0,
+        'profit': 0,  # payouts, refunds and penalties minus stakes
+        'decimal_odds_total': 0.0,  # sum of the odds taken as decimal odds, which average meaningfully
+        'odds_bets': 0,  # bets in that sum; records from before it kept American odds, which don't
+        'streak': 0,  # positive: current run of wins, negative: of losses
+        'best_streak': 0,
+        'worst_streak': 0  # longest run of losses, as a positive count
+    }
+
+def decimal_odds(american) -> float:
+    """Total return per unit staked: -110 -> 1.909, +150 -> 2.5"""
+    american = float(american)
+    return 1 + (american / 100 if american > 0 else 100 / abs(american))
+
+def american_odds(decimal: float) -> float:
+    return (decimal - 1) * 100 if decimal >= 2 else -100 / (decimal - 1)
+
+def record_result(user: dict, bet: dict, payout: int, won: bool, sport=None, league=None) -> int:
+    """Fold one settled bet into the user's stats; returns the bet's profit"""
+    stats = user.setdefault('stats', new_stats())
+    profit = payout - bet['amount']
+    stats['bets'] += 1
+    stats['wins' if won else 'losses'] += 1
+    stats['staked'] += bet['amount']
+    stats['profit'] += profit
+    if bet.get('odds'):
+        stats['decimal_odds_total'] = stats.get('decimal_odds_total', 0.0) + decimal_odds(bet['odds'])
+        stats['odds_bets'] = stats.get('odds_bets', 0) + 1
+    if won:
+        stats['streak'] = stats['streak'] + 1 if stats['streak'] > 0 else 1
+        stats['best_streak'] = max(stats['best_streak'], stats['streak'])
+    else:
+        stats['streak'] = stats['streak'] - 1 if stats['streak'] < 0 else -1
+        stats['worst_streak'] = max(stats['worst_streak'], -stats['streak'])
+
+    breakdown = user.setdefault('stats_by', {})
+    for key in (f'sport:{sport}' if sport else None, f'league:{league}' if league else None):
+        if key:
+            bets, wins, staked, total = breakdown.get(key, (0, 0, 0, 0))
+            breakdown[key] = [bets + 1, wins + won, staked + bet['amount'], total + profit]
+    return profit
+
+def rates(stats: dict) -> dict:
+    """Rates derived from the totals"""
+    bets = stats['bets']
+    odds_bets = stats.get('odds_bets', 0)
+    return {
+        'roi': stats['profit'] / stats['staked'] if stats['staked'] else 0.0,
+        'win_rate': stats['wins'] / bets if bets else 0.0,
+        # Averaged as decimal odds and shown as American; None until a bet has been counted
+        'average_odds': american_odds(stats['decimal_odds_total'] / odds_bets) if odds_bets else None
+    }
+
+def breakdown(user: dict, kind: str) -> list:
+    """(name, bets, wins, staked, profit) for each sport or league, most bets first"""
+    prefix = kind + ':'
+    rows = [(key[len(prefix):], *values) for key, values in user.get('stats_by', {}).items() if key.startswith(prefix)]
+    return sorted(rows, key=lambda row: -row[1])
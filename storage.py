@@ -0,0 +1,409 @@
+import json
+import os
+import sqlite3
+
+DEFAULT_CONFIG = {'betting_channel_id': None, 'auto_fetch_enabled': False, 'bettor_role_id': None}
+
+# A changeset is what BettingSystem hands to commit():
+#   {'config': dict or None,
+#    'guild_configs': {guild_id: dict},
+#    'users': {user_id: record},
+#    'games': {game_id: record, or None when the game was deleted},
+#    'bets': [(game_id, bet), ...]}
+# A single JSONStorage/SQLiteStorage ignores 'guild_configs'; PartitionedStorage routes it.
+# commit() and checkpoint() return how many bytes they wrote (for SQLite, of row data).
+
+# Each guild's config, games and bets live in their own store in this directory
+GUILD_DIR = 'guilds'
+
+def scoped_game_id(guild_id, game_id: str) -> str:
+    """Stored id of a guild's game; the same matchup can be posted in many guilds"""
+    return f"{game_id}@{guild_id}" if guild_id else game_id
+
+def display_game_id(game_id: str) -> str:
+    """The id shown on cards and typed into commands, without the guild"""
+    return game_id.split('@', 1)[0]
+
+class JSONStorage:
+    """betting_data.json snapshot plus an append-only journal of changesets"""
+    # A single user can't be read without parsing the whole snapshot
+    point_reads = False
+
+    def __init__(self, data_file='betting_data.json', journal_file='betting_data.journal', checkpoint_every=500):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.checkpoint_every = checkpoint_every
+        # Last sequence number written and records since the last checkpoint
+        self._seq = 0
+        self._journal_records = 0
+
+    def load(self):
+        state = {'users': {}, 'games': {}, 'bets': {}, 'config': dict(DEFAULT_CONFIG)}
+        try:
+            with open(self.data_file, 'r') as f:
+                data = json.load(f)
+                state['users'] = data.get('users', {})
+                state['games'] = data.get('games', {})
+                state['bets'] = data.get('bets', {})
+                state['config'] = data.get('config', dict(DEFAULT_CONFIG))
+                self._seq = data.get('journal_seq', 0)
+        except FileNotFoundError:
+            pass
+        self._replay_journal(state)
+        return state
+
+    def _replay_journal(self, state):
+        """Apply journal records written after the last snapshot"""
+        try:
+            f = open(self.journal_file, 'r')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn append from a crash, nothing after it was committed
+                    break
+                if record['seq'] <= self._seq:
+                    continue
+                self._apply_record(state, record)
+                self._seq = record['seq']
+                self._journal_records += 1
+
+    def _apply_record(self, state, record):
+        kind = record['t']
+        if kind == 'user':
+            state['users'][record['id']] = record['v']
+        elif kind == 'game':
+            if record['v'] is None:
+                state['games'].pop(record['id'], None)
+                state['bets'].pop(record['id'], None)
+            else:
+                state['games'][record['id']] = record['v']
+                state['bets'].setdefault(record['id'], [])
+        elif kind == 'bet':
+            bets = state['bets'].setdefault(record['id'], [])
+            # A user has one bet per game; a changeset retried after a failed save repeats it
+            bets[:] = [bet for bet in bets if bet['user_id'] != record['v']['user_id']]
+            bets.append(record['v'])
+        elif kind == 'config':
+            state['config'] = record['v']
+
+    def needs_checkpoint(self, changes):
+        pending = len(changes['users']) + len(changes['games']) + len(changes['bets'])
+        return self._journal_records + pending >= self.checkpoint_every
+
+    def commit(self, changes):
+        records = []
+        if changes['config'] is not None:
+            records.append({'t': 'config', 'v': changes['config']})
+        for user_id, user in changes['users'].items():
+            records.append({'t': 'user', 'id': user_id, 'v': user})
+        for game_id, game in changes['games'].items():
+            records.append({'t': 'game', 'id': game_id, 'v': game})
+        for game_id, bet in changes['bets']:
+            records.append({'t': 'bet', 'id': game_id, 'v': bet})
+
+        seq = self._seq
+        for record in records:
+            seq += 1
+            record['seq'] = seq
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode()
+
+        # Unbuffered, so a failed append can be cut back off: the caller retries the
+        # whole changeset, and a partial copy left in front of it would replay twice
+        with open(self.journal_file, 'ab', buffering=0) as f:
+            start = f.tell()
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view):]
+            except BaseException:
+                os.ftruncate(f.fileno(), start)
+                raise
+
+        self._seq = seq
+        self._journal_records += len(records)
+        return len(data)
+
+    def checkpoint(self, state):
+        """Write a full snapshot and start a fresh journal"""
+        # Write next to the real file and rename over it, so a crash never leaves half a snapshot
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'users': state['users'],
+                'games': state['games'],
+                'bets': state['bets'],
+                'config': state['config'],
+                'journal_seq': self._seq
+            }, f, indent=2)
+            written = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+        # Records up to journal_seq are in the snapshot, so the journal can go
+        open(self.journal_file, 'w').close()
+        self._journal_records = 0
+        return written
+
+    def close(self):
+        pass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    start_time TEXT,
+    result TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_bets_game ON bets(game_id);
+CREATE INDEX IF NOT EXISTS idx_bets_user ON bets(user_id);
+CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance);
+"""
+
+class SQLiteStorage:
+    """One row per user, game and bet; each changeset is a single transaction"""
+
+    def __init__(self, path='betting_data.db', import_json=True):
+        self.path = path
+        self.import_json = import_json
+        # Writes happen on BettingSystem's single writer thread, reads on the event loop
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        # Separate connection for get_user(), which runs on the event loop while the
+        # writer thread may be busy with this one (WAL lets both read at once)
+        self.reader = sqlite3.connect(path, check_same_thread=False)
+        # Until an existing JSON store has been imported, a missing row proves nothing
+        legacy = os.path.exists('betting_data.json') or os.path.exists('betting_data.journal')
+        empty = self.conn.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+        self.point_reads = not (import_json and legacy and empty)
+
+    def get_user(self, user_id):
+        """One stored user record, or None"""
+        row = self.reader.execute('SELECT data FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load(self):
+        state = {'users': {}, 'games': {}, 'bets': {}, 'config': dict(DEFAULT_CONFIG)}
+        cur = self.conn.cursor()
+        for user_id, data in cur.execute('SELECT user_id, data FROM users'):
+            state['users'][user_id] = json.loads(data)
+        for game_id, data in cur.execute('SELECT game_id, data FROM games'):
+            state['games'][game_id] = json.loads(data)
+            state['bets'][game_id] = []
+        for game_id, data in cur.execute('SELECT game_id, data FROM bets ORDER BY id'):
+            state['bets'].setdefault(game_id, []).append(json.loads(data))
+        for key, value in cur.execute('SELECT key, value FROM config'):
+            state['config'][key] = json.loads(value)
+
+        # First run on SQLite: carry over an existing JSON store
+        legacy = os.path.exists('betting_data.json') or os.path.exists('betting_data.journal')
+        if self.import_json and not state['users'] and not state['games'] and legacy:
+            state = JSONStorage().load()
+            self.checkpoint(state)
+            print("Imported betting_data.json into SQLite")
+        return state
+
+    def needs_checkpoint(self, changes):
+        return False
+
+    def commit(self, changes):
+        written = 0
+        with self.conn:
+            if changes['config'] is not None:
+                rows = [(k, json.dumps(v)) for k, v in changes['config'].items()]
+                written += sum(len(value) for _, value in rows)
+                self.conn.executemany('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)', rows)
+            rows = [(uid, u['balance'], json.dumps(u)) for uid, u in changes['users'].items()]
+            written += sum(len(data) for _, _, data in rows)
+            self.conn.executemany('INSERT OR REPLACE INTO users (user_id, balance, data) VALUES (?, ?, ?)', rows)
+            for game_id, game in changes['games'].items():
+                if game is None:
+                    self.conn.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
+                    self.conn.execute('DELETE FROM bets WHERE game_id = ?', (game_id,))
+                else:
+                    data = json.dumps(game)
+                    written += len(data)
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO games (game_id, start_time, result, data) VALUES (?, ?, ?, ?)',
+                        (game_id, game.get('start_time'), game.get('result'), data)
+                    )
+            rows = [(gid, bet['user_id'], json.dumps(bet)) for gid, bet in changes['bets']]
+            written += sum(len(data) for _, _, data in rows)
+            # One bet per user per game, so a changeset retried after a failed save can't add it twice
+            self.conn.executemany(
+                'INSERT INTO bets (game_id, user_id, data) SELECT ?1, ?2, ?3 '
+                'WHERE NOT EXISTS (SELECT 1 FROM bets WHERE game_id = ?1 AND user_id = ?2)', rows
+            )
+        return written
+
+    def checkpoint(self, state):
+        """Replace the whole database with the given state"""
+        with self.conn:
+            for table in ('users', 'games', 'bets', 'config'):
+                self.conn.execute(f'DELETE FROM {table}')
+        return self.commit({
+            'config': state['config'],
+            'users': state['users'],
+            'games': state['games'],
+            'bets': [(gid, bet) for gid, bets in state['bets'].items() for bet in bets]
+        })
+
+    def close(self):
+        self.reader.close()
+        self.conn.close()
+
+def _empty_changes():
+    return {'config': None, 'users': {}, 'games': {}, 'bets': []}
+
+class PartitionedStorage:
+    """Users (and games from before guild scoping) in one global store, every guild's
+    config, games and bets in a store of its own.
+
+    A changeset is split by guild and each part goes to its own store, so one busy
+    guild's journal and checkpoints never rewrite another guild's data.
+    """
+
+    def __init__(self, open_store, extensions, guild_dir=GUILD_DIR):
+        self.open_store = open_store  # guild_id, or None for the global store -> store
+        self.extensions = extensions  # file extensions that mark a guild's store
+        self.guild_dir = guild_dir
+        self.stores = {None: open_store(None)}
+        self._game_guilds = {}  # game_id -> guild_id it is stored under
+
+    def _store(self, guild_id):
+        store = self.stores.get(guild_id)
+        if store is None:
+            os.makedirs(self.guild_dir, exist_ok=True)
+            store = self.stores[guild_id] = self.open_store(guild_id)
+        return store
+
+    def load(self):
+        state = self.load_global()
+        guilds = self.load_guilds()
+        state['guild_configs'] = guilds['guild_configs']
+        state['games'].update(guilds['games'])
+        state['bets'].update(guilds['bets'])
+        return state
+
+    def load_guilds(self):
+        """Every guild's config, games and bets: what the bot needs to start answering"""
+        state = {'guild_configs': {}, 'games': {}, 'bets': {}}
+        try:
+            names = os.listdir(self.guild_dir)
+        except FileNotFoundError:
+            names = []
+        guild_ids = sorted({stem for stem, ext in map(os.path.splitext, names) if ext in self.extensions})
+        for guild_id in guild_ids:
+            part = self._store(guild_id).load()
+            state['guild_configs'][guild_id] = part['config']
+            state['games'].update(part['games'])
+            state['bets'].update(part['bets'])
+            for game_id in part['games']:
+                self._game_guilds[game_id] = guild_id
+        return state
+
+    @property
+    def point_reads(self):
+        return self.stores[None].point_reads
+
+    def get_user(self, user_id):
+        return self.stores[None].get_user(user_id)
+
+    def load_global(self):
+        """Users, the pre-guild config, and games from before guild scoping; the bulk of the data"""
+        state = self.stores[None].load()
+        for game_id in state['games']:
+            self._game_guilds.setdefault(game_id, None)
+        return state
+
+    def _split(self, changes):
+        parts = {}
+
+        def part(guild_id):
+            return parts.setdefault(guild_id, _empty_changes())
+
+        if changes['config'] is not None:
+            part(None)['config'] = changes['config']
+        if changes['users']:
+            part(None)['users'] = changes['users']
+        for guild_id, config in changes.get('guild_configs', {}).items():
+            part(guild_id)['config'] = config
+        for game_id, game in changes['games'].items():
+            guild_id = game.get('guild_id') if game is not None else self._game_guilds.get(game_id)
+            part(guild_id)['games'][game_id] = game
+        for game_id, bet in changes['bets']:
+            guild_id = self._game_guilds.get(game_id)
+            if game_id in changes['games'] and changes['games'][game_id] is not None:
+                guild_id = changes['games'][game_id].get('guild_id')
+            part(guild_id)['bets'].append((game_id, bet))
+        return parts
+
+    def needs_checkpoint(self, changes):
+        return any(self._store(guild_id).needs_checkpoint(part) for guild_id, part in self._split(changes).items())
+
+    def commit(self, changes):
+        written = 0
+        for guild_id, part in self._split(changes).items():
+            written += self._store(guild_id).commit(part)
+            for game_id, game in part['games'].items():
+                if game is None:
+                    self._game_guilds.pop(game_id, None)
+                else:
+                    self._game_guilds[game_id] = guild_id
+        return written
+
+    def checkpoint(self, state):
+        """Snapshot only the stores whose journals have grown past their limit"""
+        due = [guild_id for guild_id, store in list(self.stores.items()) if store.needs_checkpoint(_empty_changes())]
+        written = 0
+        for guild_id in due:
+            if guild_id is None:
+                config = state['config']
+            else:
+                config = state.get('guild_configs', {}).get(guild_id, dict(DEFAULT_CONFIG))
+            games = {gid: g for gid, g in state['games'].items() if self._game_guilds.get(gid) == guild_id}
+            users = state['users'] if guild_id is None else {}
+            written += self._store(guild_id).checkpoint({
+                'config': config,
+                'users': users,
+                'games': games,
+                'bets': {gid: state['bets'].get(gid, []) for gid in games}
+            })
+        return written
+
+    def close(self):
+        for store in self.stores.values():
+            store.close()
+
+def open_storage(backend):
+    if backend == 'sqlite':
+        return PartitionedStorage(
+            lambda guild_id: SQLiteStorage() if guild_id is None
+            else SQLiteStorage(os.path.join(GUILD_DIR, f'{guild_id}.db'), import_json=False),
+            extensions=('.db',)
+        )
+    return PartitionedStorage(
+        lambda guild_id: JSONStorage() if guild_id is None
+        else JSONStorage(os.path.join(GUILD_DIR, f'{guild_id}.json'), os.path.join(GUILD_DIR, f'{guild_id}.journal')),
+        extensions=('.json', '.journal')
+    )